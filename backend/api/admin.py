@@ -7,6 +7,7 @@ from .models import AiAnalysisLog
 class AiAnalysisLogAdmin(admin.ModelAdmin):
     list_display = [
         'id', 'image_path', 'success', 'message', 'classification', 'confidence',
-        'request_timestamp', 'response_timestamp', 'created_at'
+        'request_timestamp', 'response_timestamp', 'cache_hit', 'created_at'
     ]
+    list_select_related = ['classification']
     ordering = ['-created_at']
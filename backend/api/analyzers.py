@@ -0,0 +1,624 @@
+"""
+画像解析バックエンド
+
+IMAGE_ANALYZER_BACKEND 設定で解析方法を切り替える。
+- vision: Google Cloud Vision API（本番環境）
+- local: Googleに接続しないローカルの代替実装（開発・負荷試験用）
+
+get_analyzer_backend が返すバックエンドは ResilientAnalyzer で包まれ、呼び出しごとの期限・再試行・
+同時実行数の上限・サーキットブレーカー・ヘッジリクエストが適用される。
+"""
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from google.api_core import exceptions as google_exceptions
+
+from .metrics import (record_analyzer_call, record_analyzer_hedge,
+                      record_analyzer_rejection, record_analyzer_retry)
+from .resilience import (AnalyzerUnavailableError, CircuitBreaker,
+                         CircuitOpenError, ConcurrencyLimiter,
+                         ConcurrencyLimitError, RetryPolicy, is_retryable)
+from .services import (aanalyze_image_content, aanalyze_image_from_storage,
+                       analyze_image_content, analyze_image_from_storage,
+                       analyze_images_from_storage)
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyzerBackend:
+    """
+    画像解析バックエンドの基底クラス
+
+    timeout は呼び出しの期限(秒)。通信・サーバー側の障害は例外として送出してよい
+    （ResilientAnalyzer が再試行し、最終的に失敗した場合は失敗の解析結果に変換する）。
+    """
+
+    name = None
+
+    # analyze_batch の1回の呼び出しにまとめる画像数の上限（None: バッチAPIがなく1件ずつ解析する）
+    batch_size = None
+
+    def analyze(self, storage_path: str, timeout: float = None) -> Dict:
+        """
+        保存済みの画像を解析する
+
+        Returns:
+            {
+                'success': bool,
+                'message': str,
+                'estimated_data': {
+                    'class': int,
+                    'confidence': float
+                }
+            }
+        """
+        raise NotImplementedError
+
+    def analyze_batch(self, storage_paths: List[str], timeout: float = None) -> List[Dict]:
+        """複数の画像を解析する（storage_paths と同じ順序で結果を返す）"""
+        return [self.analyze(storage_path, timeout) for storage_path in storage_paths]
+
+    def analyze_content(self, content: bytes, timeout: float = None) -> Dict:
+        """
+        画像データを直接解析する（ストレージへのアップロードと並行して解析する場合に使う）
+
+        Returns:
+            analyze と同じ形式の結果
+        """
+        raise NotImplementedError
+
+    async def aanalyze(self, storage_path: str, timeout: float = None) -> Dict:
+        """analyze の非同期版（未対応のバックエンドはスレッドで同期版を実行）"""
+        return await sync_to_async(self.analyze, thread_sensitive=False)(storage_path, timeout)
+
+    async def aanalyze_content(self, content: bytes, timeout: float = None) -> Dict:
+        """analyze_content の非同期版（未対応のバックエンドはスレッドで同期版を実行）"""
+        return await sync_to_async(self.analyze_content, thread_sensitive=False)(content, timeout)
+
+
+class VisionAnalyzer(AnalyzerBackend):
+    """Google Cloud Vision API のオブジェクト検出で解析するバックエンド"""
+
+    name = 'vision'
+
+    @property
+    def batch_size(self) -> int:
+        return settings.VISION_BATCH_MAX_IMAGES
+
+    def analyze(self, storage_path: str, timeout: float = None) -> Dict:
+        return analyze_image_from_storage(storage_path, timeout)
+
+    def analyze_batch(self, storage_paths: List[str], timeout: float = None) -> List[Dict]:
+        return analyze_images_from_storage(storage_paths, timeout)
+
+    def analyze_content(self, content: bytes, timeout: float = None) -> Dict:
+        return analyze_image_content(content, timeout)
+
+    async def aanalyze(self, storage_path: str, timeout: float = None) -> Dict:
+        return await aanalyze_image_from_storage(storage_path, timeout)
+
+    async def aanalyze_content(self, content: bytes, timeout: float = None) -> Dict:
+        return await aanalyze_image_content(content, timeout)
+
+
+class LocalStandInAnalyzer(AnalyzerBackend):
+    """
+    Vision APIの代わりに使うローカルの解析バックエンド
+
+    レイテンシ分布・エラー率・クラス数を設定でき、シードを指定すると
+    同じ順序の呼び出しに対して同じ結果を返す。
+
+    レイテンシ分布:
+    - fixed: 常に latency_ms
+    - uniform: latency_ms ± spread_ms の一様分布
+    - normal: 平均 latency_ms、標準偏差 spread_ms の正規分布
+    - longtail: 中央値 latency_ms、対数標準偏差 sigma の対数正規分布
+
+    障害注入（fault_rate の割合の呼び出しで発生させる）:
+    - unavailable: レイテンシの後に ServiceUnavailable(503) を送出する
+    - deadline: 応答が返らず、timeout まで待って DeadlineExceeded を送出する（timeout 未指定時は HANG_SECONDS）
+    レイテンシが timeout を超えた場合も timeout まで待って DeadlineExceeded を送出する（Vision APIの期限と同じ動作）。
+    """
+
+    name = 'local'
+
+    LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'longtail')
+    FAULTS = ('unavailable', 'deadline')
+
+    # deadline 障害で timeout が指定されていない場合の待機時間(秒)
+    HANG_SECONDS = 60
+
+    def __init__(self, latency: str = None, latency_ms: float = None, spread_ms: float = None,
+                 sigma: float = None, error_rate: float = None, classes: int = None, seed: int = None,
+                 fault: str = None, fault_rate: float = None, sleep=time.sleep, async_sleep=asyncio.sleep):
+        self.latency = latency or settings.ANALYZER_STANDIN_LATENCY
+        if self.latency not in self.LATENCY_DISTRIBUTIONS:
+            raise ValueError(f'Unknown latency distribution: {self.latency}')
+
+        self.latency_ms = settings.ANALYZER_STANDIN_LATENCY_MS if latency_ms is None else latency_ms
+        self.spread_ms = settings.ANALYZER_STANDIN_LATENCY_SPREAD_MS if spread_ms is None else spread_ms
+        self.sigma = settings.ANALYZER_STANDIN_LATENCY_SIGMA if sigma is None else sigma
+        self.error_rate = settings.ANALYZER_STANDIN_ERROR_RATE if error_rate is None else error_rate
+        self.classes = classes or settings.ANALYZER_STANDIN_CLASSES
+        self.seed = settings.ANALYZER_STANDIN_SEED if seed is None else seed
+        self.fault = fault or settings.ANALYZER_STANDIN_FAULT
+        if self.fault not in self.FAULTS:
+            raise ValueError(f'Unknown fault: {self.fault}')
+        self.fault_rate = settings.ANALYZER_STANDIN_FAULT_RATE if fault_rate is None else fault_rate
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self._random = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def sample_latency(self) -> float:
+        """1回分のレイテンシ(秒)を分布から取得する"""
+        with self._lock:
+            if self.latency == 'fixed':
+                latency_ms = self.latency_ms
+            elif self.latency == 'uniform':
+                latency_ms = self._random.uniform(
+                    self.latency_ms - self.spread_ms, self.latency_ms + self.spread_ms)
+            elif self.latency == 'normal':
+                latency_ms = self._random.gauss(self.latency_ms, self.spread_ms)
+            else:
+                latency_ms = self._random.lognormvariate(
+                    math.log(max(self.latency_ms, 1)), self.sigma)
+        return max(latency_ms, 0) / 1000
+
+    def sample_result(self) -> Dict:
+        """1回分の解析結果を取得する"""
+        with self._lock:
+            if self._random.random() < self.error_rate:
+                return {
+                    'success': False,
+                    'message': 'Error:E50012',
+                    'estimated_data': {}
+                }
+
+            return {
+                'success': True,
+                'message': 'success',
+                'estimated_data': {
+                    'class': self._random.randint(1, self.classes),
+                    'confidence': round(self._random.uniform(0.7, 0.95), 4)
+                }
+            }
+
+    def sample_fault(self) -> Optional[str]:
+        """1回分の注入する障害を取得する（障害なしの場合はNone）"""
+        if not self.fault_rate:
+            # 障害注入なしの場合は乱数を消費しない（シード指定時の結果を変えない）
+            return None
+        with self._lock:
+            return self.fault if self._random.random() < self.fault_rate else None
+
+    def plan_call(self, timeout: float = None):
+        """
+        1回分の呼び出しの待機時間と送出する例外を決める
+
+        Returns:
+            (待機時間(秒), 送出する例外 または None)
+        """
+        fault = self.sample_fault()
+        latency = self.HANG_SECONDS if fault == 'deadline' else self.sample_latency()
+
+        if timeout is not None and latency > timeout:
+            return timeout, google_exceptions.DeadlineExceeded(
+                f'Stand-in analyzer exceeded the {timeout:.3f}s deadline')
+        if fault == 'deadline':
+            return latency, google_exceptions.DeadlineExceeded('Stand-in analyzer did not respond')
+        if fault == 'unavailable':
+            return latency, google_exceptions.ServiceUnavailable('Stand-in analyzer fault injection')
+        return latency, None
+
+    def analyze(self, storage_path: str, timeout: float = None) -> Dict:
+        latency, error = self.plan_call(timeout)
+        self.sleep(latency)
+        if error is not None:
+            raise error
+        return self.sample_result()
+
+    def analyze_content(self, content: bytes, timeout: float = None) -> Dict:
+        return self.analyze(None, timeout)
+
+    async def aanalyze(self, storage_path: str, timeout: float = None) -> Dict:
+        latency, error = self.plan_call(timeout)
+        # 待機中も他のリクエストを処理できるようにイベントループへ制御を返す
+        await self.async_sleep(latency)
+        if error is not None:
+            raise error
+        return self.sample_result()
+
+    async def aanalyze_content(self, content: bytes, timeout: float = None) -> Dict:
+        return await self.aanalyze(None, timeout)
+
+
+class ResilientAnalyzer(AnalyzerBackend):
+    """
+    解析バックエンドの呼び出しに障害対策を適用するラッパー
+
+    - 1回の呼び出しの期限は call_timeout 秒、再試行の待機を含む全体の期限は total_timeout 秒
+    - 再試行可能なエラー（resilience.RETRYABLE_ERRORS）は retry_policy に従って再試行する
+    - limiter で同時実行数を制限し、concurrency_wait 秒待っても空きがなければ失敗させる
+    - breaker が遮断中は呼び出さずに失敗させる
+    - hedge_delay 秒経っても応答がなく同時実行数に空きがあれば、同じ呼び出しをもう1件送り、先に成功した結果を使う
+      （非同期版は遅れた側を中断する。同期版は中断できないため、遅れた側も期限まで実行を続ける）
+
+    最終的に失敗した場合は例外を送出せず、失敗の解析結果を返す。
+    引数を省略した項目は ANALYZER_* 設定の値を使う。
+    """
+
+    # 同時実行数の上限なしの場合のヘッジ用スレッド数
+    HEDGE_MAX_WORKERS = 32
+
+    def __init__(self, inner: AnalyzerBackend, retry_policy: RetryPolicy = None, breaker: CircuitBreaker = None,
+                 limiter: ConcurrencyLimiter = None, call_timeout: float = None, total_timeout: float = None,
+                 concurrency_wait: float = None, hedge_delay: float = None,
+                 sleep=time.sleep, async_sleep=asyncio.sleep, clock=time.monotonic):
+        self.inner = inner
+        self.retry_policy = retry_policy or RetryPolicy(
+            settings.ANALYZER_MAX_ATTEMPTS,
+            settings.ANALYZER_RETRY_BASE_DELAY_MS / 1000,
+            settings.ANALYZER_RETRY_MAX_DELAY_MS / 1000)
+        self.breaker = breaker or CircuitBreaker(
+            inner.name,
+            failure_rate=settings.ANALYZER_CIRCUIT_FAILURE_RATE,
+            window=settings.ANALYZER_CIRCUIT_WINDOW,
+            min_calls=settings.ANALYZER_CIRCUIT_MIN_CALLS,
+            open_seconds=settings.ANALYZER_CIRCUIT_OPEN_SECONDS,
+            enabled=settings.ANALYZER_CIRCUIT_BREAKER,
+            clock=clock)
+        self.limiter = limiter or ConcurrencyLimiter(inner.name, settings.ANALYZER_MAX_CONCURRENCY)
+        self.call_timeout = settings.ANALYZER_CALL_TIMEOUT_SECONDS if call_timeout is None else call_timeout
+        self.total_timeout = settings.ANALYZER_TOTAL_TIMEOUT_SECONDS if total_timeout is None else total_timeout
+        self.concurrency_wait = (
+            settings.ANALYZER_CONCURRENCY_WAIT_SECONDS if concurrency_wait is None else concurrency_wait)
+        self.hedge_delay = settings.ANALYZER_HEDGE_DELAY_MS / 1000 if hedge_delay is None else hedge_delay
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self.clock = clock
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.inner.name
+
+    @property
+    def batch_size(self) -> Optional[int]:
+        return self.inner.batch_size
+
+    def analyze(self, storage_path: str, timeout: float = None) -> Dict:
+        """timeout を指定した場合は再試行を含む全体の期限として使う（analyze_content なども同じ）"""
+        return self._run(lambda call_timeout: self.inner.analyze(storage_path, call_timeout), timeout)
+
+    def analyze_content(self, content: bytes, timeout: float = None) -> Dict:
+        return self._run(lambda call_timeout: self.inner.analyze_content(content, call_timeout), timeout)
+
+    def analyze_batch(self, storage_paths: List[str], timeout: float = None) -> List[Dict]:
+        """バッチAPIのあるバックエンドは batch_size ごとに分けて呼び出し、分割単位で再試行する"""
+        if self.inner.batch_size is None:
+            return super().analyze_batch(storage_paths, timeout)
+
+        results = []
+        for start in range(0, len(storage_paths), self.inner.batch_size):
+            chunk = storage_paths[start:start + self.inner.batch_size]
+            try:
+                results.extend(self._call(
+                    lambda call_timeout: self.inner.analyze_batch(chunk, call_timeout), timeout))
+            except Exception as e:
+                # 分割単位の失敗は該当画像のみ失敗扱いにする
+                results.extend(self._failure_result(e) for _ in chunk)
+        return results
+
+    async def aanalyze(self, storage_path: str, timeout: float = None) -> Dict:
+        return await self._arun(lambda call_timeout: self.inner.aanalyze(storage_path, call_timeout), timeout)
+
+    async def aanalyze_content(self, content: bytes, timeout: float = None) -> Dict:
+        return await self._arun(lambda call_timeout: self.inner.aanalyze_content(content, call_timeout), timeout)
+
+    def _run(self, invoke: Callable, timeout: float = None) -> Dict:
+        try:
+            return self._call(invoke, timeout)
+        except Exception as e:
+            return self._failure_result(e)
+
+    async def _arun(self, invoke: Callable, timeout: float = None) -> Dict:
+        try:
+            return await self._acall(invoke, timeout)
+        except Exception as e:
+            return self._failure_result(e)
+
+    def _call(self, invoke: Callable, timeout: float = None):
+        """invoke(1回の呼び出しの期限) を再試行しながら実行する（最終的に失敗した場合は最後の例外を送出）"""
+        deadline = self.clock() + (self.total_timeout if timeout is None else timeout)
+        attempt = 1
+        while True:
+            try:
+                return self._attempt(invoke, deadline)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+            self.sleep(delay)
+            attempt += 1
+
+    async def _acall(self, invoke: Callable, timeout: float = None):
+        """_call の非同期版（invoke はコルーチンを返す）"""
+        deadline = self.clock() + (self.total_timeout if timeout is None else timeout)
+        attempt = 1
+        while True:
+            try:
+                return await self._aattempt(invoke, deadline)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+            await self.async_sleep(delay)
+            attempt += 1
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """再試行までの待機時間（再試行しない場合はNone）"""
+        if not is_retryable(error) or attempt >= self.retry_policy.max_attempts:
+            return None
+        delay = self.retry_policy.backoff(attempt)
+        # 待機後に全体の期限を過ぎる場合は再試行しない
+        if self.clock() + delay >= deadline:
+            return None
+
+        record_analyzer_retry(self.name)
+        logger.info('Retrying analyzer call', extra={
+            'analyzer': self.name, 'attempt': attempt, 'delay_ms': round(delay * 1000), 'error': str(error)})
+        return delay
+
+    def _attempt(self, invoke: Callable, deadline: float):
+        """1回分の呼び出し（サーキットブレーカー・同時実行数の確認を含む）"""
+        wait_seconds = min(self.concurrency_wait, self._remaining(deadline))
+        self._admit()
+        if not self.limiter.acquire(wait_seconds):
+            self._reject_concurrency()
+
+        timeout = min(self.call_timeout, max(deadline - self.clock(), 0))
+        if self.hedge_delay:
+            return self._hedged(invoke, timeout)
+        return self._guarded(invoke, timeout)
+
+    async def _aattempt(self, invoke: Callable, deadline: float):
+        """_attempt の非同期版"""
+        wait_seconds = min(self.concurrency_wait, self._remaining(deadline))
+        self._admit()
+        try:
+            acquired = await self.limiter.aacquire(wait_seconds, self.async_sleep, self.clock)
+        except BaseException:
+            self.breaker.cancel_call()
+            raise
+        if not acquired:
+            self._reject_concurrency()
+
+        timeout = min(self.call_timeout, max(deadline - self.clock(), 0))
+        if self.hedge_delay:
+            return await self._ahedged(invoke, timeout)
+        return await self._aguarded(invoke, timeout)
+
+    def _guarded(self, invoke: Callable, timeout: float):
+        """同時実行数の枠を取得済みの呼び出しを実行し、結果をサーキットブレーカーに記録する（終了時に枠を返す）"""
+        try:
+            result = invoke(timeout)
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        except BaseException:
+            self.breaker.cancel_call()
+            raise
+        else:
+            self._record_success()
+            return result
+        finally:
+            self.limiter.release()
+
+    async def _aguarded(self, invoke: Callable, timeout: float):
+        """_guarded の非同期版（期限を過ぎた呼び出しは中断する）"""
+        try:
+            try:
+                result = await asyncio.wait_for(invoke(timeout), timeout)
+            except asyncio.TimeoutError:
+                raise google_exceptions.DeadlineExceeded(
+                    f'{self.name} analyzer call exceeded the {timeout:.3f}s deadline')
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        except BaseException:
+            self.breaker.cancel_call()
+            raise
+        else:
+            self._record_success()
+            return result
+        finally:
+            self.limiter.release()
+
+    def _hedged(self, invoke: Callable, timeout: float):
+        """hedge_delay 秒以内に応答がなければヘッジリクエストを送り、先に成功した結果を返す"""
+        started = self.clock()
+        executor = self._hedge_executor()
+        primary = executor.submit(self._guarded_in_thread, invoke, timeout)
+        done, _ = wait([primary], timeout=self.hedge_delay)
+        if done or not self._admit_hedge():
+            return primary.result()
+
+        record_analyzer_hedge(self.name, 'sent')
+        hedge = executor.submit(self._guarded_in_thread, invoke, max(timeout - (self.clock() - started), 0))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        record_analyzer_hedge(self.name, 'won')
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _guarded_in_thread(self, invoke: Callable, timeout: float):
+        """
+        ヘッジ用のスレッドプールで _guarded を実行する
+
+        解析結果の変換（ラベル登録）でDBにアクセスするため、リクエストの前後と同様に
+        期限切れ・使用不能になった接続を閉じる（プールのスレッドは使い回されるため、閉じないと接続が残り続ける）。
+        """
+        close_old_connections()
+        try:
+            return self._guarded(invoke, timeout)
+        finally:
+            close_old_connections()
+
+    async def _ahedged(self, invoke: Callable, timeout: float):
+        """_hedged の非同期版（遅れた側の呼び出しは中断する）"""
+        started = self.clock()
+        primary = asyncio.ensure_future(self._aguarded(invoke, timeout))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            if done or not self._admit_hedge():
+                return await primary
+
+            record_analyzer_hedge(self.name, 'sent')
+            hedge = asyncio.ensure_future(
+                self._aguarded(invoke, max(timeout - (self.clock() - started), 0)))
+            tasks.append(hedge)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            record_analyzer_hedge(self.name, 'won')
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _remaining(self, deadline: float) -> float:
+        remaining = deadline - self.clock()
+        if remaining <= 0:
+            raise google_exceptions.DeadlineExceeded(f'{self.name} analysis deadline exceeded')
+        return remaining
+
+    def _admit(self) -> None:
+        """呼び出し前にサーキットブレーカーを確認する"""
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            record_analyzer_rejection(self.name, 'circuit_open')
+            raise
+
+    def _admit_hedge(self) -> bool:
+        """ヘッジリクエストを送れる場合は同時実行数の枠を取得してTrueを返す"""
+        if not self.limiter.try_acquire():
+            return False
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.limiter.release()
+            return False
+        return True
+
+    def _reject_concurrency(self) -> None:
+        self.breaker.cancel_call()
+        record_analyzer_rejection(self.name, 'concurrency_limit')
+        raise ConcurrencyLimitError(f'{self.name} analyzer has {self.limiter.limit} calls in flight')
+
+    def _record_success(self) -> None:
+        self.breaker.record_success()
+        record_analyzer_call(self.name, 'success')
+
+    def _record_failure(self, error: Exception) -> None:
+        # 不正な画像などのクライアント側のエラーはAPIが応答しているため、遮断の判定では成功として扱う
+        if is_retryable(error):
+            self.breaker.record_failure()
+            record_analyzer_call(self.name, 'retryable_error')
+        else:
+            self.breaker.record_success()
+            record_analyzer_call(self.name, 'error')
+
+    def _failure_result(self, error: Exception) -> Dict:
+        if isinstance(error, AnalyzerUnavailableError):
+            message = f'Analysis unavailable: {error}'
+        else:
+            message = f'Analysis failed: {error}'
+            logger.warning('Analyzer call failed', extra={
+                'analyzer': self.name, 'error_type': type(error).__name__, 'error': str(error)})
+        return {
+            'success': False,
+            'message': message,
+            'estimated_data': {}
+        }
+
+    def _hedge_executor(self) -> ThreadPoolExecutor:
+        """同期版のヘッジリクエスト用のスレッドプール（初回のヘッジ時に生成）"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.limiter.limit or self.HEDGE_MAX_WORKERS,
+                        thread_name_prefix=f'{self.name}-analyzer')
+        return self._executor
+
+
+ANALYZER_BACKENDS = {
+    VisionAnalyzer.name: VisionAnalyzer,
+    LocalStandInAnalyzer.name: LocalStandInAnalyzer,
+}
+
+_analyzer_backends = {}
+_analyzer_backends_lock = threading.Lock()
+
+
+def get_analyzer_backend(name: str = None) -> AnalyzerBackend:
+    """
+    解析バックエンドを取得する（プロセス内で使い回す）
+
+    障害対策（ResilientAnalyzer）を適用したものを返す。同時実行数の上限とサーキットブレーカーは
+    バックエンドごとにプロセス全体で共有される。
+
+    Args:
+        name: バックエンド名（省略時は IMAGE_ANALYZER_BACKEND 設定）
+    """
+    name = name or settings.IMAGE_ANALYZER_BACKEND
+
+    analyzer = _analyzer_backends.get(name)
+    if analyzer is None:
+        with _analyzer_backends_lock:
+            analyzer = _analyzer_backends.get(name)
+            if analyzer is None:
+                try:
+                    backend_class = ANALYZER_BACKENDS[name]
+                except KeyError:
+                    raise ValueError(f'Unknown analyzer backend: {name}')
+                analyzer = ResilientAnalyzer(backend_class())
+                _analyzer_backends[name] = analyzer
+
+    return analyzer
+
+
+def set_analyzer_backend(name: str, analyzer: AnalyzerBackend) -> None:
+    """
+    テスト・ベンチマーク用に解析バックエンドを差し替える
+
+    障害対策を適用する場合は ResilientAnalyzer で包んで渡す。
+    """
+    with _analyzer_backends_lock:
+        _analyzer_backends[name] = analyzer
@@ -0,0 +1,276 @@
+"""
+ASGI用の非同期ビュー
+
+ASYNC_VIEWS が有効な場合、views.py の同名ビューの代わりにURLへ割り当てる。
+アップロード・解析・DBアクセスを await するため、1プロセスで多数の解析を同時に処理できる。
+
+DRFの @api_view は非同期ビューに対応していないため、Djangoの非同期ビューとして実装し、
+レスポンスはDRFと同じJSONRendererで生成する（同期版とレスポンス形式を揃える）。
+"""
+import json
+import logging
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from .analyzers import get_analyzer_backend
+from .exports import (EXPORT_CONTENT_TYPES, aiter_export, export_filename,
+                      export_queryset)
+from .logs_cache import acache_logs_response
+from .pagination import apaginate_by_cursor, estimate_count
+from .pipeline import (aanalyze_image_file, aanalyze_streamed_image,
+                       aanalyze_uploaded_image)
+from .serializers import AiAnalysisLogListSerializer
+from .thumbnails import load_thumbnail_urls
+from .timing import server_timing, stage
+from .upload_handlers import StreamedImageUpload, StreamingStorageUploadHandler
+from .views import (build_analysis_response, build_cursor_pagination,
+                    filter_analysis_logs, order_analysis_logs,
+                    parse_near_duplicate_options, validate_cursor_sort,
+                    validate_total_count_mode)
+
+logger = logging.getLogger(__name__)
+
+
+def json_response(data, status=status.HTTP_200_OK) -> HttpResponse:
+    """DRFのResponseと同じ形式のJSONレスポンスを生成する"""
+    return HttpResponse(
+        JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+@csrf_exempt
+@require_POST
+@server_timing
+async def analyze_image(request):
+    """
+    本番環境用: 画像ファイルをアップロードしてVision APIで解析（非同期版）
+    """
+    request_timestamp = timezone.now()
+
+    # ストリーミングモードでは画像をメモリに溜めずストレージへ直接アップロードする
+    streaming_handler = None
+    if settings.STREAMING_UPLOADS:
+        streaming_handler = StreamingStorageUploadHandler(request)
+        request.upload_handlers = [
+            streaming_handler,
+            *request.upload_handlers
+        ]
+
+    # multipartの解析（ストリーミング時はストレージへの書き込みを含む）はスレッドで実行
+    with stage('receive'):
+        try:
+            files = await sync_to_async(lambda: request.FILES, thread_sensitive=False)()
+        finally:
+            # 切断などで受信が途中で終わった場合は書き込み途中のデータを破棄する
+            if streaming_handler is not None:
+                await sync_to_async(streaming_handler.upload_interrupted, thread_sensitive=False)()
+
+    # 画像ファイルが必須
+    if 'image' not in files:
+        return json_response({
+            'success': False,
+            'message': 'image file is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        near_duplicate = parse_near_duplicate_options(request.POST)
+    except ValueError as e:
+        return json_response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    image_file = files['image']
+    logger.debug('Received image file', extra={'image_name': image_file.name, 'bytes': image_file.size})
+
+    try:
+        if isinstance(image_file, StreamedImageUpload):
+            outcome = await aanalyze_streamed_image(image_file, request_timestamp)
+        else:
+            outcome = await aanalyze_image_file(image_file, request_timestamp, near_duplicate=near_duplicate)
+
+        if outcome['analysis_log'] is None:
+            return json_response({
+                'success': False,
+                'message': outcome['message']
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # 分類名の取得でDBにアクセスする場合があるため同期処理として実行
+        return json_response(await sync_to_async(build_analysis_response)(outcome['analysis_log']))
+
+    except Exception as e:
+        logger.exception('Analysis error')
+        return json_response({
+            'success': False,
+            'message': f'Analysis failed: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_POST
+@server_timing
+async def analyze_image_mock(request):
+    """
+    ローカル開発用: image_pathでモック解析（非同期版）
+
+    代替解析バックエンドの待機は asyncio.sleep で行うため、待機中も他のリクエストを処理できる
+    """
+    request_timestamp = timezone.now()
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError as e:
+        return json_response({
+            'success': False,
+            'message': f'JSON parse error - {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    image_path = data.get('image_path') if isinstance(data, dict) else None
+
+    if not image_path:
+        return json_response({
+            'success': False,
+            'message': 'image_path is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        outcome = await aanalyze_uploaded_image(
+            {'storage_path': image_path, 'public_url': image_path},
+            None, request_timestamp, analyzer=get_analyzer_backend('local'))
+
+        return json_response(await sync_to_async(build_analysis_response)(outcome['analysis_log']))
+
+    except Exception as e:
+        logger.exception('Analysis error')
+        return json_response({
+            'success': False,
+            'message': f'Analysis failed: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_GET
+@acache_logs_response
+async def get_analysis_logs(request):
+    """
+    AI分析ログの一覧取得API（非同期版）
+
+    クエリパラメータとレスポンスは views.get_analysis_logs と同じ。
+    """
+    try:
+        page = int(request.GET.get('page', 1))
+        page_size = min(int(request.GET.get('page_size', 20)), 50)  # 最大50件
+        cursor = request.GET.get('cursor')
+
+        queryset = filter_analysis_logs(request.GET)
+
+        # カーソルモード（OFFSET・COUNT(*)なしのキーセットページネーション）
+        if cursor is not None:
+            validate_cursor_sort(request.GET)
+            return await aget_analysis_logs_by_cursor(
+                queryset, cursor, page_size, request.GET.get('total_count', 'none'))
+
+        queryset = order_analysis_logs(queryset, request.GET)
+
+        # Paginatorと同じページ数の計算（0件の場合も1ページ）
+        total_count = await queryset.acount()
+        total_pages = math.ceil(max(total_count, 1) / page_size)
+
+        if page > total_pages:
+            return json_response({
+                'success': False,
+                'message': f'Page {page} does not exist. Total pages: {total_pages}'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        # Paginator.get_page と同様、1未満のページ番号は最終ページとして扱う
+        page_number = page if page >= 1 else total_pages
+        offset = (page_number - 1) * page_size
+        logs = [log async for log in queryset[offset:offset + page_size]]
+
+        thumbnail_urls = await sync_to_async(load_thumbnail_urls)(logs)
+        serializer = AiAnalysisLogListSerializer(logs, many=True, context={'thumbnail_urls': thumbnail_urls})
+
+        return json_response({
+            'success': True,
+            'data': {
+                'logs': serializer.data,
+                'pagination': {
+                    'current_page': page,
+                    'total_pages': total_pages,
+                    'total_count': total_count,
+                    'page_size': page_size,
+                    'has_next': page_number < total_pages,
+                    'has_previous': page_number > 1,
+                }
+            }
+        })
+
+    except ValueError as e:
+        return json_response({
+            'success': False,
+            'message': f'Invalid parameter: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        logger.exception('Get logs error')
+        return json_response({
+            'success': False,
+            'message': f'Failed to get logs: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_GET
+async def export_analysis_logs(request):
+    """
+    AI分析ログの一括エクスポートAPI（非同期版）
+
+    クエリパラメータとレスポンスは views.export_analysis_logs と同じ。
+    """
+    try:
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_CONTENT_TYPES:
+            raise ValueError(f'format must be csv or ndjson: {export_format}')
+        queryset = export_queryset(order_analysis_logs(filter_analysis_logs(request.GET), request.GET))
+
+    except ValueError as e:
+        return json_response({
+            'success': False,
+            'message': f'Invalid parameter: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(
+        aiter_export(queryset, export_format), content_type=EXPORT_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{export_filename(export_format, timezone.now())}"')
+    return response
+
+
+async def aget_analysis_logs_by_cursor(queryset, cursor, page_size, total_count_mode):
+    """カーソルモードでのログ一覧レスポンスを生成する（非同期版）"""
+    validate_total_count_mode(total_count_mode)
+
+    logs, next_cursor = await apaginate_by_cursor(queryset, cursor, page_size)
+
+    if total_count_mode == 'exact':
+        total_count = await queryset.acount()
+    elif total_count_mode == 'estimate':
+        total_count = await sync_to_async(estimate_count)(queryset)
+    else:
+        total_count = None
+
+    thumbnail_urls = await sync_to_async(load_thumbnail_urls)(logs)
+    serializer = AiAnalysisLogListSerializer(logs, many=True, context={'thumbnail_urls': thumbnail_urls})
+
+    return json_response({
+        'success': True,
+        'data': {
+            'logs': serializer.data,
+            'pagination': build_cursor_pagination(page_size, next_cursor, total_count, total_count_mode)
+        }
+    })
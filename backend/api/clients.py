@@ -0,0 +1,134 @@
+"""
+Google Cloudクライアントの管理
+
+クライアントの生成（認証情報の読み込み・gRPCチャネル作成・TLSハンドシェイク）は
+リクエストごとに行うとコストが大きいため、ワーカープロセスごとに1度だけ生成して使い回す。
+gRPCチャネルはfork後に再利用できないので、fork先のプロセスでは作り直す。
+非同期クライアント(grpc.aio)はイベントループに紐づくため、イベントループごとに生成する。
+"""
+import asyncio
+import os
+import threading
+import weakref
+
+from google.cloud import storage, vision
+
+
+class CloudClients:
+    """ワーカープロセス単位で共有するGCS・Vision APIクライアント"""
+
+    def __init__(self, storage_factory=storage.Client, vision_factory=vision.ImageAnnotatorClient,
+                 vision_async_factory=vision.ImageAnnotatorAsyncClient):
+        self.storage_factory = storage_factory
+        self.vision_factory = vision_factory
+        self.vision_async_factory = vision_async_factory
+        self._lock = threading.Lock()
+        self._storage = None
+        self._vision = None
+        self._vision_async = weakref.WeakKeyDictionary()
+        self._vision_async_injected = None
+        self._buckets = {}
+        self._injected = False
+
+    def storage_client(self) -> storage.Client:
+        """GCSクライアントを取得する（初回呼び出し時に生成）"""
+        if self._storage is None:
+            with self._lock:
+                if self._storage is None:
+                    self._storage = self.storage_factory()
+        return self._storage
+
+    def vision_client(self) -> vision.ImageAnnotatorClient:
+        """Vision APIクライアントを取得する（初回呼び出し時に生成）"""
+        if self._vision is None:
+            with self._lock:
+                if self._vision is None:
+                    self._vision = self.vision_factory()
+        return self._vision
+
+    def vision_async_client(self) -> vision.ImageAnnotatorAsyncClient:
+        """
+        実行中のイベントループ用の非同期Vision APIクライアントを取得する（初回呼び出し時に生成）
+
+        ASGIサーバー(uvicorn)ではワーカープロセスごとにイベントループが1つのため、
+        プロセス内で1度だけ生成される。
+        """
+        if self._vision_async_injected is not None:
+            return self._vision_async_injected
+
+        loop = asyncio.get_running_loop()
+        client = self._vision_async.get(loop)
+        if client is None:
+            with self._lock:
+                client = self._vision_async.get(loop)
+                if client is None:
+                    client = self.vision_async_factory()
+                    self._vision_async[loop] = client
+        return client
+
+    def bucket(self, bucket_name: str) -> storage.Bucket:
+        """バケットのハンドルを取得する（バケット名ごとに使い回す）"""
+        bucket = self._buckets.get(bucket_name)
+        if bucket is None:
+            bucket = self.storage_client().bucket(bucket_name)
+            self._buckets[bucket_name] = bucket
+        return bucket
+
+    def inject(self, storage_client=None, vision_client=None, vision_async_client=None) -> None:
+        """
+        テスト・ベンチマーク用にクライアントを差し替える
+
+        差し替えたクライアントはfork後も維持される。
+        """
+        with self._lock:
+            if storage_client is not None:
+                self._storage = storage_client
+                self._buckets = {}
+            if vision_client is not None:
+                self._vision = vision_client
+            if vision_async_client is not None:
+                # イベントループに関係なく同じクライアントを返す
+                self._vision_async_injected = vision_async_client
+            self._injected = True
+
+    def reset(self) -> None:
+        """保持しているクライアントを破棄する（次回取得時に再生成）"""
+        with self._lock:
+            self._storage = None
+            self._vision = None
+            self._vision_async = weakref.WeakKeyDictionary()
+            self._vision_async_injected = None
+            self._buckets = {}
+            self._injected = False
+
+    def warm_up(self, bucket_name: str = None) -> bool:
+        """
+        クライアントを事前に生成する（gunicornのワーカー起動時に呼び出す）
+
+        Returns:
+            生成した場合はTrue（認証情報が未設定の場合はFalse）
+        """
+        if not self._injected and not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+            return False
+
+        self.vision_client()
+        bucket_name = bucket_name or os.getenv('GCS_BUCKET_NAME')
+        if bucket_name:
+            self.bucket(bucket_name)
+        else:
+            self.storage_client()
+        return True
+
+    def _after_fork(self) -> None:
+        # fork元のロックやgRPCチャネルを引き継がない（差し替えたクライアントは維持）
+        self._lock = threading.Lock()
+        if not self._injected:
+            self._storage = None
+            self._vision = None
+            self._vision_async = weakref.WeakKeyDictionary()
+            self._buckets = {}
+
+
+cloud_clients = CloudClients()
+
+os.register_at_fork(after_in_child=cloud_clients._after_fork)
@@ -0,0 +1,160 @@
+"""
+解析ログの一括エクスポート（CSV / NDJSON）
+
+行はサーバーサイドカーソルで EXPORT_CHUNK_SIZE 件ずつ読み込んでそのまま書き出し、
+分類名は開始時に読み込んだラベルの対応表から引くため、件数に関係なくメモリ使用量は一定になる。
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterator, Dict, Iterable, Iterator, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ObjectLabel
+
+# サーバーサイドカーソルから1回に読み込む行数（書き出しもこの単位でまとめる）
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+EXPORT_COLUMNS = [
+    'id',
+    'image_path',
+    'success',
+    'message',
+    'classification',
+    'classification_name',
+    'confidence',
+    'processing_time_ms',
+    'cache_hit',
+    'created_at',
+]
+
+# values_list で取得する項目
+_EXPORT_FIELDS = (
+    'id', 'image_path', 'success', 'message', 'classification_id', 'confidence',
+    'processing_time_ms', 'cache_hit', 'created_at')
+
+
+def export_queryset(queryset):
+    """並べ替え済みのログのクエリセットをエクスポート用の項目に変換する"""
+    return queryset.values_list(*_EXPORT_FIELDS)
+
+
+def export_filename(export_format: str, now: datetime) -> str:
+    return f"analysis_logs_{now:%Y%m%d%H%M%S}.{export_format}"
+
+
+def load_label_names() -> Dict[int, str]:
+    """ラベルIDと名前の対応表（行ごとにラベルを問い合わせないよう開始時に読み込む）"""
+    return dict(ObjectLabel.objects.values_list('id', 'name'))
+
+
+def build_record(row: Tuple, label_names: Dict[int, str]) -> Dict:
+    """values_list の1行を EXPORT_COLUMNS の項目に変換する"""
+    (log_id, image_path, success, message, classification_id, confidence,
+     processing_time_ms, cache_hit, created_at) = row
+
+    classification_name = None
+    if classification_id:
+        classification_name = label_names.get(classification_id, f"クラス {classification_id}")
+
+    return {
+        'id': log_id,
+        'image_path': image_path,
+        'success': success,
+        'message': message,
+        'classification': classification_id,
+        'classification_name': classification_name,
+        'confidence': confidence,
+        'processing_time_ms': processing_time_ms,
+        'cache_hit': cache_hit,
+        'created_at': created_at,
+    }
+
+
+class CsvEncoder:
+    """ログをCSVの行に変換する（1行目はヘッダー）"""
+
+    def header(self) -> str:
+        return self.encode_records([dict(zip(EXPORT_COLUMNS, EXPORT_COLUMNS))])
+
+    def encode_records(self, records: Iterable[Dict]) -> str:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in records:
+            writer.writerow([self._format(record[column]) for column in EXPORT_COLUMNS])
+        return buffer.getvalue()
+
+    @staticmethod
+    def _format(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        return value
+
+
+class NdjsonEncoder:
+    """ログを1行1JSONに変換する"""
+
+    def header(self) -> str:
+        return ''
+
+    def encode_records(self, records: Iterable[Dict]) -> str:
+        return ''.join(
+            json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for record in records)
+
+
+EXPORT_ENCODERS = {
+    'csv': CsvEncoder,
+    'ndjson': NdjsonEncoder,
+}
+
+
+def iter_export(queryset, export_format: str) -> Iterator[str]:
+    """
+    エクスポートの本文を EXPORT_CHUNK_SIZE 件ずつ生成する
+
+    Args:
+        queryset: export_queryset() で変換したクエリセット
+        export_format: csv / ndjson
+    """
+    encoder = EXPORT_ENCODERS[export_format]()
+    label_names = load_label_names()
+    rows = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    yield encoder.header()
+    while (body := _read_chunk(rows, encoder, label_names)) is not None:
+        yield body
+
+
+async def aiter_export(queryset, export_format: str) -> AsyncIterator[str]:
+    """
+    iter_export の非同期版（ASGIでは同期イテレーターのストリーミングは全件をメモリに読み込むため）
+
+    values_list の aiterator() は非同期コンテキストでクエリを実行してしまうため、
+    同期のイテレーターを1チャンクずつスレッドで読み進める（変換もスレッドで行う）。
+    """
+    encoder = EXPORT_ENCODERS[export_format]()
+    label_names = await sync_to_async(load_label_names)()
+    rows = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    yield encoder.header()
+    while (body := await sync_to_async(_read_chunk)(rows, encoder, label_names)) is not None:
+        yield body
+
+
+def _read_chunk(rows: Iterator[Tuple], encoder, label_names: Dict[int, str]) -> Optional[str]:
+    """次の EXPORT_CHUNK_SIZE 件を変換して返す（残りがない場合はNone）"""
+    chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+    if not chunk:
+        return None
+    return encoder.encode_records(build_record(row, label_names) for row in chunk)
@@ -0,0 +1,241 @@
+"""
+非同期解析ジョブ
+
+アップロード画像を保存先（IMAGE_STORAGE_BACKEND）に一時保存してジョブをDBに登録し、ワーカーが
+SELECT ... FOR UPDATE SKIP LOCKED で取り出して解析する。Webとワーカーが別のマシンで動いていても
+同じ保存先から読み込めるよう、ローカルディスクには置かない（local の場合は LOCAL_STORAGE_ROOT を共有する）。
+外部のメッセージブローカーは使わない。待機中の解析ジョブがない間はサムネイルを生成する（api/thumbnails.py）。
+"""
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .log_writer import flush_analysis_logs
+from .metrics import record_stage_timings
+from .models import AnalysisJob
+from .pipeline import analyze_image_file
+from .storage import get_storage_backend
+from .thumbnails import process_next_thumbnail, requeue_stale_thumbnails
+from .timing import StageTimer, activate
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_analysis_job(image_file, request_timestamp) -> AnalysisJob:
+    """
+    画像ファイルを保存先に一時保存し、解析ジョブを登録する
+
+    Args:
+        image_file: Djangoのアップロードファイル
+        request_timestamp: リクエスト受付時刻
+
+    Returns:
+        登録したジョブ
+    """
+    storage = get_storage_backend()
+    job = AnalysisJob(original_name=image_file.name, request_timestamp=request_timestamp)
+    filename = f"{settings.ANALYSIS_JOB_SPOOL_PREFIX}{job.id}.upload"
+
+    # 書き込みながらダイジェストを計算し、close() で確定する（書きかけのファイルを読ませない）
+    sha256 = hashlib.sha256()
+    writer = storage.open_writer(filename, 'application/octet-stream')
+    try:
+        for chunk in image_file.chunks():
+            sha256.update(chunk)
+            writer.write(chunk)
+    except BaseException:
+        storage.discard_writer(writer)
+        raise
+    writer.close()
+
+    job.spool_path = storage.storage_path(filename)
+    job.digest = sha256.hexdigest()
+    try:
+        job.save()
+    except BaseException:
+        _remove_spool_file(job)
+        raise
+
+    logger.info('Analysis job queued', extra={'job_id': str(job.id), 'image_name': image_file.name})
+    return job
+
+
+def claim_next_job() -> Optional[AnalysisJob]:
+    """
+    待機中のジョブを1件取り出して処理中にする（他ワーカーがロック中の行はスキップ）
+
+    Returns:
+        取り出したジョブ（待機中のジョブがない場合はNone）
+    """
+    with transaction.atomic():
+        job = (AnalysisJob.objects
+               .select_for_update(skip_locked=True)
+               .filter(status=AnalysisJob.Status.QUEUED)
+               .order_by('created_at')
+               .first())
+        if job is None:
+            return None
+
+        # 行ロック非対応のDB(SQLite)でも二重に取り出さないよう状態を条件に更新
+        claimed = AnalysisJob.objects.filter(
+            id=job.id, status=AnalysisJob.Status.QUEUED
+        ).update(
+            status=AnalysisJob.Status.RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if not claimed:
+            return None
+
+    job.refresh_from_db()
+    return job
+
+
+def process_job(job: AnalysisJob) -> None:
+    """
+    取り出したジョブを解析し、結果をジョブに記録する
+    """
+    timer = StageTimer()
+    try:
+        image_file = ContentFile(get_storage_backend().read(job.spool_path), name=job.original_name)
+        with activate(timer):
+            # 一時保存した画像を保存先の中で複製して使う（アップロードし直さない）
+            outcome = analyze_image_file(
+                image_file, job.request_timestamp, digest=job.digest, stored_path=job.spool_path)
+    except Exception as e:
+        logger.exception('Analysis job error', extra={'job_id': str(job.id), 'attempts': job.attempts})
+
+        # 上限回数までは再投入
+        if job.attempts < settings.ANALYSIS_JOB_MAX_ATTEMPTS:
+            job.status = AnalysisJob.Status.QUEUED
+        else:
+            job.status = AnalysisJob.Status.FAILED
+            job.finished_at = timezone.now()
+            _remove_spool_file(job)
+        job.message = f'Analysis failed: {str(e)}'[:255]
+        job.save(update_fields=['status', 'message', 'finished_at'])
+        return
+    finally:
+        record_stage_timings(timer.as_dict())
+
+    if outcome['analysis_log'] is None:
+        job.status = AnalysisJob.Status.FAILED
+    else:
+        # bufferedモードでは解析ログが未書き込みの場合があるため、参照する前に書き込む
+        flush_analysis_logs()
+        job.status = AnalysisJob.Status.COMPLETED
+        job.analysis_log = outcome['analysis_log']
+    job.message = outcome['message'][:255]
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'analysis_log', 'message', 'finished_at'])
+    _remove_spool_file(job)
+
+    logger.info('Analysis job finished', extra={'job_id': str(job.id), 'status': job.status})
+
+
+def process_next_job() -> bool:
+    """
+    待機中のジョブを1件処理する
+
+    Returns:
+        ジョブを処理した場合はTrue
+    """
+    job = claim_next_job()
+    if job is None:
+        return False
+    process_job(job)
+    return True
+
+
+def requeue_stale_jobs() -> int:
+    """
+    ワーカー停止などで処理中のまま残ったジョブを待機中に戻す
+
+    試行回数の上限に達したジョブは失敗扱いにし、一時保存した画像を削除する。
+
+    Returns:
+        再投入したジョブ数
+    """
+    threshold = timezone.now() - timedelta(seconds=settings.ANALYSIS_JOB_STALE_SECONDS)
+    stale_jobs = AnalysisJob.objects.filter(
+        status=AnalysisJob.Status.RUNNING, started_at__lt=threshold)
+
+    abandoned_jobs = list(stale_jobs.filter(attempts__gte=settings.ANALYSIS_JOB_MAX_ATTEMPTS))
+    # 状態を条件に更新し、この間に処理を終えたジョブは対象から外す
+    failed_ids = [job.id for job in abandoned_jobs if stale_jobs.filter(id=job.id).update(
+        status=AnalysisJob.Status.FAILED,
+        message='Analysis job timed out',
+        finished_at=timezone.now(),
+    )]
+    for job in abandoned_jobs:
+        if job.id in failed_ids:
+            _remove_spool_file(job)
+
+    return stale_jobs.update(status=AnalysisJob.Status.QUEUED)
+
+
+def run_worker_pool(concurrency: int, poll_interval: float, stop_event: threading.Event, drain: bool = False) -> None:
+    """
+    ジョブを処理するワーカースレッドを起動し、停止するまで待機する
+
+    Args:
+        concurrency: ワーカースレッド数
+        poll_interval: 待機中のジョブがない場合のポーリング間隔(秒)
+        stop_event: セットされるとワーカーを停止する
+        drain: Trueの場合は待機中のジョブがなくなった時点で終了する
+    """
+    def worker():
+        try:
+            while not stop_event.is_set():
+                close_old_connections()
+                try:
+                    # 解析ジョブを優先し、待機中のジョブがない場合にサムネイルを生成する
+                    processed = process_next_job() or process_next_thumbnail()
+                except Exception:
+                    logger.exception('Worker error')
+                    processed = False
+
+                if not processed:
+                    if drain:
+                        break
+                    stop_event.wait(poll_interval)
+        finally:
+            connection.close()  # スレッドごとのDB接続を解放
+
+    threads = [
+        threading.Thread(target=worker, name=f"analysis-worker-{i}", daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+
+    while not stop_event.is_set() and any(thread.is_alive() for thread in threads):
+        if not drain:
+            close_old_connections()
+            requeued = requeue_stale_jobs()
+            if requeued:
+                logger.warning('Requeued stale analysis jobs', extra={'jobs': requeued})
+            requeued = requeue_stale_thumbnails()
+            if requeued:
+                logger.warning('Requeued stale thumbnail tasks', extra={'thumbnails': requeued})
+        stop_event.wait(poll_interval)
+
+    # 処理中のジョブが終わるまで待つ
+    for thread in threads:
+        thread.join()
+
+
+def _remove_spool_file(job: AnalysisJob) -> None:
+    """一時保存した画像を削除する（削除に失敗してもジョブの処理は続ける）"""
+    try:
+        get_storage_backend().delete(job.spool_path)
+    except Exception:
+        logger.warning('Failed to remove job upload', exc_info=True, extra={'job_id': str(job.id)})
@@ -0,0 +1,191 @@
+"""
+ObjectLabel のプロセス内キャッシュ
+
+ラベルの語彙は小さくほぼ変化しないため、ワーカープロセスごとに
+ラベル名とIDの対応をメモリ上に保持し、DB問い合わせを省略する。
+未登録のID（モック解析のクラス番号など）も LABEL_CACHE_MISS_TTL_SECONDS の間は記録し、問い合わせを省略する。
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+logger = logging.getLogger(__name__)
+
+# get_name が返す、未登録と記録済みのIDを表す値
+MISSING = object()
+
+
+class LabelCache:
+    """ラベル名⇔IDの双方向LRUキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, max_size: int, miss_ttl: float = 60, clock=time.monotonic):
+        self.max_size = max_size
+        self.miss_ttl = miss_ttl
+        self.clock = clock
+        self._ids = OrderedDict()  # name -> id（LRU順）
+        self._names = {}  # id -> name
+        self._missing = OrderedDict()  # 未登録のid -> 記録の期限（古い順）
+        self._lock = threading.Lock()
+        self.warmed = False
+
+    def put(self, label_id: int, name: str) -> None:
+        with self._lock:
+            # 名前・IDの一方だけが変わった場合に、変更前の対応を残さない
+            old_id = self._ids.get(name)
+            if old_id is not None and old_id != label_id:
+                self._names.pop(old_id, None)
+            old_name = self._names.get(label_id)
+            if old_name is not None and old_name != name:
+                self._ids.pop(old_name, None)
+            self._missing.pop(label_id, None)
+
+            self._ids[name] = label_id
+            self._ids.move_to_end(name)
+            self._names[label_id] = name
+
+            # 上限を超えたら最も古いエントリを破棄
+            while len(self._ids) > self.max_size:
+                old_name, old_id = self._ids.popitem(last=False)
+                self._names.pop(old_id, None)
+
+    def get_id(self, name: str) -> Optional[int]:
+        with self._lock:
+            label_id = self._ids.get(name)
+            if label_id is not None:
+                self._ids.move_to_end(name)
+            return label_id
+
+    def put_missing(self, label_id: int) -> None:
+        """未登録のIDを記録する（miss_ttl 秒の間、get_name が MISSING を返す）"""
+        with self._lock:
+            self._missing[label_id] = self.clock() + self.miss_ttl
+            self._missing.move_to_end(label_id)
+            while len(self._missing) > self.max_size:
+                self._missing.popitem(last=False)
+
+    def get_name(self, label_id: int):
+        """
+        IDからラベル名を返す（未登録と記録済みの場合は MISSING、キャッシュにない場合はNone）
+        """
+        with self._lock:
+            name = self._names.get(label_id)
+            if name is not None:
+                self._ids.move_to_end(name)
+                return name
+
+            expires_at = self._missing.get(label_id)
+            if expires_at is None:
+                return None
+            if self.clock() >= expires_at:
+                del self._missing[label_id]
+                return None
+            return MISSING
+
+    def discard(self, label_id: int) -> None:
+        with self._lock:
+            name = self._names.pop(label_id, None)
+            if name is not None:
+                self._ids.pop(name, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+            self._missing.clear()
+            self.warmed = False
+
+    def __len__(self):
+        return len(self._ids)
+
+
+label_cache = LabelCache(settings.LABEL_CACHE_MAX_SIZE, settings.LABEL_CACHE_MISS_TTL_SECONDS)
+
+
+def warm_label_cache() -> int:
+    """
+    ラベルマスタをキャッシュに読み込む（ワーカー起動時に呼び出す）
+
+    Returns:
+        読み込んだラベル数
+    """
+    from .models import ObjectLabel
+
+    # 上限を超える場合は新しいラベルを優先
+    labels = ObjectLabel.objects.order_by('-id').values_list(
+        'id', 'name')[:label_cache.max_size]
+    for label_id, name in reversed(list(labels)):
+        label_cache.put(label_id, name)
+
+    label_cache.warmed = True
+    logger.info('Label cache warmed', extra={'labels': len(label_cache)})
+    return len(label_cache)
+
+
+def _ensure_warmed() -> None:
+    # gunicorn以外（runserver等）で起動した場合は初回アクセス時に読み込む
+    if not label_cache.warmed:
+        warm_label_cache()
+
+
+def get_or_create_label_id(name: str) -> Tuple[int, bool]:
+    """
+    ラベル名からIDを取得し、未登録の場合は登録する
+
+    複数ワーカーが同時に同じラベルを登録した場合も
+    IntegrityErrorを送出せず既存のIDを返す。
+
+    Returns:
+        (ラベルID, 新規登録したかどうか)
+    """
+    from .models import ObjectLabel
+
+    _ensure_warmed()
+
+    label_id = label_cache.get_id(name)
+    if label_id is not None:
+        return label_id, False
+
+    # キャッシュミス時はDBを参照
+    label = ObjectLabel.objects.filter(name=name).first()
+    if label is not None:
+        label_cache.put(label.id, label.name)
+        return label.id, False
+
+    try:
+        # 競合時に外側のトランザクションを壊さないようセーブポイント内で登録
+        with transaction.atomic():
+            label = ObjectLabel.objects.create(name=name)
+        return label.id, True
+    except IntegrityError:
+        # 他のワーカーが先に登録した
+        label = ObjectLabel.objects.get(name=name)
+        label_cache.put(label.id, label.name)
+        return label.id, False
+
+
+def get_label_name(label_id: int) -> Optional[str]:
+    """
+    ラベルIDからラベル名を取得する（未登録の場合はNone）
+    """
+    from .models import ObjectLabel
+
+    _ensure_warmed()
+
+    name = label_cache.get_name(label_id)
+    if name is MISSING:
+        return None
+    if name is not None:
+        return name
+
+    label = ObjectLabel.objects.filter(id=label_id).first()
+    if label is None:
+        label_cache.put_missing(label_id)
+        return None
+
+    label_cache.put(label.id, label.name)
+    return label.name
@@ -0,0 +1,51 @@
+"""
+構造化ログのフォーマッター
+
+ログ呼び出し時に extra で渡した項目をそのまま出力する。
+- JsonFormatter: 1行1JSON（本番環境でのログ集計用）
+- TextFormatter: 通常のテキストの末尾に key=value を付ける（開発環境用）
+"""
+import json
+import logging
+from datetime import datetime, timezone
+
+# LogRecord が標準で持つ属性（これ以外を extra の項目として扱う）
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    """extra で渡された項目を取り出す"""
+    return {
+        key: value for key, value in vars(record).items()
+        if key not in _RESERVED_ATTRS and not key.startswith('_')
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """ログを1行のJSONとして出力する"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **_extra_fields(record),
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """通常のテキスト形式の末尾に extra の項目を key=value で付ける"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = _extra_fields(record)
+        if not fields:
+            return text
+
+        extras = ' '.join(f'{key}={value}' for key, value in fields.items())
+        first_line, newline, rest = text.partition('\n')
+        return f'{first_line} {extras}{newline}{rest}'
@@ -0,0 +1,241 @@
+"""
+AiAnalysisLog の書き込み
+
+ANALYSIS_LOG_WRITE_MODE の設定で書き込み方法を切り替える。
+- sync: リクエストごとに1行ずつINSERTする
+- buffered: IDをシーケンスからまとめて予約して即座に返し、行はプロセス内のバッファに溜めて
+  件数(ANALYSIS_LOG_BUFFER_SIZE)または時間(ANALYSIS_LOG_FLUSH_INTERVAL_MS)の閾値で bulk_create する
+
+bufferedモードでは、書き込みまでの間（最大でフラッシュ間隔）ログ一覧・集計APIに反映されない。
+また created_at はバッファから書き込んだ時刻になる。
+ワーカーの終了時（gunicornの worker_exit フック、プロセス終了時の atexit）には残りの行を書き込む。
+"""
+import atexit
+import logging
+import os
+import threading
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connection, transaction
+
+from .logs_cache import invalidate_logs_cache
+from .metrics import ANALYSIS_LOG_BUFFER_PENDING, ANALYSIS_LOG_FLUSHES
+from .models import AiAnalysisLog
+from .rollups import update_hourly_rollups
+
+logger = logging.getLogger(__name__)
+
+# 1回の予約で確保するIDの数
+ID_BLOCK_SIZE = 100
+
+
+def reserve_analysis_log_ids(count: int) -> List[int]:
+    """
+    AiAnalysisLog のIDをシーケンスから count 個予約する（PostgreSQLのみ）
+
+    予約したIDは他のプロセスに払い出されないため、INSERT前にIDを返すことができる
+    （プロセスの終了時に使わなかったIDは欠番になる）。
+    """
+    if connection.vendor != 'postgresql':
+        raise ImproperlyConfigured("ANALYSIS_LOG_WRITE_MODE=buffered requires PostgreSQL")
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [AiAnalysisLog._meta.db_table, count])
+        return [row[0] for row in cursor.fetchall()]
+
+
+class AnalysisLogWriter:
+    """AiAnalysisLog をバッファに溜めてまとめて書き込む（スレッドセーフ）"""
+
+    def __init__(self, batch_size: int, flush_interval: float,
+                 reserve_ids: Callable[[int], List[int]] = reserve_analysis_log_ids, max_attempts: int = 3):
+        """
+        Args:
+            batch_size: この件数が溜まったら書き込む
+            flush_interval: 前回の書き込みからこの秒数が経ったら書き込む
+            reserve_ids: IDを予約する関数（件数を受け取り、IDのリストを返す）
+            max_attempts: まとめての書き込みが続けて失敗した場合、この回数目で1行ずつ書き込む
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.reserve_ids = reserve_ids
+        self.max_attempts = max(max_attempts, 1)
+        self._ids = []
+        self._pending = []
+        self._failed_flushes = 0
+        self._lock = threading.Lock()
+        self._id_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._closed = False
+
+    def write(self, **fields) -> AiAnalysisLog:
+        """
+        IDを割り当てた AiAnalysisLog を返し、書き込みはバッファに任せる
+
+        書き込みが遅れて未書き込みの行が batch_size の10倍を超えた場合は、呼び出し元で書き込む。
+        """
+        analysis_log = AiAnalysisLog(id=self._next_id(), **fields)
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('AnalysisLogWriter is closed')
+            self._pending.append(analysis_log)
+            pending = len(self._pending)
+            self._ensure_thread()
+            if pending >= self.batch_size:
+                self._wakeup.notify()
+        ANALYSIS_LOG_BUFFER_PENDING.inc()
+
+        if pending >= self.batch_size * 10:
+            self.flush()
+        return analysis_log
+
+    def flush(self) -> int:
+        """
+        溜まっている行をすべて書き込む
+
+        書き込みに失敗した行はバッファに戻し、次回の書き込みで再試行する。
+        max_attempts 回続けて失敗した場合は1行ずつ書き込み、それでも失敗する行（制約違反など）は破棄する
+        （書き込めない行が先頭に残り続け、以降の行が書き込まれずにバッファが増え続けるのを防ぐ）。
+
+        Returns:
+            書き込んだ行数
+        """
+        # 複数スレッドから同時に呼ばれても、同じ行を二重に書き込まないよう順番に処理する
+        with self._flush_lock:
+            with self._lock:
+                logs, self._pending = self._pending, []
+            if not logs:
+                return 0
+
+            try:
+                self._write(logs)
+            except Exception:
+                self._failed_flushes += 1
+                logger.exception('Analysis log flush failed', extra={
+                    'logs': len(logs), 'attempts': self._failed_flushes})
+                if self._failed_flushes < self.max_attempts:
+                    with self._lock:
+                        self._pending[:0] = logs
+                    return 0
+                written = self._write_each(logs)
+            else:
+                written = len(logs)
+            self._failed_flushes = 0
+
+        ANALYSIS_LOG_BUFFER_PENDING.dec(len(logs))
+        ANALYSIS_LOG_FLUSHES.inc()
+        logger.debug('Analysis logs flushed', extra={'logs': written})
+        return written
+
+    def _write(self, logs: List[AiAnalysisLog]) -> None:
+        with transaction.atomic():
+            AiAnalysisLog.objects.bulk_create(logs)
+            # bulk_create では post_save シグナルが送られないため集計は個別に反映
+            update_hourly_rollups(logs)
+            transaction.on_commit(invalidate_logs_cache)
+
+    def _write_each(self, logs: List[AiAnalysisLog]) -> int:
+        """1行ずつ書き込み、書き込めない行は破棄する（書き込んだ行数を返す）"""
+        written = 0
+        for log in logs:
+            try:
+                self._write([log])
+            except Exception as e:
+                logger.error('Analysis log dropped', extra={
+                    'analysis_log_id': log.id, 'image_path': log.image_path, 'error': str(e)})
+            else:
+                written += 1
+        return written
+
+    def close(self) -> None:
+        """バックグラウンドの書き込みを止め、残りの行を書き込む"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=max(self.flush_interval * 2, 5))
+        self.flush()
+
+    def _next_id(self) -> int:
+        with self._id_lock:
+            if not self._ids:
+                self._ids = list(self.reserve_ids(max(ID_BLOCK_SIZE, self.batch_size)))
+            return self._ids.pop(0)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='analysis-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                with self._lock:
+                    # 件数の閾値に達するか、フラッシュ間隔が経つまで待つ
+                    if not self._closed and len(self._pending) < self.batch_size:
+                        self._wakeup.wait(self.flush_interval)
+                    closed = self._closed
+                close_old_connections()
+                self.flush()
+                if closed:
+                    break
+        finally:
+            connection.close()  # スレッドのDB接続を解放
+
+
+_writer: Optional[AnalysisLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_analysis_log_writer() -> AnalysisLogWriter:
+    """プロセスごとの AnalysisLogWriter を返す"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AnalysisLogWriter(
+                settings.ANALYSIS_LOG_BUFFER_SIZE, settings.ANALYSIS_LOG_FLUSH_INTERVAL_MS / 1000,
+                max_attempts=settings.ANALYSIS_LOG_FLUSH_MAX_ATTEMPTS)
+        return _writer
+
+
+def create_analysis_log(**fields) -> AiAnalysisLog:
+    """ANALYSIS_LOG_WRITE_MODE に応じて AiAnalysisLog を登録する"""
+    if settings.ANALYSIS_LOG_WRITE_MODE == 'buffered':
+        return get_analysis_log_writer().write(**fields)
+    return AiAnalysisLog.objects.create(**fields)
+
+
+def flush_analysis_logs() -> int:
+    """バッファに溜まっている AiAnalysisLog を書き込む（bufferedモード以外では何もしない）"""
+    if _writer is None:
+        return 0
+    return _writer.flush()
+
+
+def close_analysis_log_writer() -> None:
+    """ワーカーの終了時に残りの行を書き込む"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+
+def _reset_after_fork() -> None:
+    # 親プロセスのバッファ・スレッド・予約済みIDを子プロセスに引き継がない
+    global _writer, _writer_lock
+    _writer = None
+    _writer_lock = threading.Lock()
+
+
+atexit.register(close_analysis_log_writer)
+os.register_at_fork(after_in_child=_reset_after_fork)
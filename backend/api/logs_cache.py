@@ -0,0 +1,156 @@
+"""
+ログ一覧APIのレスポンスキャッシュと条件付きGET
+
+ログのバージョン（最新のログのID・登録日時と、登録・更新・削除ごとに増える世代）から ETag / Last-Modified を生成し、
+If-None-Match が一致すれば304を返す。Last-Modified は秒単位で既存のログの更新・削除では変わらないため、
+If-Modified-Since のみの条件付きGETには304を返さない。それ以外はバージョンとクエリパラメータを
+キーにキャッシュしたレスポンスを返すため、ログが増えていない間のポーリングはDBを参照しない。
+
+バージョンはキャッシュ（CACHES の default。デフォルトはプロセスごとのローカルメモリ）に
+ANALYSIS_LOGS_CACHE_VERSION_TTL_SECONDS の間保持し、ログの登録・更新・削除時に世代を進めて破棄する。
+IDの事前確保やコミット順の前後で最新のIDより小さいIDのログが後から登録されることがあるため、
+最新のIDだけでは一覧の変化を判定できず、登録時も世代を進める。
+ローカルメモリの場合、他のプロセスで登録されたログはバージョンの保持期間が過ぎるまで反映されない
+（Redis等の共有キャッシュを指定すれば即座に反映される）。
+"""
+import hashlib
+from functools import wraps
+from typing import NamedTuple, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .models import AiAnalysisLog
+
+_VERSION_KEY = 'analysis_logs:version'
+_GENERATION_KEY = 'analysis_logs:generation'
+
+
+class LogsVersion(NamedTuple):
+    """ログ一覧のバージョン（最新のログと世代）"""
+    latest_id: int
+    latest_created_at: Optional[float]  # UNIXタイムスタンプ（ログが0件の場合はNone）
+    generation: int
+
+    @property
+    def etag(self) -> str:
+        return quote_etag(f"logs-{self.latest_id}-{self.generation}")
+
+
+def get_logs_version() -> LogsVersion:
+    """ログ一覧のバージョンを返す（キャッシュにない場合は最新のログを1件だけ取得する）"""
+    version = cache.get(_VERSION_KEY)
+    if version is not None:
+        return LogsVersion(*version)
+
+    latest = AiAnalysisLog.objects.order_by('-id').values_list('id', 'created_at').first()
+    latest_id, latest_created_at = latest if latest else (0, None)
+    version = LogsVersion(
+        latest_id,
+        latest_created_at.timestamp() if latest_created_at else None,
+        cache.get(_GENERATION_KEY, 0))
+    cache.set(_VERSION_KEY, tuple(version), settings.ANALYSIS_LOGS_CACHE_VERSION_TTL_SECONDS)
+    return version
+
+
+def invalidate_logs_cache() -> None:
+    """ログの登録・更新・削除後に世代を進めてバージョンを破棄する（トランザクションのコミット後に呼び出す）"""
+    try:
+        cache.incr(_GENERATION_KEY)
+    except ValueError:
+        cache.set(_GENERATION_KEY, 1, None)
+    cache.delete(_VERSION_KEY)
+
+
+def logs_cache_key(version: LogsVersion, params, kind: str = 'data') -> str:
+    """
+    ログ一覧のレスポンスのキャッシュキー
+
+    kind: 同期ビューはレスポンスのデータ(data)、非同期ビューはレンダリング済みの本文(content)を保存するため、
+    同じキャッシュを共有していても互いの値を読まないようキーを分ける
+    """
+    query = '&'.join(f"{key}={value}" for key, value in sorted(params.items()))
+    digest = hashlib.md5(query.encode('utf-8')).hexdigest()
+    return f"analysis_logs:{kind}:{version.latest_id}:{version.generation}:{digest}"
+
+
+def cache_logs_response(view):
+    """ログ一覧ビュー（DRF）のレスポンスをキャッシュし、条件付きGETに304を返すデコレーター"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.ANALYSIS_LOGS_CACHE:
+            return view(request, *args, **kwargs)
+
+        version = get_logs_version()
+        not_modified = _not_modified_response(request, version)
+        if not_modified is not None:
+            return not_modified
+
+        key = logs_cache_key(version, request.GET)
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, settings.ANALYSIS_LOGS_CACHE_TTL_SECONDS)
+
+        return _set_validators(response, version)
+
+    return wrapper
+
+
+def acache_logs_response(view):
+    """cache_logs_response の非同期ビュー版（レンダリング済みの本文をキャッシュする）"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not settings.ANALYSIS_LOGS_CACHE:
+            return await view(request, *args, **kwargs)
+
+        version = await sync_to_async(get_logs_version)()
+        not_modified = _not_modified_response(request, version)
+        if not_modified is not None:
+            return not_modified
+
+        key = logs_cache_key(version, request.GET, kind='content')
+        content = await cache.aget(key)
+        if content is not None:
+            response = HttpResponse(content, content_type='application/json')
+        else:
+            response = await view(request, *args, **kwargs)
+            if response.status_code == 200:
+                await cache.aset(key, response.content, settings.ANALYSIS_LOGS_CACHE_TTL_SECONDS)
+
+        return _set_validators(response, version)
+
+    return wrapper
+
+
+def _not_modified_response(request, version: LogsVersion):
+    # last_modified は渡さない（同じ秒の登録や既存のログの更新後に古い一覧へ304を返さないよう、ETagでのみ判定する）
+    response = get_conditional_response(request, etag=version.etag)
+    if response is not None:
+        _set_validators(response, version)
+    return response
+
+
+def _set_validators(response, version: LogsVersion):
+    response['ETag'] = version.etag
+    last_modified = _last_modified(version)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # ブラウザにキャッシュさせる場合も毎回ETagで再検証させる
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _last_modified(version: LogsVersion) -> Optional[int]:
+    # 参考情報として返す（HTTP日付は秒単位のため、同じ秒に登録されたログや更新・削除は ETag でのみ区別できる）
+    if version.latest_created_at is None:
+        return None
+    return int(version.latest_created_at)
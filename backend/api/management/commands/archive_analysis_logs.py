@@ -0,0 +1,134 @@
+import gzip
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Min
+from django.utils import timezone
+
+from api.logs_cache import invalidate_logs_cache
+from api.models import AiAnalysisLog
+from api.partitions import (add_months, count_partition_rows, drop_partition,
+                            ensure_partitions, is_partitioned, list_partitions,
+                            month_start)
+from api.storage import get_archive_storage_backend
+
+# 行の読み込み・削除の単位
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "保持期間を過ぎた解析ログを月単位で保存先へ NDJSON.gz として書き出し、DBから削除する"
+        "（PostgreSQLではパーティションごと削除し、先の月のパーティションを作成する）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=settings.ANALYSIS_LOG_RETENTION_DAYS,
+            help=f'この日数より前に終わった月をアーカイブする (デフォルト: {settings.ANALYSIS_LOG_RETENTION_DAYS})')
+        parser.add_argument(
+            '--dry-run', action='store_true', help='対象の月と件数を表示するのみで、書き出し・削除はしない')
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 1:
+            raise CommandError('--older-than-days must be at least 1')
+
+        now = timezone.now()
+        cutoff = now - timedelta(days=options['older_than_days'])
+        partitioned = is_partitioned()
+
+        storage = None
+        if not options['dry_run']:
+            try:
+                storage = get_archive_storage_backend()
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        if partitioned and not options['dry_run']:
+            for name in ensure_partitions(settings.ANALYSIS_LOG_PARTITION_MONTHS_AHEAD, now):
+                self.stdout.write(f"Created partition {name}")
+
+        months = self._archivable_months(partitioned, cutoff)
+        if not months:
+            self.stdout.write(f"No months ended before {cutoff:%Y-%m-%d}")
+            return
+
+        for name, start, end in months:
+            logs = AiAnalysisLog.objects.filter(created_at__gte=start, created_at__lt=end)
+            if options['dry_run']:
+                self.stdout.write(f"{start:%Y-%m}: {logs.count()} logs")
+                continue
+
+            count, storage_path = self._archive(storage, logs, start)
+            if partitioned:
+                # 書き出し中に行が増減していた場合は削除しない
+                if count_partition_rows(name) != count:
+                    raise CommandError(f"{name} changed while archiving; not dropped")
+                drop_partition(name)
+                # パーティションの削除では post_delete シグナルが送られないため個別に破棄
+                invalidate_logs_cache()
+            else:
+                self._delete(logs)
+
+            archived = f" to {storage_path}" if storage_path else ""
+            self.stdout.write(self.style.SUCCESS(f"Archived {count} logs for {start:%Y-%m}{archived}"))
+
+    def _archivable_months(self, partitioned, cutoff):
+        """cutoff までに終わった月を古い順に返す: [(パーティション名, 開始, 終了), ...]"""
+        if partitioned:
+            return [partition for partition in list_partitions() if partition[2] <= cutoff]
+
+        oldest = AiAnalysisLog.objects.aggregate(oldest=Min('created_at'))['oldest']
+        if oldest is None:
+            return []
+
+        months = []
+        month = month_start(oldest)
+        while add_months(month, 1) <= cutoff:
+            months.append((None, month, add_months(month, 1)))
+            month = add_months(month, 1)
+        return months
+
+    def _archive(self, storage, logs, month):
+        """
+        月のログを1行1JSONのgzipファイルとして保存先へ書き出す（0件の場合は書き出さない）
+
+        Returns:
+            (書き出した件数, 保存先パス)
+        """
+        if not logs.exists():
+            return 0, None
+
+        fields = AiAnalysisLog._meta.concrete_fields
+        columns = [field.column for field in fields]
+        rows = logs.order_by('created_at', 'id').values_list(
+            *[field.attname for field in fields]).iterator(chunk_size=BATCH_SIZE)
+
+        filename = f"{settings.ANALYSIS_LOG_ARCHIVE_PREFIX}{month:%Y-%m}.ndjson.gz"
+        writer = storage.open_writer(filename, 'application/gzip')
+        count = 0
+        try:
+            # GzipFile の close() では writer は閉じない
+            with gzip.GzipFile(fileobj=writer, mode='wb') as archive:
+                for row in rows:
+                    line = json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False)
+                    archive.write(line.encode('utf-8') + b'\n')
+                    count += 1
+        except BaseException:
+            # 書き込み途中のファイルは確定させずに破棄する
+            storage.discard_writer(writer)
+            raise
+        writer.close()
+
+        return count, storage.storage_path(filename)
+
+    def _delete(self, logs):
+        """パーティション分割していない場合は行を分けて削除する"""
+        while True:
+            ids = list(logs.values_list('id', flat=True)[:BATCH_SIZE])
+            if not ids:
+                return
+            AiAnalysisLog.objects.filter(id__in=ids).delete()
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import AiAnalysisLog
+from api.thumbnails import enqueue_missing_thumbnails
+
+# 1回に登録するタスク数
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "既存の解析ログの画像のサムネイル生成タスクを登録する"
+        "（生成は run_analysis_worker が行う。すぐに処理する場合は --drain を指定して起動）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE, help=f'1回に登録するタスク数 (デフォルト: {BATCH_SIZE})')
+
+    def handle(self, *args, **options):
+        if not settings.THUMBNAILS:
+            raise CommandError('THUMBNAILS is disabled')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        # キャッシュヒットしたログは同じ画像を参照するため、画像ごとに1件にまとめる
+        image_paths = (AiAnalysisLog.objects
+                       .order_by()
+                       .values_list('image_path', flat=True)
+                       .distinct()
+                       .iterator(chunk_size=options['batch_size']))
+
+        total = queued = 0
+        batch = []
+        for image_path in image_paths:
+            batch.append(image_path)
+            if len(batch) >= options['batch_size']:
+                queued += enqueue_missing_thumbnails(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            queued += enqueue_missing_thumbnails(batch)
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Queued {queued} thumbnail tasks for {total} images "
+            "(run `python manage.py run_analysis_worker --drain` to generate them now)"))
@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from django.utils import timezone
+
+from api.models import AiAnalysisLog
+from api.rollups import rebuild_hourly_rollups, truncate_to_hour
+
+
+class Command(BaseCommand):
+    help = "解析ログから1時間単位の集計を作り直す（ANALYSIS_ROLLUP_MODE=compaction の場合は定期的に実行する）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=24, help='作り直す直近の時間数 (デフォルト: 24)')
+        parser.add_argument(
+            '--all', action='store_true', help='最も古いログの時間帯からすべて作り直す')
+        parser.add_argument(
+            '--grace-minutes', type=int, default=5,
+            help='incrementalモードで、終了からこの分数が経っていない時間帯は作り直さない (デフォルト: 5)')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        if settings.ANALYSIS_ROLLUP_MODE == 'incremental':
+            # 加算中の時間帯（現在の時間帯と直前の時間帯の締め直後）は作り直さない
+            end = truncate_to_hour(now - timedelta(minutes=options['grace_minutes']))
+        else:
+            end = truncate_to_hour(now) + timedelta(hours=1)
+
+        if options['all']:
+            oldest = AiAnalysisLog.objects.aggregate(oldest=Min('created_at'))['oldest']
+            if oldest is None:
+                self.stdout.write("No analysis logs")
+                return
+            start = truncate_to_hour(oldest)
+        else:
+            start = end - timedelta(hours=options['hours'])
+
+        if start >= end:
+            self.stdout.write("No hours to compact")
+            return
+
+        created = rebuild_hourly_rollups(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {created} rollups for {start:%Y-%m-%d %H:00} - {end:%Y-%m-%d %H:00}"))
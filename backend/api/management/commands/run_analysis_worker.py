@@ -0,0 +1,46 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from api.jobs import run_worker_pool
+from api.log_writer import close_analysis_log_writer
+from api.partitions import ensure_upcoming_partitions
+from api.rollups import close_hourly_rollups, start_hourly_rollup_flusher
+
+
+class Command(BaseCommand):
+    help = "非同期解析ジョブを処理するワーカープールを起動する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=4, help='ワーカースレッド数 (デフォルト: 4)')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0, help='ジョブがない場合のポーリング間隔(秒) (デフォルト: 1.0)')
+        parser.add_argument(
+            '--drain', action='store_true', help='待機中のジョブをすべて処理したら終了する')
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        # SIGTERM/SIGINTで処理中のジョブを終えてから停止
+        def stop(signum, frame):
+            self.stdout.write("Stopping analysis workers...")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        # defaultパーティションがないため、先の月のパーティションがないと解析ログを登録できない
+        for name in ensure_upcoming_partitions():
+            self.stdout.write(f"Created partition {name}")
+
+        self.stdout.write(
+            f"Starting {options['concurrency']} analysis workers")
+        start_hourly_rollup_flusher()
+        run_worker_pool(
+            options['concurrency'], options['poll_interval'], stop_event, drain=options['drain'])
+        # bufferedモードで溜まっている解析ログと集計への加算を書き込んでから終了
+        close_analysis_log_writer()
+        close_hourly_rollups()
+        self.stdout.write(self.style.SUCCESS("Analysis workers stopped"))
@@ -0,0 +1,91 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.logs_cache import invalidate_logs_cache
+from api.models import AiAnalysisLog, ObjectLabel
+from api.rollups import update_hourly_rollups
+
+SEED_LABELS = ['Person', 'Car', 'Dog', 'Cat', 'Bicycle', 'Chair', 'Bottle', 'Laptop']
+
+
+@contextmanager
+def explicit_created_at():
+    """bulk_create で created_at を指定できるよう auto_now_add を一時的に無効化する"""
+    field = AiAnalysisLog._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = "ベンチマーク用にAI分析ログのダミーデータを登録する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=10_000, help='登録する件数 (デフォルト: 10000)')
+        parser.add_argument(
+            '--days', type=int, default=90, help='作成日時を分散させる日数 (デフォルト: 90)')
+        parser.add_argument(
+            '--batch-size', type=int, default=10_000, help='1回のINSERTで登録する件数 (デフォルト: 10000)')
+        parser.add_argument(
+            '--failure-rate', type=float, default=0.1, help='失敗ログの割合 (デフォルト: 0.1)')
+        parser.add_argument(
+            '--truncate', action='store_true', help='登録前に既存のログをすべて削除する')
+        parser.add_argument(
+            '--seed', type=int, default=None, help='乱数シード（指定すると同じデータを生成する）')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        batch_size = options['batch_size']
+        failure_rate = options['failure_rate']
+        rng = random.Random(options['seed'])
+
+        if options['truncate']:
+            deleted, _ = AiAnalysisLog.objects.all().delete()
+            self.stdout.write(f"Deleted {deleted} logs")
+
+        label_ids = [
+            ObjectLabel.objects.get_or_create(name=name)[0].id for name in SEED_LABELS]
+
+        # 古い順に作成日時を割り当て、IDの順序と作成日時の順序を揃える
+        now = timezone.now()
+        span_seconds = options['days'] * 24 * 60 * 60
+        step_seconds = span_seconds / max(rows, 1)
+        started_at = now - timedelta(seconds=span_seconds)
+
+        created = 0
+        with explicit_created_at():
+            while created < rows:
+                count = min(batch_size, rows - created)
+                logs = []
+                for i in range(created, created + count):
+                    created_at = started_at + timedelta(seconds=i * step_seconds)
+                    request_timestamp = created_at - timedelta(milliseconds=rng.randint(300, 1500))
+                    success = rng.random() >= failure_rate
+                    logs.append(AiAnalysisLog(
+                        image_path=f"https://example.com/images/seed_{i:08d}.jpg",
+                        success=success,
+                        message='success' if success else 'Error:E50012',
+                        classification_id=rng.choice(label_ids) if success else None,
+                        confidence=Decimal(str(round(rng.uniform(0.5, 0.99), 4))) if success else None,
+                        request_timestamp=request_timestamp,
+                        response_timestamp=created_at,
+                        created_at=created_at,
+                    ))
+
+                with transaction.atomic():
+                    AiAnalysisLog.objects.bulk_create(logs, batch_size=batch_size)
+                    update_hourly_rollups(logs)
+                    transaction.on_commit(invalidate_logs_cache)
+                created += count
+                self.stdout.write(f"Seeded {created}/{rows} logs")
+
+        self.stdout.write(self.style.SUCCESS(f"Seeded {rows} analysis logs"))
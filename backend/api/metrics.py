@@ -0,0 +1,172 @@
+"""
+Prometheus形式のメトリクス
+
+gunicornの複数ワーカーで集計できるよう、PROMETHEUS_MULTIPROC_DIR が設定されている場合は
+prometheus_client のマルチプロセスモード（ワーカーごとのファイルを /metrics で合算）で動作する。
+ディレクトリの初期化と終了したワーカーの後始末は gunicorn.conf.py のフックで行う。
+"""
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+# 解析APIのレイテンシ（数百ms〜数秒）に合わせたバケット
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0, 30.0)
+
+HTTP_REQUESTS = Counter(
+    'image_analyzer_http_requests_total',
+    'HTTPリクエスト数',
+    ['endpoint', 'method', 'status'])
+
+HTTP_REQUEST_DURATION = Histogram(
+    'image_analyzer_http_request_duration_seconds',
+    'HTTPリクエストの処理時間',
+    ['endpoint', 'method'],
+    buckets=LATENCY_BUCKETS)
+
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    'image_analyzer_http_requests_in_progress',
+    '処理中のHTTPリクエスト数',
+    ['endpoint'],
+    multiprocess_mode='livesum')
+
+PIPELINE_STAGE_DURATION = Histogram(
+    'image_analyzer_pipeline_stage_duration_seconds',
+    '解析パイプラインの処理段階ごとの所要時間',
+    ['stage'],
+    buckets=LATENCY_BUCKETS)
+
+ANALYSIS_RESULTS = Counter(
+    'image_analyzer_analysis_results_total',
+    '解析バックエンドの結果（成功・エラーメッセージ別）',
+    ['analyzer', 'success', 'message'])
+
+ANALYSIS_CACHE_LOOKUPS = Counter(
+    'image_analyzer_analysis_cache_lookups_total',
+    '解析結果キャッシュの参照数（hit/miss）',
+    ['result'])
+
+ANALYSIS_NEAR_DUPLICATE_LOOKUPS = Counter(
+    'image_analyzer_near_duplicate_lookups_total',
+    '類似画像（知覚ハッシュ）による解析結果キャッシュの参照数（hit/miss）',
+    ['result'])
+
+ANALYSIS_LOG_BUFFER_PENDING = Gauge(
+    'image_analyzer_analysis_log_buffer_pending',
+    '書き込み待ちの解析ログ数（ANALYSIS_LOG_WRITE_MODE=buffered）',
+    multiprocess_mode='livesum')
+
+ANALYSIS_LOG_FLUSHES = Counter(
+    'image_analyzer_analysis_log_flushes_total',
+    'バッファからの解析ログの書き込み回数（ANALYSIS_LOG_WRITE_MODE=buffered）')
+
+ANALYZER_CALLS = Counter(
+    'image_analyzer_analyzer_calls_total',
+    '解析バックエンドの呼び出し数（再試行・ヘッジを含む1回ごと。success/retryable_error/error）',
+    ['analyzer', 'outcome'])
+
+ANALYZER_RETRIES = Counter(
+    'image_analyzer_analyzer_retries_total',
+    '解析バックエンドの呼び出しの再試行数',
+    ['analyzer'])
+
+ANALYZER_REJECTIONS = Counter(
+    'image_analyzer_analyzer_rejections_total',
+    '呼び出さずに失敗させた解析の数（circuit_open/concurrency_limit）',
+    ['analyzer', 'reason'])
+
+ANALYZER_HEDGES = Counter(
+    'image_analyzer_analyzer_hedges_total',
+    'ヘッジリクエストの数（sent: 送信、won: 先に応答した）',
+    ['analyzer', 'result'])
+
+ANALYZER_CIRCUIT_STATE_CHANGES = Counter(
+    'image_analyzer_analyzer_circuit_state_changes_total',
+    'サーキットブレーカーの状態遷移数（遷移先の状態別）',
+    ['analyzer', 'state'])
+
+ANALYZER_CALLS_IN_FLIGHT = Gauge(
+    'image_analyzer_analyzer_calls_in_flight',
+    '実行中の解析バックエンドの呼び出し数',
+    ['analyzer'],
+    multiprocess_mode='livesum')
+
+# ラベル値として使うメッセージの最大長（例外メッセージで系列が増え続けないようにする）
+MESSAGE_LABEL_MAX_LENGTH = 64
+
+
+def message_label(message: str) -> str:
+    """
+    解析結果のメッセージをメトリクスのラベル値に正規化する
+
+    'Analysis failed: <例外メッセージ>' のような可変部分は取り除く。
+    """
+    if not message:
+        return ''
+    return message.split(': ', 1)[0][:MESSAGE_LABEL_MAX_LENGTH]
+
+
+def record_analysis_result(analyzer_name: str, analysis_result: dict) -> None:
+    """解析バックエンドの結果を記録する"""
+    ANALYSIS_RESULTS.labels(
+        analyzer=analyzer_name or '',
+        success=str(bool(analysis_result['success'])).lower(),
+        message=message_label(analysis_result['message'])).inc()
+
+
+def record_cache_lookup(hit: bool) -> None:
+    """解析結果キャッシュの参照結果を記録する"""
+    ANALYSIS_CACHE_LOOKUPS.labels(result='hit' if hit else 'miss').inc()
+
+
+def record_near_duplicate_lookup(hit: bool) -> None:
+    """類似画像による解析結果キャッシュの参照結果を記録する"""
+    ANALYSIS_NEAR_DUPLICATE_LOOKUPS.labels(result='hit' if hit else 'miss').inc()
+
+
+def record_analyzer_call(analyzer_name: str, outcome: str) -> None:
+    """解析バックエンドの呼び出し1回の結果を記録する"""
+    ANALYZER_CALLS.labels(analyzer=analyzer_name, outcome=outcome).inc()
+
+
+def record_analyzer_retry(analyzer_name: str) -> None:
+    ANALYZER_RETRIES.labels(analyzer=analyzer_name).inc()
+
+
+def record_analyzer_rejection(analyzer_name: str, reason: str) -> None:
+    ANALYZER_REJECTIONS.labels(analyzer=analyzer_name, reason=reason).inc()
+
+
+def record_analyzer_hedge(analyzer_name: str, result: str) -> None:
+    ANALYZER_HEDGES.labels(analyzer=analyzer_name, result=result).inc()
+
+
+def record_circuit_state(analyzer_name: str, state: str) -> None:
+    ANALYZER_CIRCUIT_STATE_CHANGES.labels(analyzer=analyzer_name, state=state).inc()
+
+
+def record_analyzer_in_flight(analyzer_name: str, count: int) -> None:
+    ANALYZER_CALLS_IN_FLIGHT.labels(analyzer=analyzer_name).set(count)
+
+
+def record_stage_timings(timings: dict) -> None:
+    """StageTimer.as_dict() の段階別所要時間(ms)を記録する"""
+    for stage_name, duration_ms in timings.items():
+        PIPELINE_STAGE_DURATION.labels(stage=stage_name).observe(duration_ms / 1000)
+
+
+def render_metrics():
+    """
+    メトリクスをPrometheusのテキスト形式で出力する
+
+    Returns:
+        (本文, Content-Type)
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        # 全ワーカーのファイルを合算する
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
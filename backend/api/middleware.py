@@ -0,0 +1,69 @@
+"""
+リクエストのメトリクスを記録するミドルウェア
+
+同期（WSGI）・非同期（ASGI）のどちらのリクエスト処理にも対応する。
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.urls import Resolver404, resolve
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import (HTTP_REQUEST_DURATION, HTTP_REQUESTS,
+                      HTTP_REQUESTS_IN_PROGRESS)
+
+
+def endpoint_label(request) -> str:
+    """
+    メトリクスのラベルに使うエンドポイント名（URLパターン）を返す
+
+    パスをそのまま使うと系列が増え続けるため、URLパターン（例: 'api/logs/'）を使い、
+    どのパターンにも一致しないパスは 'unmatched' にまとめる。
+    """
+    try:
+        return resolve(request.path_info).route or 'unmatched'
+    except Resolver404:
+        return 'unmatched'
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """エンドポイントごとのリクエスト数・処理時間・処理中のリクエスト数を記録する"""
+
+    def observe(endpoint, method, status, started):
+        HTTP_REQUESTS.labels(endpoint=endpoint, method=method, status=status).inc()
+        HTTP_REQUEST_DURATION.labels(endpoint=endpoint, method=method).observe(
+            time.perf_counter() - started)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            endpoint = endpoint_label(request)
+            in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(endpoint=endpoint)
+            started = time.perf_counter()
+            status = 500
+            in_progress.inc()
+            try:
+                response = await get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                in_progress.dec()
+                observe(endpoint, request.method, status, started)
+
+        return markcoroutinefunction(middleware)
+
+    def middleware(request):
+        endpoint = endpoint_label(request)
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(endpoint=endpoint)
+        started = time.perf_counter()
+        status = 500
+        in_progress.inc()
+        try:
+            response = get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            in_progress.dec()
+            observe(endpoint, request.method, status, started)
+
+    return middleware
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_objectlabel_rename_analysislog_aianalysislog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageContentIndex",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "digest",
+                    models.CharField(
+                        max_length=64, unique=True, verbose_name="SHA-256ダイジェスト"
+                    ),
+                ),
+                ("gcs_path", models.CharField(max_length=255, verbose_name="GCSパス")),
+                (
+                    "public_url",
+                    models.CharField(max_length=255, verbose_name="公開URL"),
+                ),
+                ("classification", models.IntegerField(blank=True, null=True)),
+                (
+                    "confidence",
+                    models.DecimalField(
+                        blank=True, decimal_places=4, max_digits=5, null=True
+                    ),
+                ),
+                (
+                    "expires_at",
+                    models.DateTimeField(db_index=True, verbose_name="有効期限"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="登録日時"),
+                ),
+            ],
+            options={
+                "verbose_name": "画像コンテンツインデックス",
+                "verbose_name_plural": "画像コンテンツインデックス",
+                "db_table": "image_content_index",
+            },
+        ),
+        migrations.AddField(
+            model_name="aianalysislog",
+            name="cache_hit",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_image_content_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="aianalysislog",
+            name="classification",
+            field=models.ForeignKey(
+                blank=True,
+                db_column="classification",
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="analysis_logs",
+                to="api.objectlabel",
+            ),
+        ),
+    ]
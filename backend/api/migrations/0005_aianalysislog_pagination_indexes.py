@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_aianalysislog_classification_label"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="aianalysislog",
+            name="classification",
+            field=models.ForeignKey(
+                blank=True,
+                db_column="classification",
+                db_constraint=False,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="analysis_logs",
+                to="api.objectlabel",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aianalysislog",
+            index=models.Index(
+                fields=["created_at", "id"], name="ai_log_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aianalysislog",
+            index=models.Index(
+                fields=["classification", "created_at"], name="ai_log_class_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:02
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_aianalysislog_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnalysisJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "待機中"),
+                            ("running", "処理中"),
+                            ("completed", "完了"),
+                            ("failed", "失敗"),
+                        ],
+                        default="queued",
+                        max_length=16,
+                        verbose_name="ステータス",
+                    ),
+                ),
+                (
+                    "spool_path",
+                    models.CharField(max_length=255, verbose_name="一時保存パス"),
+                ),
+                (
+                    "original_name",
+                    models.CharField(max_length=255, verbose_name="元ファイル名"),
+                ),
+                (
+                    "digest",
+                    models.CharField(max_length=64, verbose_name="SHA-256ダイジェスト"),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="試行回数"),
+                ),
+                ("message", models.CharField(blank=True, max_length=255, null=True)),
+                ("request_timestamp", models.DateTimeField(verbose_name="受付日時")),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="開始日時"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="完了日時"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="登録日時"),
+                ),
+                (
+                    "analysis_log",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="api.aianalysislog",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "解析ジョブ",
+                "verbose_name_plural": "解析ジョブ",
+                "db_table": "analysis_jobs",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "created_at"], name="analysis_job_status_idx"
+                    )
+                ],
+            },
+        ),
+    ]
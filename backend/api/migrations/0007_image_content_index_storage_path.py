@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_analysis_jobs"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="imagecontentindex",
+            old_name="gcs_path",
+            new_name="storage_path",
+        ),
+        migrations.AlterField(
+            model_name="imagecontentindex",
+            name="storage_path",
+            field=models.CharField(max_length=255, verbose_name="保存先パス"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_image_content_index_storage_path"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aianalysislog",
+            name="overlap_saved_ms",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
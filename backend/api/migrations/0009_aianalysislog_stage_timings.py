@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_aianalysislog_overlap_saved_ms"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aianalysislog",
+            name="stage_timings",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_aianalysislog_stage_timings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnalysisHourlyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField(verbose_name="集計時間帯")),
+                ("classification", models.IntegerField(verbose_name="分類ID")),
+                (
+                    "total_count",
+                    models.PositiveIntegerField(default=0, verbose_name="件数"),
+                ),
+                (
+                    "success_count",
+                    models.PositiveIntegerField(default=0, verbose_name="成功件数"),
+                ),
+                (
+                    "cache_hit_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="キャッシュヒット件数"
+                    ),
+                ),
+                (
+                    "processing_time_sketch",
+                    models.JSONField(default=dict, verbose_name="処理時間の分布"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新日時"),
+                ),
+            ],
+            options={
+                "verbose_name": "解析ログ集計（1時間単位）",
+                "verbose_name_plural": "解析ログ集計（1時間単位）",
+                "db_table": "analysis_hourly_rollups",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("hour", "classification"),
+                        name="analysis_rollup_hour_class_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
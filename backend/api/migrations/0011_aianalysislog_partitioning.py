@@ -0,0 +1,110 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:35
+
+from datetime import timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone as django_timezone
+
+TABLE = "ai_analysis_log"
+OLD_TABLE = "ai_analysis_log_unpartitioned"
+NEW_SEQUENCE = "ai_analysis_log_id_seq_new"
+INDEXES = [
+    ("ai_log_created_id_idx", "(created_at, id)"),
+    ("ai_log_class_created_idx", "(classification, created_at)"),
+]
+# 移行時に作成する先の月数（以降は archive_analysis_logs コマンドで作成する）
+MONTHS_AHEAD = 3
+
+
+def _month_start(value):
+    return value.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _swap_table(cursor, partitioned):
+    """
+    ai_analysis_log を退避し、同じ列の新しいテーブルに行を移す
+
+    パーティションテーブルの主キーにはパーティションキーを含める必要があるため (id, created_at) とし、
+    IDの採番は新しいシーケンスで引き継ぐ（パーティションテーブルはPostgreSQL 17未満でIDENTITY列を持てない）。
+    """
+    cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [OLD_TABLE])
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT "{constraint}" TO {OLD_TABLE}_pkey')
+    for name, _ in INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+    partition_by = " PARTITION BY RANGE (created_at)" if partitioned else ""
+    cursor.execute(
+        f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS){partition_by}")
+    cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id DROP DEFAULT")
+    cursor.execute(f"CREATE SEQUENCE {NEW_SEQUENCE} OWNED BY {TABLE}.id")
+    cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{NEW_SEQUENCE}')")
+    primary_key = "(id, created_at)" if partitioned else "(id)"
+    cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY {primary_key}")
+    for name, columns in INDEXES:
+        cursor.execute(f"CREATE INDEX {name} ON {TABLE} {columns}")
+
+    if partitioned:
+        cursor.execute(f"SELECT min(created_at) FROM {OLD_TABLE}")
+        oldest = cursor.fetchone()[0] or django_timezone.now()
+        month = _month_start(oldest)
+        last = _add_months(_month_start(django_timezone.now()), MONTHS_AHEAD)
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_p{month:%Y_%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+                [month, _add_months(month, 1)])
+            month = _add_months(month, 1)
+        # 作成漏れの月の行を受け止める
+        cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+
+    cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}")
+    cursor.execute(f"SELECT setval('{NEW_SEQUENCE}', (SELECT coalesce(max(id), 0) + 1 FROM {TABLE}), false)")
+    # 退避したテーブルと一緒に元のシーケンスも削除されるため、同じ名前に付け替える
+    cursor.execute(f"DROP TABLE {OLD_TABLE}")
+    cursor.execute(f"ALTER SEQUENCE {NEW_SEQUENCE} RENAME TO {TABLE}_id_seq")
+
+
+def partition_analysis_logs(apps, schema_editor):
+    """ai_analysis_log を created_at の月単位のパーティションテーブルに変換する（PostgreSQLのみ）"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        _swap_table(cursor, partitioned=True)
+
+
+def unpartition_analysis_logs(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        _swap_table(cursor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_analysis_hourly_rollups"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="analysisjob",
+            name="analysis_log",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="api.aianalysislog",
+            ),
+        ),
+        migrations.RunPython(partition_analysis_logs, unpartition_analysis_logs),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:46
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_processing_time(apps, schema_editor):
+    """既存のログの processing_time_ms を request_timestamp・response_timestamp から設定する"""
+    if schema_editor.connection.vendor == "postgresql":
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE ai_analysis_log SET processing_time_ms = "
+                "trunc(extract(epoch FROM (response_timestamp - request_timestamp)) * 1000)::integer "
+                "WHERE request_timestamp IS NOT NULL AND response_timestamp IS NOT NULL"
+            )
+        return
+
+    AiAnalysisLog = apps.get_model("api", "AiAnalysisLog")
+    logs = AiAnalysisLog.objects.filter(
+        request_timestamp__isnull=False, response_timestamp__isnull=False
+    ).only("request_timestamp", "response_timestamp")
+    batch = []
+    for log in logs.iterator(chunk_size=BATCH_SIZE):
+        delta = log.response_timestamp - log.request_timestamp
+        log.processing_time_ms = int(delta.total_seconds() * 1000)
+        batch.append(log)
+        if len(batch) >= BATCH_SIZE:
+            AiAnalysisLog.objects.bulk_update(batch, ["processing_time_ms"])
+            batch = []
+    AiAnalysisLog.objects.bulk_update(batch, ["processing_time_ms"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_aianalysislog_partitioning"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aianalysislog",
+            name="processing_time_ms",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_processing_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="aianalysislog",
+            index=models.Index(
+                fields=["success", "created_at"], name="ai_log_success_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aianalysislog",
+            index=models.Index(
+                condition=models.Q(("success", False)),
+                fields=["created_at"],
+                name="ai_log_failed_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aianalysislog",
+            index=models.Index(
+                condition=models.Q(("processing_time_ms__isnull", False)),
+                fields=["processing_time_ms"],
+                name="ai_log_latency_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aianalysislog",
+            index=models.Index(
+                condition=models.Q(("confidence__isnull", False)),
+                fields=["confidence"],
+                name="ai_log_confidence_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_aianalysislog_processing_time"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imagecontentindex",
+            name="perceptual_hash",
+            field=models.BigIntegerField(
+                blank=True, null=True, verbose_name="知覚ハッシュ"
+            ),
+        ),
+    ]
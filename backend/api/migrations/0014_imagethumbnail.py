@@ -0,0 +1,84 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_imagecontentindex_perceptual_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageThumbnail",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source_url",
+                    models.CharField(
+                        max_length=255, unique=True, verbose_name="元画像の公開URL"
+                    ),
+                ),
+                (
+                    "storage_path",
+                    models.CharField(max_length=255, verbose_name="元画像の保存先パス"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "待機中"),
+                            ("running", "処理中"),
+                            ("completed", "完了"),
+                            ("failed", "失敗"),
+                        ],
+                        default="queued",
+                        max_length=16,
+                        verbose_name="ステータス",
+                    ),
+                ),
+                ("urls", models.JSONField(default=dict, verbose_name="サムネイルURL")),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="試行回数"),
+                ),
+                ("message", models.CharField(blank=True, max_length=255, null=True)),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="開始日時"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="完了日時"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="登録日時"),
+                ),
+            ],
+            options={
+                "verbose_name": "サムネイル",
+                "verbose_name_plural": "サムネイル",
+                "db_table": "image_thumbnails",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "created_at"],
+                        name="image_thumbnail_status_idx",
+                    )
+                ],
+            },
+        ),
+    ]
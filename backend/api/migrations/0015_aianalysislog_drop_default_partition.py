@@ -0,0 +1,75 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:40
+
+from datetime import timezone
+
+from django.db import migrations
+from django.utils import timezone as django_timezone
+
+TABLE = "ai_analysis_log"
+DEFAULT_PARTITION = f"{TABLE}_default"
+# 移行時に作成する先の月数（以降はワーカーの起動時と archive_analysis_logs コマンドで作成する）
+MONTHS_AHEAD = 3
+
+
+def _month_start(value):
+    return value.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _create_partition(cursor, month):
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {TABLE}_p{month:%Y_%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+        [month, _add_months(month, 1)])
+
+
+def drop_default_partition(apps, schema_editor):
+    """
+    defaultパーティションの行を月のパーティションへ移し、defaultパーティションを削除する（PostgreSQLのみ）
+
+    範囲の上限がないdefaultパーティションがあると、新しい順の一覧で月のパーティションを順に読む
+    ordered Append や、created_at の範囲によるパーティションの除外が効かない。
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [DEFAULT_PARTITION])
+        if not cursor.fetchone()[0]:
+            return
+
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC') FROM {DEFAULT_PARTITION}")
+        months = {row[0].replace(tzinfo=timezone.utc) for row in cursor.fetchall()}
+        current = _month_start(django_timezone.now())
+        months.update(_add_months(current, offset) for offset in range(MONTHS_AHEAD + 1))
+
+        # 切り離してから月のパーティションを作成し、行を移す
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+        for month in sorted(months):
+            _create_partition(cursor, month)
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {DEFAULT_PARTITION}")
+        cursor.execute(f"DROP TABLE {DEFAULT_PARTITION}")
+
+
+def create_default_partition(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))", [TABLE])
+        if cursor.fetchone()[0]:
+            cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_imagethumbnail"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_default_partition, create_default_partition),
+    ]
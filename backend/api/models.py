@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 
@@ -15,20 +17,202 @@ class ObjectLabel(models.Model):
         return f"{self.id}: {self.name}"
 
 
+class AiAnalysisLogQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create では save() が呼ばれないため、処理時間はここで設定する
+        objs = list(objs)
+        for obj in objs:
+            obj.set_processing_time_ms()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class AiAnalysisLog(models.Model):
     image_path = models.CharField(max_length=255, null=True, blank=True)
     success = models.BooleanField()
     message = models.CharField(max_length=255, null=True, blank=True)
-    classification = models.IntegerField(null=True, blank=True)
+    # 既存の整数カラムをそのまま参照する（モック解析のクラスIDはラベルマスタに存在しない場合があるためDB制約なし）
+    classification = models.ForeignKey(
+        ObjectLabel,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_column='classification',
+        db_constraint=False,
+        db_index=False,  # (classification, created_at) の複合インデックスで代替
+        related_name='analysis_logs',
+    )
     confidence = models.DecimalField(
         max_digits=5, decimal_places=4, null=True, blank=True
     )
     request_timestamp = models.DateTimeField(null=True, blank=True)
     response_timestamp = models.DateTimeField(null=True, blank=True)
+    cache_hit = models.BooleanField(default=False)
+    # リクエスト受付から解析完了までの時間(ms)（登録時に request_timestamp・response_timestamp から設定）
+    processing_time_ms = models.IntegerField(null=True, blank=True)
+    # 並行モードでアップロードと解析を同時に実行したことによる短縮時間（直列実行時との差）
+    overlap_saved_ms = models.IntegerField(null=True, blank=True)
+    # 処理段階ごとの所要時間(ms)。例: {"cache_lookup": 1.2, "upload": 85.0, "analyze": 640.3}
+    stage_timings = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        db_table = 'ai_analysis_log'  # テーブル名指定
+        # テーブル名指定（PostgreSQLでは created_at の月単位でパーティション分割。api.partitions を参照）
+        db_table = 'ai_analysis_log'
+        indexes = [
+            # 新しい順の一覧・カーソルページネーション用
+            models.Index(fields=['created_at', 'id'], name='ai_log_created_id_idx'),
+            # 分類フィルタ + 新しい順用
+            models.Index(fields=['classification', 'created_at'], name='ai_log_class_created_idx'),
+            # 成否フィルタ + 新しい順用
+            models.Index(fields=['success', 'created_at'], name='ai_log_success_created_idx'),
+            # 失敗のみの一覧用（失敗は少数のため小さな部分インデックスで済む）
+            models.Index(fields=['created_at'], condition=models.Q(success=False),
+                         name='ai_log_failed_created_idx'),
+            # 処理時間・確信度の範囲フィルタと並べ替え用
+            models.Index(fields=['processing_time_ms'], condition=models.Q(processing_time_ms__isnull=False),
+                         name='ai_log_latency_idx'),
+            models.Index(fields=['confidence'], condition=models.Q(confidence__isnull=False),
+                         name='ai_log_confidence_idx'),
+        ]
+
+    objects = AiAnalysisLogQuerySet.as_manager()
 
     def __str__(self):
         return f"AI Analysis {self.id}: {self.image_path}"
+
+    def save(self, *args, **kwargs):
+        self.set_processing_time_ms()
+        super().save(*args, **kwargs)
+
+    def set_processing_time_ms(self) -> None:
+        """request_timestamp・response_timestamp から processing_time_ms を設定する"""
+        if self.request_timestamp and self.response_timestamp:
+            delta = self.response_timestamp - self.request_timestamp
+            self.processing_time_ms = int(delta.total_seconds() * 1000)
+        else:
+            self.processing_time_ms = None
+
+
+class ImageContentIndex(models.Model):
+    """画像コンテンツ(SHA-256)ごとの解析結果キャッシュ"""
+    digest = models.CharField(max_length=64, unique=True, verbose_name="SHA-256ダイジェスト")
+    storage_path = models.CharField(max_length=255, verbose_name="保存先パス")
+    public_url = models.CharField(max_length=255, verbose_name="公開URL")
+    classification = models.IntegerField(null=True, blank=True)
+    confidence = models.DecimalField(
+        max_digits=5, decimal_places=4, null=True, blank=True
+    )
+    # 64bit dHash（符号付きで保存）。類似画像の検索はプロセス内の索引で行う（api/perceptual_index.py）
+    perceptual_hash = models.BigIntegerField(null=True, blank=True, verbose_name="知覚ハッシュ")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="有効期限")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="登録日時")
+
+    class Meta:
+        db_table = 'image_content_index'
+        verbose_name = "画像コンテンツインデックス"
+        verbose_name_plural = "画像コンテンツインデックス"
+
+    def __str__(self):
+        return f"{self.digest[:12]}: {self.storage_path}"
+
+
+class AnalysisJob(models.Model):
+    """非同期解析ジョブ（DBをキューとして使用）"""
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', '待機中'
+        RUNNING = 'running', '処理中'
+        COMPLETED = 'completed', '完了'  # 解析ログを保存済み（解析結果の成否はログを参照）
+        FAILED = 'failed', '失敗'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.QUEUED, verbose_name="ステータス")
+    spool_path = models.CharField(max_length=255, verbose_name="一時保存パス")
+    original_name = models.CharField(max_length=255, verbose_name="元ファイル名")
+    digest = models.CharField(max_length=64, verbose_name="SHA-256ダイジェスト")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="試行回数")
+    message = models.CharField(max_length=255, null=True, blank=True)
+    # ai_analysis_log はPostgreSQLでは created_at でパーティション分割しており、
+    # 主キーが (id, created_at) になるためDB制約なし（ログのアーカイブ後は参照先が存在しない）
+    analysis_log = models.ForeignKey(
+        AiAnalysisLog, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        db_constraint=False)
+    request_timestamp = models.DateTimeField(verbose_name="受付日時")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="開始日時")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完了日時")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="登録日時")
+
+    class Meta:
+        db_table = 'analysis_jobs'
+        verbose_name = "解析ジョブ"
+        verbose_name_plural = "解析ジョブ"
+        indexes = [
+            # 待機中ジョブの取り出し用
+            models.Index(fields=['status', 'created_at'], name='analysis_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Analysis Job {self.id}: {self.status}"
+
+
+class ImageThumbnail(models.Model):
+    """保存した画像のログ一覧用サムネイル（生成タスクのキューを兼ねる）"""
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', '待機中'
+        RUNNING = 'running', '処理中'
+        COMPLETED = 'completed', '完了'
+        FAILED = 'failed', '失敗'
+
+    # キャッシュヒットしたログは以前の画像を参照するため、元画像の公開URL(AiAnalysisLog.image_path)ごとに1件
+    source_url = models.CharField(max_length=255, unique=True, verbose_name="元画像の公開URL")
+    storage_path = models.CharField(max_length=255, verbose_name="元画像の保存先パス")
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.QUEUED, verbose_name="ステータス")
+    urls = models.JSONField(default=dict, verbose_name="サムネイルURL")  # {'128': url, '512': url}
+    attempts = models.PositiveIntegerField(default=0, verbose_name="試行回数")
+    message = models.CharField(max_length=255, null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="開始日時")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完了日時")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="登録日時")
+
+    class Meta:
+        db_table = 'image_thumbnails'
+        verbose_name = "サムネイル"
+        verbose_name_plural = "サムネイル"
+        indexes = [
+            # 待機中タスクの取り出し用
+            models.Index(fields=['status', 'created_at'], name='image_thumbnail_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Thumbnail {self.source_url}: {self.status}"
+
+
+class AnalysisHourlyRollup(models.Model):
+    """AiAnalysisLog の1時間・分類ごとの集計（/api/stats/ 用）"""
+
+    # 分類なし（解析失敗）の集計に使う分類ID
+    NO_CLASSIFICATION = 0
+
+    hour = models.DateTimeField(verbose_name="集計時間帯")  # 作成日時を1時間単位で切り捨てた値
+    classification = models.IntegerField(verbose_name="分類ID")  # 分類なしは NO_CLASSIFICATION
+    total_count = models.PositiveIntegerField(default=0, verbose_name="件数")
+    success_count = models.PositiveIntegerField(default=0, verbose_name="成功件数")
+    cache_hit_count = models.PositiveIntegerField(default=0, verbose_name="キャッシュヒット件数")
+    # 処理時間(ms)の分布（api.sketch.LatencySketch.to_dict() の形式）
+    processing_time_sketch = models.JSONField(default=dict, verbose_name="処理時間の分布")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    class Meta:
+        db_table = 'analysis_hourly_rollups'
+        verbose_name = "解析ログ集計（1時間単位）"
+        verbose_name_plural = "解析ログ集計（1時間単位）"
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'classification'], name='analysis_rollup_hour_class_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} class {self.classification}: {self.total_count}"
@@ -0,0 +1,134 @@
+"""
+ログ一覧用のキーセット(カーソル)ページネーション
+
+OFFSETとCOUNT(*)を使わず、(created_at, id) の複合インデックスを
+範囲スキャンするため、テーブルが大きくなってもページ取得コストが一定になる。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db import connection
+from django.db.models import Q
+
+
+def encode_cursor(created_at: datetime, log_id: int) -> str:
+    """(created_at, id) を不透明なカーソル文字列にエンコードする"""
+    raw = f"{created_at.isoformat()}|{log_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    カーソル文字列を (created_at, id) にデコードする
+
+    Raises:
+        ValueError: 不正なカーソルの場合
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, log_id = base64.urlsafe_b64decode(
+            padded).decode().split('|')
+        return datetime.fromisoformat(created_at), int(log_id)
+    except Exception:
+        raise ValueError(f'invalid cursor: {cursor}')
+
+
+def paginate_by_cursor(queryset, cursor: Optional[str], page_size: int) -> Tuple[List, Optional[str]]:
+    """
+    新しい順(created_at DESC, id DESC)でカーソル以降の1ページを取得する
+
+    Args:
+        queryset: フィルタ済みのAiAnalysisLogクエリセット
+        cursor: 前ページの next_cursor（先頭ページは空文字またはNone）
+        page_size: 1ページあたりの件数
+
+    Returns:
+        (ページのログ一覧, 次ページのカーソル。最終ページの場合はNone)
+    """
+    # 1件多く取得して次ページの有無を判定
+    logs = list(_cursor_queryset(queryset, cursor)[:page_size + 1])
+    return _split_page(logs, page_size)
+
+
+async def apaginate_by_cursor(queryset, cursor: Optional[str], page_size: int) -> Tuple[List, Optional[str]]:
+    """paginate_by_cursor の非同期版（非同期ORMで取得する）"""
+    logs = [log async for log in _cursor_queryset(queryset, cursor)[:page_size + 1]]
+    return _split_page(logs, page_size)
+
+
+def _cursor_queryset(queryset, cursor: Optional[str]):
+    """カーソル以降を新しい順に取得するクエリセットを生成する"""
+    queryset = queryset.order_by('-created_at', '-id')
+
+    if cursor:
+        created_at, log_id = decode_cursor(cursor)
+        # created_at__lte はOR条件と同値だが、パーティション分割時にカーソルより新しい月を走査対象から外すために付ける
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=log_id),
+            created_at__lte=created_at)
+
+    return queryset
+
+
+def _split_page(logs: List, page_size: int) -> Tuple[List, Optional[str]]:
+    """page_size + 1 件の取得結果をページと次ページのカーソルに分ける"""
+    if len(logs) <= page_size:
+        return logs, None
+
+    logs = logs[:page_size]
+    last = logs[-1]
+    return logs, encode_cursor(last.created_at, last.id)
+
+
+def estimate_count(queryset) -> Optional[int]:
+    """
+    クエリセットの件数をテーブル全走査なしで概算する（PostgreSQLのみ）
+
+    フィルタなしの場合は pg_class.reltuples、フィルタありの場合は
+    プランナーの推定行数を使う。PostgreSQL以外ではNoneを返す。
+    reltuples が得られない（ANALYZEされていない）場合は正確な件数を数える。
+    """
+    if connection.vendor != 'postgresql':
+        return None
+
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            estimate = _estimate_table_rows(cursor, queryset.model._meta.db_table)
+            return estimate if estimate is not None else queryset.count()
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _estimate_table_rows(cursor, table: str) -> Optional[int]:
+    """
+    テーブルの推定行数（pg_class.reltuples）
+
+    パーティションテーブルは親の reltuples が自動では更新されないため、子パーティションの合計を使う。
+    一度もANALYZEされていないテーブルは -1 になるため、空のもの（先の月のパーティションなど）は0件とし、
+    行があるものが含まれる場合はNoneを返す。
+    """
+    cursor.execute(
+        "SELECT c.reltuples, pg_relation_size(c.oid) FROM pg_class c "
+        "WHERE c.oid = %s::regclass AND c.relkind <> 'p' "
+        "UNION ALL "
+        "SELECT c.reltuples, pg_relation_size(c.oid) FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = %s::regclass",
+        [table, table])
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+
+    total = 0
+    for reltuples, size in rows:
+        if reltuples >= 0:
+            total += reltuples
+        elif size:
+            return None
+    return int(total)
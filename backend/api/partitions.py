@@ -0,0 +1,132 @@
+"""
+ai_analysis_log の月単位パーティション（PostgreSQLのみ）
+
+created_at の範囲で月ごとのパーティション（ai_analysis_log_pYYYY_MM）に分割する。
+新しい順の一覧やカーソルページネーションは直近のパーティションのみを走査し、
+古いパーティションは archive_analysis_logs コマンドで保存先へ書き出してから削除する。
+
+defaultパーティションは作らない（範囲の上限がないパーティションがあると、新しい順の一覧で月のパーティションを
+順に読む ordered Append や created_at の範囲による除外が効かなくなる）。そのため作成済みの範囲外の行は
+INSERTが失敗する。gunicornのワーカー・解析ワーカーの起動時と archive_analysis_logs コマンドで
+ANALYSIS_LOG_PARTITION_MONTHS_AHEAD か月先までのパーティションを作成しておく。
+"""
+import re
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone as django_timezone
+
+from .models import AiAnalysisLog
+
+TABLE_NAME = AiAnalysisLog._meta.db_table
+
+_PARTITION_NAME_PATTERN = re.compile(rf'^{TABLE_NAME}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(value: datetime) -> datetime:
+    """月初(UTC)に切り捨てる"""
+    return value.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f'{TABLE_NAME}_p{month:%Y_%m}'
+
+
+def is_partitioned() -> bool:
+    """ai_analysis_log がパーティションテーブルかどうか"""
+    if connection.vendor != 'postgresql':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+            [TABLE_NAME])
+        return cursor.fetchone()[0]
+
+
+def list_partitions() -> List[Tuple[str, datetime, datetime]]:
+    """
+    月単位のパーティションを古い順に返す
+
+    Returns:
+        [(パーティション名, 範囲の開始, 範囲の終了), ...]
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [TABLE_NAME])
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME_PATTERN.match(name)
+        if match:
+            start = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+            partitions.append((name, start, add_months(start, 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_month_partition(month: datetime) -> str:
+    """month の月のパーティションを作成する（作成済みの場合は何もしない）"""
+    name = partition_name(month)
+    qn = connection.ops.quote_name
+
+    with connection.cursor() as cursor:
+        # 複数のワーカーが同時に起動しても失敗しないよう IF NOT EXISTS を付ける
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(TABLE_NAME)} FOR VALUES FROM (%s) TO (%s)",
+            [month, add_months(month, 1)])
+    return name
+
+
+def ensure_partitions(months_ahead: int, now: datetime) -> List[str]:
+    """
+    今月から months_ahead か月先までのパーティションを作成する
+
+    Returns:
+        作成したパーティション名
+    """
+    existing = {name for name, _, _ in list_partitions()}
+    current = month_start(now)
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if partition_name(month) not in existing:
+            created.append(create_month_partition(month))
+    return created
+
+
+def ensure_upcoming_partitions() -> List[str]:
+    """
+    パーティション分割している場合に、今月から ANALYSIS_LOG_PARTITION_MONTHS_AHEAD か月先までのパーティションを作成する
+    （gunicornのワーカー・解析ワーカーの起動時に呼び出す）
+
+    Returns:
+        作成したパーティション名
+    """
+    if not is_partitioned():
+        return []
+    return ensure_partitions(settings.ANALYSIS_LOG_PARTITION_MONTHS_AHEAD, django_timezone.now())
+
+
+def count_partition_rows(name: str) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {connection.ops.quote_name(name)}")
+        return cursor.fetchone()[0]
+
+
+def drop_partition(name: str) -> None:
+    """パーティションを切り離して削除する"""
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(TABLE_NAME)} DETACH PARTITION {qn(name)}")
+        cursor.execute(f"DROP TABLE {qn(name)}")
@@ -0,0 +1,173 @@
+"""
+知覚ハッシュ(64bit dHash)のプロセス内索引
+
+解析結果キャッシュ(ImageContentIndex)のうち知覚ハッシュを持つエントリを multi-index hashing で保持し、
+ハミング距離が閾値以下のエントリを全件走査せずに検索する。
+
+索引はワーカープロセスごとに保持し、他のプロセスで登録されたエントリは
+NEAR_DUPLICATE_INDEX_REFRESH_SECONDS ごとにIDの続きから読み込む。削除には対応しないため、
+有効期限切れのエントリは検索結果をDBで確認する際に除外し、NEAR_DUPLICATE_INDEX_REBUILD_SECONDS ごとに作り直す。
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+from itertools import combinations
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+_SIGN_BIT = 1 << (HASH_BITS - 1)
+_MASK = (1 << HASH_BITS) - 1
+
+# multi-index hashing の分割数（16bit x 4）
+_CHUNKS = 4
+_CHUNK_BITS = HASH_BITS // _CHUNKS
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+
+
+def to_signed(value: int) -> int:
+    """符号なし64bitのハッシュをDBの BigIntegerField に保存できる値に変換する"""
+    return value - (1 << HASH_BITS) if value & _SIGN_BIT else value
+
+
+def to_unsigned(value: int) -> int:
+    return value & _MASK
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """
+    ハミング距離の multi-index hashing
+
+    64bitのハッシュを16bitずつ4つに分け、それぞれの値をキーにしたハッシュテーブルに登録する。
+    距離が r 以下なら、鳩の巣原理によりいずれかの16bitの距離は r // 4 以下になるため、
+    各テーブルで r // 4 bit以内の値のバケットのみを引き、候補の距離を確認すればよい。
+    """
+
+    def __init__(self):
+        self._tables = [{} for _ in range(_CHUNKS)]
+        self._values = {}  # 要素 -> ハッシュ
+
+    def add(self, value: int, item) -> None:
+        if item in self._values:
+            return
+        self._values[item] = value
+        for table, chunk in zip(self._tables, _chunks(value)):
+            table.setdefault(chunk, []).append(item)
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, object]]:
+        """距離が max_distance 以下の要素を距離の近い順に返す: [(距離, 要素), ...]"""
+        masks = _flip_masks(max_distance // _CHUNKS)
+        candidates = set()
+        for table, chunk in zip(self._tables, _chunks(value)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+
+        results = []
+        for item in candidates:
+            distance = hamming_distance(value, self._values[item])
+            if distance <= max_distance:
+                results.append((distance, item))
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def __len__(self):
+        return len(self._values)
+
+
+def _chunks(value: int) -> List[int]:
+    return [(value >> (_CHUNK_BITS * index)) & _CHUNK_MASK for index in range(_CHUNKS)]
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius: int) -> Tuple[int, ...]:
+    """16bitのうち radius bit以下を反転するマスクの一覧"""
+    return tuple(
+        sum(1 << bit for bit in bits)
+        for count in range(radius + 1)
+        for bits in combinations(range(_CHUNK_BITS), count))
+
+
+class PerceptualHashIndex:
+    """ImageContentIndex の知覚ハッシュの索引（スレッドセーフ）"""
+
+    def __init__(self, refresh_seconds: float, rebuild_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self._index = MultiIndexHash()
+        self._last_id = 0
+        self._refreshed_at: Optional[float] = None
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def search(self, perceptual_hash: int, max_distance: int) -> List[Tuple[int, int]]:
+        """
+        距離が max_distance 以下のエントリを距離の近い順に返す（有効期限切れを含む場合がある）
+
+        Returns:
+            [(ハミング距離, ImageContentIndexのID), ...]
+        """
+        self._refresh()
+        with self._lock:
+            return self._index.search(to_unsigned(perceptual_hash), max_distance)
+
+    def add(self, entry_id: int, perceptual_hash: int) -> None:
+        """このプロセスで登録したエントリを追加する（他のプロセスの分は読み込み時に追加される）"""
+        with self._lock:
+            # 未構築の場合は初回の検索時に読み込む（読み込み済みのエントリは重複して追加されない）
+            if self._built_at is not None:
+                self._index.add(to_unsigned(perceptual_hash), entry_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._index = MultiIndexHash()
+            self._last_id = 0
+            self._refreshed_at = None
+            self._built_at = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._built_at is None or now - self._built_at >= self.rebuild_seconds:
+                self._index = MultiIndexHash()
+                self._last_id = 0
+                self._built_at = now
+            elif now - self._refreshed_at < self.refresh_seconds:
+                return
+            self._refreshed_at = now
+            loaded = self._load()
+
+        if loaded:
+            logger.debug('Perceptual hash index refreshed', extra={'loaded': loaded, 'entries': len(self)})
+
+    def _load(self) -> int:
+        """読み込み済みのIDより新しい有効期限内のエントリを読み込む（ロックを保持して呼び出す）"""
+        from .models import ImageContentIndex
+
+        entries = ImageContentIndex.objects.filter(
+            id__gt=self._last_id, perceptual_hash__isnull=False, expires_at__gt=timezone.now(),
+        ).order_by('id').values_list('id', 'perceptual_hash')
+
+        loaded = 0
+        for entry_id, perceptual_hash in entries.iterator(chunk_size=10000):
+            self._index.add(to_unsigned(perceptual_hash), entry_id)
+            self._last_id = entry_id
+            loaded += 1
+        return loaded
+
+
+perceptual_index = PerceptualHashIndex(
+    settings.NEAR_DUPLICATE_INDEX_REFRESH_SECONDS, settings.NEAR_DUPLICATE_INDEX_REBUILD_SECONDS)
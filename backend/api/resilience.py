@@ -0,0 +1,215 @@
+"""
+解析バックエンド呼び出しの障害対策
+
+- RetryPolicy: 再試行可能なエラーを指数バックオフ（full jitter）で再試行する
+- CircuitBreaker: 直近の呼び出しの失敗率が閾値を超えたら一定時間呼び出しを遮断し、即座に失敗させる
+- ConcurrencyLimiter: プロセス内で同時に実行する呼び出し数の上限
+
+組み合わせて使うのは analyzers.ResilientAnalyzer。時計・乱数は差し替え可能で、
+ローカルの代替実装(LocalStandInAnalyzer)の障害注入と合わせてテストできる。
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from google.api_core import exceptions as google_exceptions
+
+from .metrics import record_analyzer_in_flight, record_circuit_state
+
+logger = logging.getLogger(__name__)
+
+# 再試行するエラー（サーバー側・通信の一時的な障害）。不正な画像などのクライアント側のエラーは再試行しない
+RETRYABLE_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.Aborted,
+    asyncio.TimeoutError,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+class AnalyzerUnavailableError(Exception):
+    """呼び出しを行わずに失敗させた場合の例外"""
+
+
+class CircuitOpenError(AnalyzerUnavailableError):
+    """サーキットブレーカーが遮断中"""
+
+
+class ConcurrencyLimitError(AnalyzerUnavailableError):
+    """同時実行数の上限に達し、待機時間内に空きがなかった"""
+
+
+def is_retryable(error: Exception) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class RetryPolicy:
+    """指数バックオフ（full jitter）の再試行ポリシー"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float, rng: random.Random = None):
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = rng or random.Random()
+
+    def backoff(self, attempt: int) -> float:
+        """attempt 回目の失敗後の待機時間(秒)（0〜base_delay * 2^(attempt-1) の一様分布、max_delay が上限）"""
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    失敗率によるサーキットブレーカー
+
+    - closed: 直近 window 回の結果のうち失敗の割合が failure_rate 以上（min_calls 回以上の場合）で open へ
+    - open: open_seconds の間は呼び出しを遮断し、経過後は half_open へ
+    - half_open: 1件だけ試行し、成功すれば closed、失敗すれば再び open へ
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_rate: float, window: int, min_calls: int, open_seconds: float,
+                 enabled: bool = True, clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.enabled = enabled
+        self.clock = clock
+        self._outcomes = deque(maxlen=window)  # True: 失敗
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def before_call(self) -> None:
+        """呼び出し前に確認する（遮断中は CircuitOpenError）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN or (state == self.HALF_OPEN and self._probing):
+                raise CircuitOpenError(f'{self.name} circuit breaker is open')
+            if state == self.HALF_OPEN:
+                self._probing = True
+
+    def record_success(self) -> None:
+        self._record(failed=False)
+
+    def record_failure(self) -> None:
+        self._record(failed=True)
+
+    def cancel_call(self) -> None:
+        """before_call 後に呼び出しを行わなかった・中断した場合に呼ぶ（half_open の試行枠を戻す）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._probing = False
+
+    def _record(self, failed: bool) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._current_state()
+            if state == self.HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open()
+                else:
+                    self._outcomes.clear()
+                    self._transition(self.CLOSED)
+            elif state == self.CLOSED:
+                self._outcomes.append(failed)
+                calls = len(self._outcomes)
+                if calls >= self.min_calls and sum(self._outcomes) / calls >= self.failure_rate:
+                    self._open()
+            # open の間に返ってきた遮断前の呼び出しの結果は集計しない
+
+    def _current_state(self) -> str:
+        """ロックを保持して呼び出す"""
+        if self._state == self.OPEN and self.clock() - self._opened_at >= self.open_seconds:
+            self._transition(self.HALF_OPEN)
+        return self._state
+
+    def _open(self) -> None:
+        self._opened_at = self.clock()
+        self._transition(self.OPEN)
+
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        logger.warning('Circuit breaker state changed', extra={
+            'analyzer': self.name, 'from_state': self._state, 'to_state': state,
+            'failures': sum(self._outcomes), 'calls': len(self._outcomes)})
+        self._state = state
+        record_circuit_state(self.name, state)
+
+
+class ConcurrencyLimiter:
+    """
+    プロセス内の同時実行数の上限（limit が0の場合は上限なし）
+
+    同期ビューのスレッドと非同期ビューのイベントループの両方から使えるよう、
+    threading のロックで数を管理し、非同期版の待機は短い間隔で空きを確認する。
+    """
+
+    # 非同期版で空きを確認する間隔(秒)
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._active = 0
+        self._condition = threading.Condition()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            return self._try_acquire()
+
+    def acquire(self, timeout: float) -> bool:
+        """空きができるまで最大 timeout 秒待機する（取得できなかった場合はFalse）"""
+        with self._condition:
+            # wait_for は条件が成立するまで _try_acquire を呼び直すため、成立した時点で取得済みになる
+            return self._condition.wait_for(self._try_acquire, max(timeout, 0))
+
+    async def aacquire(self, timeout: float, sleep=asyncio.sleep, clock=time.monotonic) -> bool:
+        """acquire の非同期版"""
+        deadline = clock() + timeout
+        while not self.try_acquire():
+            if clock() >= deadline:
+                return False
+            await sleep(self.POLL_INTERVAL)
+        return True
+
+    def release(self) -> None:
+        with self._condition:
+            self._active -= 1
+            record_analyzer_in_flight(self.name, self._active)
+            self._condition.notify()
+
+    def _try_acquire(self) -> bool:
+        """ロックを保持して呼び出す"""
+        if self.limit and self._active >= self.limit:
+            return False
+        self._active += 1
+        record_analyzer_in_flight(self.name, self._active)
+        return True
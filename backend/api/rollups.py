@@ -0,0 +1,393 @@
+"""
+解析ログの1時間単位の集計（ロールアップ）
+
+ANALYSIS_ROLLUP_MODE の設定で更新方法を切り替える。
+- incremental: ログの登録ごとに該当時間帯・分類の集計行へ加算する
+  - 1件ずつの登録（post_save シグナル）は、同じ集計行の行ロックで同時の登録が直列化しないよう、
+    コミット後にプロセス内で時間帯・分類ごとにまとめ、ANALYSIS_ROLLUP_FLUSH_INTERVAL_MS ごとに反映する
+    （反映は間隔が経った後の登録時・集計APIの参照時・ワーカーの終了時と、
+    gunicornのワーカー・解析ワーカーではバックグラウンドのスレッドで間隔ごとに行う）
+  - bulk_create で一括登録したログは呼び出し側でまとめて反映する
+- compaction: 登録時は何もせず、compact_analysis_rollups コマンドで定期的にログから再集計する
+
+/api/stats/ は集計行のみを参照するため、ログテーブルの件数に関係なく
+期間内の時間数 × 分類数 の行数で応答できる。
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import (IntegrityError, close_old_connections, connection,
+                       transaction)
+
+from .models import AiAnalysisLog, AnalysisHourlyRollup
+from .sketch import LatencySketch
+
+logger = logging.getLogger(__name__)
+
+
+class RollupDelta:
+    """1つの集計行に加算する値"""
+
+    def __init__(self):
+        self.total_count = 0
+        self.success_count = 0
+        self.cache_hit_count = 0
+        self.sketch = LatencySketch()
+
+    def add(self, success: bool, cache_hit: bool, processing_time_ms) -> None:
+        self.total_count += 1
+        self.success_count += int(bool(success))
+        self.cache_hit_count += int(bool(cache_hit))
+        if processing_time_ms is not None:
+            self.sketch.add(processing_time_ms)
+
+    def merge(self, other: 'RollupDelta') -> None:
+        self.total_count += other.total_count
+        self.success_count += other.success_count
+        self.cache_hit_count += other.cache_hit_count
+        self.sketch.merge(other.sketch)
+
+
+def truncate_to_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def processing_time_ms(request_timestamp, response_timestamp):
+    """リクエスト受付から解析完了までの時間(ms)（どちらかの時刻がない場合はNone）"""
+    if request_timestamp is None or response_timestamp is None:
+        return None
+    return max((response_timestamp - request_timestamp).total_seconds() * 1000, 0.0)
+
+
+def build_rollup_deltas(rows: Iterable[Tuple]) -> Dict[Tuple[datetime, int], RollupDelta]:
+    """
+    ログを時間帯・分類ごとにまとめる
+
+    Args:
+        rows: (created_at, classification_id, success, cache_hit, request_timestamp, response_timestamp) のタプル
+    """
+    deltas = defaultdict(RollupDelta)
+    for created_at, classification_id, success, cache_hit, request_timestamp, response_timestamp in rows:
+        key = (truncate_to_hour(created_at), classification_id or AnalysisHourlyRollup.NO_CLASSIFICATION)
+        deltas[key].add(success, cache_hit, processing_time_ms(request_timestamp, response_timestamp))
+    return deltas
+
+
+def update_hourly_rollups(logs: List[AiAnalysisLog]) -> None:
+    """
+    登録したログを集計行に加算する（ANALYSIS_ROLLUP_MODE=compaction の場合は何もしない）
+
+    bulk_create では post_save シグナルが送られないため、一括登録した場合はこの関数を呼び出す。
+    """
+    if settings.ANALYSIS_ROLLUP_MODE != 'incremental' or not logs:
+        return
+    apply_rollup_deltas(_log_deltas(logs))
+
+
+def accumulate_hourly_rollups(logs: List[AiAnalysisLog]) -> None:
+    """
+    コミット済みのログの加算をプロセス内に溜める（ANALYSIS_ROLLUP_MODE=compaction の場合は何もしない）
+
+    1件ずつ登録したログ用（post_save シグナルからコミット後に呼び出す）。
+    """
+    if settings.ANALYSIS_ROLLUP_MODE != 'incremental' or not logs:
+        return
+    get_rollup_accumulator().add(logs)
+
+
+def apply_rollup_deltas(deltas: Dict[Tuple[datetime, int], RollupDelta]) -> None:
+    """時間帯・分類ごとの加算を集計行に反映する"""
+    with transaction.atomic():
+        # 同時に更新するリクエスト間でデッドロックしないよう、常に同じ順序で行ロックを取る
+        for (hour, classification), delta in sorted(deltas.items(), key=lambda item: item[0]):
+            _apply_delta(hour, classification, delta)
+
+
+def _log_deltas(logs: List[AiAnalysisLog]) -> Dict[Tuple[datetime, int], RollupDelta]:
+    return build_rollup_deltas(
+        (log.created_at, log.classification_id, log.success, log.cache_hit,
+         log.request_timestamp, log.response_timestamp)
+        for log in logs)
+
+
+def _apply_delta(hour: datetime, classification: int, delta: RollupDelta) -> None:
+    rollups = AnalysisHourlyRollup.objects.select_for_update()
+    rollup = rollups.filter(hour=hour, classification=classification).first()
+
+    if rollup is None:
+        try:
+            # 同じ時間帯・分類の行を別のリクエストが先に作成した場合は、その行に加算し直す
+            with transaction.atomic():
+                AnalysisHourlyRollup.objects.create(
+                    hour=hour,
+                    classification=classification,
+                    total_count=delta.total_count,
+                    success_count=delta.success_count,
+                    cache_hit_count=delta.cache_hit_count,
+                    processing_time_sketch=delta.sketch.to_dict(),
+                )
+            return
+        except IntegrityError:
+            rollup = rollups.get(hour=hour, classification=classification)
+
+    sketch = LatencySketch.from_dict(rollup.processing_time_sketch)
+    sketch.merge(delta.sketch)
+
+    rollup.total_count += delta.total_count
+    rollup.success_count += delta.success_count
+    rollup.cache_hit_count += delta.cache_hit_count
+    rollup.processing_time_sketch = sketch.to_dict()
+    rollup.save(update_fields=[
+        'total_count', 'success_count', 'cache_hit_count', 'processing_time_sketch', 'updated_at'])
+
+
+class RollupAccumulator:
+    """
+    ログの加算をプロセス内で時間帯・分類ごとにまとめ、flush_interval 秒ごとに集計行へ反映する（スレッドセーフ）
+
+    反映は間隔が経った後の add を呼び出したスレッドが行う（反映中の別スレッドがあれば待たない）。
+    start() でバックグラウンドのスレッドを開始すると、登録がない間も間隔ごとに反映する。
+    """
+
+    def __init__(self, flush_interval: float, clock=time.monotonic):
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._deltas = defaultdict(RollupDelta)
+        self._flushed_at = clock()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._closed = False
+
+    def add(self, logs: List[AiAnalysisLog]) -> None:
+        deltas = _log_deltas(logs)
+        with self._lock:
+            for key, delta in deltas.items():
+                self._deltas[key].merge(delta)
+            due = self.clock() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush(blocking=False)
+
+    def flush(self, blocking: bool = True) -> int:
+        """
+        溜まっている加算を集計行に反映する
+
+        反映に失敗した加算は溜め直し、次回の反映で再試行する（時間帯・分類ごとにまとめるためメモリは増え続けない）。
+
+        Returns:
+            反映した集計行の数
+        """
+        if not self._flush_lock.acquire(blocking=blocking):
+            return 0
+        try:
+            with self._lock:
+                deltas, self._deltas = self._deltas, defaultdict(RollupDelta)
+                self._flushed_at = self.clock()
+            if not deltas:
+                return 0
+
+            try:
+                apply_rollup_deltas(deltas)
+            except Exception:
+                with self._lock:
+                    for key, delta in deltas.items():
+                        self._deltas[key].merge(delta)
+                logger.exception('Hourly rollup flush failed', extra={'rollups': len(deltas)})
+                return 0
+        finally:
+            self._flush_lock.release()
+
+        logger.debug('Hourly rollups flushed', extra={'rollups': len(deltas)})
+        return len(deltas)
+
+    def start(self) -> None:
+        """flush_interval 秒ごとに反映するバックグラウンドのスレッドを開始する"""
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(
+                    target=self._run, name='analysis-rollup-flusher', daemon=True)
+                self._thread.start()
+
+    def close(self) -> None:
+        """バックグラウンドの反映を止め、残りの加算を反映する"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=max(self.flush_interval * 2, 5))
+        self.flush()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                with self._lock:
+                    if not self._closed:
+                        self._wakeup.wait(self.flush_interval)
+                    if self._closed:
+                        break
+                close_old_connections()
+                self.flush(blocking=False)
+        finally:
+            connection.close()  # スレッドのDB接続を解放
+
+
+_accumulator: Optional[RollupAccumulator] = None
+_accumulator_lock = threading.Lock()
+
+
+def get_rollup_accumulator() -> RollupAccumulator:
+    """プロセスごとの RollupAccumulator を返す"""
+    global _accumulator
+    with _accumulator_lock:
+        if _accumulator is None:
+            _accumulator = RollupAccumulator(settings.ANALYSIS_ROLLUP_FLUSH_INTERVAL_MS / 1000)
+        return _accumulator
+
+
+def flush_hourly_rollups() -> int:
+    """プロセス内に溜まっている加算を集計行に反映する（集計APIの参照前に呼び出す）"""
+    if _accumulator is None:
+        return 0
+    return _accumulator.flush()
+
+
+def start_hourly_rollup_flusher() -> None:
+    """加算を間隔ごとに反映するスレッドを開始する（登録がないまま加算が残らないよう、ワーカーの起動時に呼び出す）"""
+    get_rollup_accumulator().start()
+
+
+def close_hourly_rollups() -> None:
+    """ワーカーの終了時に反映のスレッドを止め、残りの加算を反映する"""
+    global _accumulator
+    with _accumulator_lock:
+        accumulator, _accumulator = _accumulator, None
+    if accumulator is not None:
+        accumulator.close()
+
+
+def _reset_after_fork() -> None:
+    # 親プロセスで溜めた加算を子プロセスで二重に反映しない
+    global _accumulator, _accumulator_lock
+    _accumulator = None
+    _accumulator_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def rebuild_hourly_rollups(start: datetime, end: datetime) -> int:
+    """
+    [start, end) の時間帯の集計行をログから作り直す
+
+    Args:
+        start, end: 1時間単位に切り捨て済みの日時
+
+    Returns:
+        作成した集計行の数
+    """
+    created = 0
+    hour = start
+    while hour < end:
+        next_hour = hour + timedelta(hours=1)
+        rows = (AiAnalysisLog.objects
+                .filter(created_at__gte=hour, created_at__lt=next_hour)
+                .values_list('created_at', 'classification_id', 'success', 'cache_hit',
+                             'request_timestamp', 'response_timestamp')
+                .iterator(chunk_size=10_000))
+
+        with transaction.atomic():
+            # 加算中の行を待ってから作り直す（ログを読み込む前にロックする）
+            list(AnalysisHourlyRollup.objects.select_for_update().filter(hour=hour).values_list('id'))
+            deltas = build_rollup_deltas(rows)
+            AnalysisHourlyRollup.objects.filter(hour=hour).delete()
+            AnalysisHourlyRollup.objects.bulk_create([
+                AnalysisHourlyRollup(
+                    hour=hour,
+                    classification=classification,
+                    total_count=delta.total_count,
+                    success_count=delta.success_count,
+                    cache_hit_count=delta.cache_hit_count,
+                    processing_time_sketch=delta.sketch.to_dict(),
+                )
+                for (_, classification), delta in sorted(deltas.items(), key=lambda item: item[0])
+            ])
+
+        created += len(deltas)
+        hour = next_hour
+
+    logger.info('Hourly rollups rebuilt', extra={
+        'start': start.isoformat(), 'end': end.isoformat(), 'rollups': created})
+    return created
+
+
+# RollupSummary.add に渡す集計行の項目（values_list で取得する）
+ROLLUP_SUMMARY_FIELDS = (
+    'classification', 'total_count', 'success_count', 'cache_hit_count', 'processing_time_sketch')
+
+
+class RollupSummary:
+    """集計行をまとめた件数・処理時間の分布・分類ごとの件数"""
+
+    def __init__(self):
+        self.total_count = 0
+        self.success_count = 0
+        self.cache_hit_count = 0
+        self.sketch = LatencySketch()
+        self.classes = defaultdict(int)
+
+    def add(self, classification: int, total_count: int, success_count: int, cache_hit_count: int,
+            processing_time_sketch: Dict) -> None:
+        """集計行（ROLLUP_SUMMARY_FIELDS の順の値）を加える"""
+        self.total_count += total_count
+        self.success_count += success_count
+        self.cache_hit_count += cache_hit_count
+        self.sketch.merge_dict(processing_time_sketch)
+        if classification != AnalysisHourlyRollup.NO_CLASSIFICATION:
+            self.classes[classification] += success_count
+
+    def merge(self, other: 'RollupSummary') -> None:
+        self.total_count += other.total_count
+        self.success_count += other.success_count
+        self.cache_hit_count += other.cache_hit_count
+        self.sketch.merge(other.sketch)
+        for classification, count in other.classes.items():
+            self.classes[classification] += count
+
+    def as_dict(self) -> Dict:
+        """
+        Returns:
+            {
+                'total_count': int,
+                'success_count': int,
+                'success_rate': float,  # 0件の場合はNone
+                'cache_hit_count': int,
+                'processing_time_ms': {'count': int, 'p50': float, 'p95': float, 'p99': float},
+                'classes': {分類ID: 件数}  # 分類なし（解析失敗）は含めない
+            }
+        """
+        p50, p95, p99 = self.sketch.quantiles([0.5, 0.95, 0.99])
+        return {
+            'total_count': self.total_count,
+            'success_count': self.success_count,
+            'success_rate': round(self.success_count / self.total_count, 4) if self.total_count else None,
+            'cache_hit_count': self.cache_hit_count,
+            'processing_time_ms': {
+                'count': self.sketch.count,
+                'p50': _round_ms(p50),
+                'p95': _round_ms(p95),
+                'p99': _round_ms(p99),
+            },
+            'classes': dict(self.classes),
+        }
+
+
+def _round_ms(value):
+    return round(value, 1) if value is not None else None
@@ -1,40 +1,37 @@
 from rest_framework import serializers
 
-from .models import AiAnalysisLog, ObjectLabel
+from .models import AiAnalysisLog
 
 
 class AiAnalysisLogListSerializer(serializers.ModelSerializer):
     """AI分析ログ一覧用のシリアライザー"""
 
-    processing_time_ms = serializers.SerializerMethodField()
     classification_name = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = AiAnalysisLog
         fields = [
             'id',
             'image_path',
+            'thumbnails',
             'success',
             'classification',
             'classification_name',
             'confidence',
             'processing_time_ms',
+            'stage_timings',
             'created_at'
         ]
 
-    def get_processing_time_ms(self, obj):
-        """処理時間を計算してミリ秒で返す"""
-        if obj.request_timestamp and obj.response_timestamp:
-            delta = obj.response_timestamp - obj.request_timestamp
-            return int(delta.total_seconds() * 1000)
-        return None
-
     def get_classification_name(self, obj):
-        """分類名を取得"""
-        if obj.classification:
-            try:
-                label = ObjectLabel.objects.get(id=obj.classification)
-                return label.name
-            except ObjectLabel.DoesNotExist:
-                return f"クラス {obj.classification}"
+        """分類名を取得（select_relatedで取得済みのラベルを参照）"""
+        if obj.classification_id:
+            if obj.classification is not None:
+                return obj.classification.name
+            return f"クラス {obj.classification_id}"
         return None
+
+    def get_thumbnails(self, obj):
+        """サイズごとのサムネイルURL（context の thumbnail_urls を参照、未生成の場合はNone）"""
+        return self.context.get('thumbnail_urls', {}).get(obj.image_path)
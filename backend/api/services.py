@@ -1,65 +1,82 @@
 """
-Google Cloud Vision API サービス
+画像の保存・Google Cloud Vision API による解析サービス
 """
+import hashlib
+import io
+import logging
+import math
 import os
 import uuid
-from datetime import datetime
-from typing import Dict, Union
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
-from google.cloud import storage, vision
-from PIL import Image
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from google.cloud import vision
+from PIL import Image, ImageOps
 
+from .clients import cloud_clients
+from .label_cache import get_or_create_label_id
+from .metrics import record_cache_lookup, record_near_duplicate_lookup
+from .perceptual_index import perceptual_index, to_signed
+from .storage import get_storage_backend
+from .timing import stage
 
-def upload_image_to_gcs(image_file, bucket_name: str = None) -> Dict:
+logger = logging.getLogger(__name__)
+
+SUPPORTED_IMAGE_FORMATS = ['JPEG', 'PNG', 'GIF', 'BMP', 'WEBP']
+
+# アップロードした画像の保存先のパスのプレフィックス
+IMAGE_PREFIX = 'images/'
+
+# 知覚ハッシュを計算する画像の明暗差の下限（ほぼ単色の画像はどれも同じハッシュになるため対象外）
+PERCEPTUAL_HASH_MIN_CONTRAST = 8
+
+
+def upload_image(image_file, stored_path: str = None) -> Dict:
     """
-    画像ファイルをGoogle Cloud Storageにアップロードする
+    画像ファイルを設定されたストレージバックエンド（GCS・ローカル）に保存する
 
     Args:
         image_file: アップロードする画像ファイル
-        bucket_name: GCSバケット名（環境変数から取得）
+        stored_path: 同じ画像を保存済みの保存先パス（指定時は送信せず保存先の中で複製する）
 
     Returns:
         {
             'success': bool,
             'message': str,
-            'gcs_path': str,  # gs://bucket/path/to/file.jpg
+            'storage_path': str,  # gs://bucket/path/to/file.jpg や file:///path/to/file.jpg
             'public_url': str  # 公開URL
         }
     """
     try:
-        # バケット名の取得
-        if not bucket_name:
-            bucket_name = os.getenv('GCS_BUCKET_NAME')
+        storage = get_storage_backend()
 
-        if not bucket_name:
+        # ストレージの設定をチェック
+        error_message = storage.check_configured()
+        if error_message:
             return {
                 'success': False,
-                'message': 'GCS bucket name not configured',
-                'gcs_path': '',
-                'public_url': ''
-            }
-
-        # Google Cloud認証情報が設定されているかチェック
-        if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
-            return {
-                'success': False,
-                'message': 'Google Cloud credentials not configured',
-                'gcs_path': '',
+                'message': error_message,
+                'storage_path': '',
                 'public_url': ''
             }
 
         # 画像の形式チェック
         try:
-            image = Image.open(image_file)
-            image.verify()  # 画像が有効かチェック
-            image_file.seek(0)  # ファイルポインタをリセット
+            with stage('validate'):
+                image = Image.open(image_file)
+                image.verify()  # 画像が有効かチェック
+                image_file.seek(0)  # ファイルポインタをリセット
 
             # 対応フォーマットをチェック
-            if image.format not in ['JPEG', 'PNG', 'GIF', 'BMP', 'WEBP']:
+            if image.format not in SUPPORTED_IMAGE_FORMATS:
                 return {
                     'success': False,
                     'message': f'Unsupported image format: {image.format}',
-                    'gcs_path': '',
+                    'storage_path': '',
                     'public_url': ''
                 }
 
@@ -67,44 +84,30 @@ def upload_image_to_gcs(image_file, bucket_name: str = None) -> Dict:
             return {
                 'success': False,
                 'message': f'Invalid image file: {str(e)}',
-                'gcs_path': '',
+                'storage_path': '',
                 'public_url': ''
             }
 
-        # ファイル名の生成（タイムスタンプ + UUID）
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        file_extension = image.format.lower()
-        if file_extension == 'jpeg':
-            file_extension = 'jpg'
-
-        filename = f"images/{timestamp}_{unique_id}.{file_extension}"
-
-        # GCSクライアント作成
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(filename)
+        filename, file_extension = generate_image_filename(image.format)
 
         # ファイルアップロード
-        image_file.seek(0)
-        blob.upload_from_file(
-            image_file, content_type=f'image/{file_extension}')
-
-        # GCSパスと公開URLを生成
-        gcs_path = f"gs://{bucket_name}/{filename}"
-        public_url = f"https://storage.googleapis.com/{bucket_name}/{filename}"
-
-        print(f"📤 Image uploaded to GCS: {gcs_path}")
-        print(f"🌏 Public URL: {public_url}")
-        print(f"📁 Bucket: {bucket_name}")
-        print(f"📄 Filename: {filename}")
+        with stage('upload'):
+            if stored_path:
+                storage_path = storage.copy(
+                    stored_path, filename, content_type=f'image/{file_extension}')
+            else:
+                storage_path = storage.save(
+                    image_file, filename, content_type=f'image/{file_extension}')
+        public_url = storage.public_url(filename)
+
+        logger.info('Image uploaded', extra={
+            'storage_backend': storage.name, 'storage_path': storage_path, 'public_url': public_url})
 
         return {
             'success': True,
             'message': 'Image uploaded successfully',
-            'gcs_path': gcs_path,
+            'storage_path': storage_path,
             'public_url': public_url,
-            'bucket_name': bucket_name,
             'filename': filename
         }
 
@@ -112,17 +115,20 @@ def upload_image_to_gcs(image_file, bucket_name: str = None) -> Dict:
         return {
             'success': False,
             'message': f'Failed to upload image: {str(e)}',
-            'gcs_path': '',
+            'storage_path': '',
             'public_url': ''
         }
 
 
-def analyze_image_from_gcs_path(gcs_path: str) -> Dict:
+def analyze_image_from_storage(storage_path: str, timeout: float = None) -> Dict:
     """
-    GCSパスからVision APIを使用してオブジェクト検出を行う
+    保存済みの画像からVision APIを使用してオブジェクト検出を行う
+
+    Vision APIの呼び出しの失敗は例外として送出する（再試行・遮断は analyzers.ResilientAnalyzer で行う）。
 
     Args:
-        gcs_path: GCSパス (gs://bucket/path/to/image.jpg)
+        storage_path: 保存先パス (gs://bucket/path/to/image.jpg や file:///path/to/image.jpg)
+        timeout: Vision API呼び出しの期限(秒)
 
     Returns:
         {
@@ -134,75 +140,548 @@ def analyze_image_from_gcs_path(gcs_path: str) -> Dict:
             }
         }
     """
+    return _localize_objects(build_vision_image, storage_path, timeout)
+
+
+def analyze_image_content(content: bytes, timeout: float = None) -> Dict:
+    """
+    画像データをVision APIに直接送信してオブジェクト検出を行う
+
+    ストレージへのアップロード完了を待たずに解析する場合に使う。
+
+    Returns:
+        analyze_image_from_storage と同じ形式の解析結果
+    """
+    return _localize_objects(build_vision_image_from_content, content, timeout)
+
+
+async def aanalyze_image_from_storage(storage_path: str, timeout: float = None) -> Dict:
+    """
+    analyze_image_from_storage の非同期版（ASGIビュー用）
+
+    Vision APIの呼び出しは非同期クライアント(grpc.aio)で待機し、イベントループを占有しない。
+    """
+    return await _alocalize_objects(build_vision_image, storage_path, timeout)
+
+
+async def aanalyze_image_content(content: bytes, timeout: float = None) -> Dict:
+    """analyze_image_content の非同期版（ASGIビュー用）"""
+    return await _alocalize_objects(build_vision_image_from_content, content, timeout)
+
+
+def _localize_objects(build_image, source, timeout: float = None) -> Dict:
+    """Vision APIのオブジェクト検出を実行し、解析結果に変換する"""
+    # Google Cloud認証情報が設定されているかチェック
+    if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+        return {
+            'success': False,
+            'message': 'Google Cloud credentials not configured',
+            'estimated_data': {}
+        }
+
+    # ワーカープロセスで共有しているVision APIクライアントを取得
+    client = cloud_clients.vision_client()
+
+    image = build_image(source)
+
+    # オブジェクト検出実行（クライアントライブラリの再試行は使わず、期限のみ指定する）
+    response = client.object_localization(image=image, retry=None, timeout=timeout)
+
+    return build_analysis_result(response)
+
+
+async def _alocalize_objects(build_image, source, timeout: float = None) -> Dict:
+    """_localize_objects の非同期版"""
+    # Google Cloud認証情報が設定されているかチェック
+    if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+        return {
+            'success': False,
+            'message': 'Google Cloud credentials not configured',
+            'estimated_data': {}
+        }
+
+    client = cloud_clients.vision_async_client()
+
+    # ローカルストレージの場合は画像の読み込みを伴うためスレッドで実行
+    image = await sync_to_async(build_image, thread_sensitive=False)(source)
+
+    # オブジェクト検出実行
+    response = await client.object_localization(image=image, retry=None, timeout=timeout)
+
+    # ラベル登録でDBにアクセスするため同期処理として実行
+    return await sync_to_async(build_analysis_result)(response)
+
+
+def preprocess_image_for_analysis(image_file, max_edge: int = None, output_format: str = None,
+                                  quality: int = None) -> Optional[Dict]:
+    """
+    解析用に画像を縮小・再エンコードする（ストレージには元画像を保存する）
+
+    デコードは1回のみで、JPEGはdraftモードでDCT段階の縮小デコード(1/2・1/4・1/8)を行う。
+    EXIFの向きを適用し、長辺を max_edge 以下に縮小して output_format で再エンコードする。
+    縮小・回転が不要な場合は元画像のデータをそのまま返す。
+
+    Args:
+        image_file: 画像ファイル
+        max_edge: 長辺の最大ピクセル数（省略時は ANALYSIS_PREPROCESS_MAX_EDGE）
+        output_format: 再エンコード形式 JPEG/WEBP（省略時は ANALYSIS_PREPROCESS_FORMAT）
+        quality: 再エンコードの品質（省略時は ANALYSIS_PREPROCESS_QUALITY）
+
+    Returns:
+        {
+            'content': bytes,  # 解析に送信する画像データ
+            'format': str,
+            'width': int,
+            'height': int,
+            'original_width': int,
+            'original_height': int,
+            'original_bytes': int,
+            'reencoded': bool
+        }
+        画像として読み込めない場合はNone
+    """
+    max_edge = max_edge or settings.ANALYSIS_PREPROCESS_MAX_EDGE
+    output_format = output_format or settings.ANALYSIS_PREPROCESS_FORMAT
+    quality = quality or settings.ANALYSIS_PREPROCESS_QUALITY
+
     try:
-        from .models import ObjectLabel
+        image_file.seek(0)
+        original = image_file.read()
+        image_file.seek(0)
 
-        # Google Cloud認証情報が設定されているかチェック
-        if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
-            return {
-                'success': False,
-                'message': 'Google Cloud credentials not configured',
-                'estimated_data': {}
-            }
+        image = Image.open(io.BytesIO(original))
+        original_format = image.format
+        original_width, original_height = image.size
 
-        # Vision APIクライアント作成
-        client = vision.ImageAnnotatorClient()
+        # JPEGは長辺が max_edge 以上となる範囲で縮小デコードする
+        if original_format == 'JPEG' and max(image.size) > max_edge:
+            scale = max_edge / max(image.size)
+            image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        drafted = image.size != (original_width, original_height)
 
-        # GCSパスから画像を指定
-        image = vision.Image()
-        image.source.image_uri = gcs_path
+        # EXIFの向きを画素に反映（撮影時の向きのまま解析する）
+        rotated = image.getexif().get(0x0112, 1) != 1
+        if rotated:
+            image = ImageOps.exif_transpose(image)
 
-        # オブジェクト検出実行
-        response = client.object_localization(image=image)
-        objects = response.localized_object_annotations
+        resized = max(image.size) > max_edge
+        if resized:
+            image.thumbnail((max_edge, max_edge), Image.Resampling.BICUBIC)
 
-        if response.error.message:
+        if not (drafted or rotated or resized):
             return {
-                'success': False,
-                'message': f'Vision API Error: {response.error.message}',
-                'estimated_data': {}
+                'content': original,
+                'format': original_format,
+                'width': original_width,
+                'height': original_height,
+                'original_width': original_width,
+                'original_height': original_height,
+                'original_bytes': len(original),
+                'reencoded': False
             }
 
-        if not objects:
-            return {
-                'success': False,
-                'message': 'No objects detected',
-                'estimated_data': {}
-            }
+        # 透過画像は白背景に合成（JPEGは透過を扱えないため）
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=output_format, quality=quality)
+
+        return {
+            'content': buffer.getvalue(),
+            'format': output_format,
+            'width': image.width,
+            'height': image.height,
+            'original_width': original_width,
+            'original_height': original_height,
+            'original_bytes': len(original),
+            'reencoded': True
+        }
+
+    except Exception as e:
+        logger.warning('Preprocess failed', extra={'error': str(e)})
+        return None
+
+
+def generate_image_filename(image_format: str) -> Tuple[str, str]:
+    """
+    アップロード先のファイル名を生成する（タイムスタンプ + UUID）
+
+    Args:
+        image_format: Pillowの画像形式名 (JPEG, PNGなど)
+
+    Returns:
+        (ファイル名, 拡張子)
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    unique_id = str(uuid.uuid4())[:8]
+    file_extension = image_format.lower()
+    if file_extension == 'jpeg':
+        file_extension = 'jpg'
+
+    return f"{IMAGE_PREFIX}{timestamp}_{unique_id}.{file_extension}", file_extension
+
+
+def build_vision_image(storage_path: str) -> vision.Image:
+    """
+    保存先パスからVision APIに渡す画像を生成する
+
+    GCS上の画像はVision APIが直接読み込み、それ以外は画像データを送信する。
+    """
+    if storage_path.startswith('gs://'):
+        return vision.Image(source=vision.ImageSource(image_uri=storage_path))
+    return vision.Image(content=get_storage_backend().read(storage_path))
 
-        # スコアが最大のオブジェクトを取得
-        top_object = max(objects, key=lambda obj: obj.score)
-        object_name = top_object.name.lower()  # 小文字で統一
-        confidence = top_object.score
 
-        print(
-            f"🔍 Top detected object: {object_name} (confidence: {confidence:.4f})")
+def build_vision_image_from_content(content: bytes) -> vision.Image:
+    """画像データからVision APIに渡す画像を生成する"""
+    return vision.Image(content=content)
 
-        # ラベルマスタでオブジェクト名を検索・登録
-        object_label, created = ObjectLabel.objects.get_or_create(
-            name=object_name,
-            defaults={'name': object_name}
-        )
 
-        if created:
-            print(
-                f"🆕 New label registered: {object_name} (ID: {object_label.id})")
-        else:
-            print(
-                f"🔍 Existing label found: {object_name} (ID: {object_label.id})")
+def upload_images(image_files: List) -> List[Dict]:
+    """
+    複数の画像ファイルをストレージへ並行アップロードする
+
+    Args:
+        image_files: アップロードする画像ファイルのリスト
+
+    Returns:
+        image_files と同じ順序のアップロード結果リスト（各要素は upload_image と同じ形式）
+    """
+    if not image_files:
+        return []
+
+    # ストレージのクライアントはワーカープロセス内の全スレッドで共有する
+    max_workers = min(settings.BATCH_UPLOAD_CONCURRENCY, len(image_files))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(upload_image, image_files))
+
+
+def build_analysis_result(response) -> Dict:
+    """
+    Vision APIのオブジェクト検出レスポンスを解析結果に変換する
+
+    スコアが最大のオブジェクトをラベルマスタに登録し、そのIDを分類クラスとする。
+
+    Args:
+        response: AnnotateImageResponse
 
+    Returns:
+        analyze_image_from_storage と同じ形式の解析結果
+    """
+    objects = response.localized_object_annotations
+
+    if response.error.message:
         return {
-            'success': True,
-            'message': 'success',
-            'estimated_data': {
-                'class': object_label.id,
-                'confidence': round(confidence, 4)
-            }
+            'success': False,
+            'message': f'Vision API Error: {response.error.message}',
+            'estimated_data': {}
         }
 
-    except Exception as e:
+    if not objects:
         return {
             'success': False,
-            'message': f'Analysis failed: {str(e)}',
+            'message': 'No objects detected',
+            'estimated_data': {}
+        }
+
+    # スコアが最大のオブジェクトを取得
+    top_object = max(objects, key=lambda obj: obj.score)
+    object_name = top_object.name.lower()  # 小文字で統一
+    confidence = top_object.score
+
+    # ラベルマスタでオブジェクト名を検索・登録（プロセス内キャッシュ経由）
+    with stage('label_lookup'):
+        label_id, created = get_or_create_label_id(object_name)
+
+    logger.debug('Top detected object', extra={
+        'label': object_name, 'label_id': label_id, 'confidence': round(confidence, 4), 'label_created': created})
+
+    return {
+        'success': True,
+        'message': 'success',
+        'estimated_data': {
+            'class': label_id,
+            'confidence': round(confidence, 4)
+        }
+    }
+
+
+def analyze_images_from_storage(storage_paths: List[str], timeout: float = None) -> List[Dict]:
+    """
+    複数の保存済み画像をVision APIのバッチアノテーションでまとめて解析する
+
+    1リクエストあたりの画像数上限(VISION_BATCH_MAX_IMAGES)ごとに分割して送信する。
+    送信の失敗は例外として送出する（analyzers.ResilientAnalyzer は上限ごとに分けて呼び出し、
+    分割単位で再試行する）。
+
+    Args:
+        storage_paths: 保存先パスのリスト
+        timeout: 1リクエストごとのVision API呼び出しの期限(秒)
+
+    Returns:
+        storage_paths と同じ順序の解析結果リスト（各要素は analyze_image_from_storage と同じ形式）
+    """
+    if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+        return [{
+            'success': False,
+            'message': 'Google Cloud credentials not configured',
             'estimated_data': {}
+        } for _ in storage_paths]
+
+    results = []
+    client = cloud_clients.vision_client()
+    feature = vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION)
+    chunk_size = settings.VISION_BATCH_MAX_IMAGES
+
+    for start in range(0, len(storage_paths), chunk_size):
+        chunk = storage_paths[start:start + chunk_size]
+
+        requests = [
+            vision.AnnotateImageRequest(
+                image=build_vision_image(storage_path), features=[feature])
+            for storage_path in chunk
+        ]
+        batch_response = client.batch_annotate_images(requests=requests, retry=None, timeout=timeout)
+
+        logger.debug('Batch annotated', extra={'images': len(chunk)})
+
+        for response in batch_response.responses:
+            try:
+                results.append(build_analysis_result(response))
+            except Exception as e:
+                results.append({
+                    'success': False,
+                    'message': f'Analysis failed: {str(e)}',
+                    'estimated_data': {}
+                })
+
+    return results
+
+
+def compute_image_digest(image_file) -> str:
+    """
+    画像ファイルをチャンク単位で読み込みながらSHA-256ダイジェストを計算する
+
+    Args:
+        image_file: Djangoのアップロードファイル
+
+    Returns:
+        16進数表記のSHA-256ダイジェスト
+    """
+    sha256 = hashlib.sha256()
+    image_file.seek(0)
+    for chunk in image_file.chunks():
+        sha256.update(chunk)
+    image_file.seek(0)  # 後続の読み込みのためにファイルポインタをリセット
+    return sha256.hexdigest()
+
+
+def find_cached_analysis(digest: str) -> Optional[Dict]:
+    """
+    コンテンツハッシュから有効期限内の解析結果キャッシュを取得する
+
+    Args:
+        digest: 画像のSHA-256ダイジェスト
+
+    Returns:
+        キャッシュヒット時は
+        {
+            'storage_path': str,
+            'public_url': str,
+            'estimated_data': {
+                'class': int,
+                'confidence': float
+            }
         }
+        ミス時はNone
+    """
+    from .models import ImageContentIndex
+
+    if settings.ANALYSIS_CACHE_TTL_SECONDS <= 0:
+        return None
+
+    entry = ImageContentIndex.objects.filter(
+        digest=digest, expires_at__gt=timezone.now()).first()
+    record_cache_lookup(entry is not None)
+    if entry is None:
+        return None
+
+    logger.debug('Analysis cache hit', extra={'digest': digest[:12], 'storage_path': entry.storage_path})
+
+    return {
+        'storage_path': entry.storage_path,
+        'public_url': entry.public_url,
+        'estimated_data': {
+            'class': entry.classification,
+            'confidence': float(entry.confidence),
+        }
+    }
+
+
+def find_cached_analyses(digests: List[str]) -> Dict[str, Dict]:
+    """
+    複数のコンテンツハッシュの解析結果キャッシュを1クエリでまとめて取得する
+
+    Returns:
+        {digest: find_cached_analysis と同じ形式の結果}（ヒットしたもののみ）
+    """
+    from .models import ImageContentIndex
+
+    if settings.ANALYSIS_CACHE_TTL_SECONDS <= 0 or not digests:
+        return {}
+
+    entries = ImageContentIndex.objects.filter(
+        digest__in=set(digests), expires_at__gt=timezone.now())
+
+    cached_results = {
+        entry.digest: {
+            'storage_path': entry.storage_path,
+            'public_url': entry.public_url,
+            'estimated_data': {
+                'class': entry.classification,
+                'confidence': float(entry.confidence),
+            }
+        }
+        for entry in entries
+    }
+
+    for digest in digests:
+        record_cache_lookup(digest in cached_results)
+
+    return cached_results
+
+
+def save_analysis_cache(digest: str, upload_result: Dict, analysis_result: Dict,
+                        perceptual_hash: int = None) -> None:
+    """
+    成功した解析結果をコンテンツハッシュに紐づけてキャッシュする
+
+    Args:
+        digest: 画像のSHA-256ダイジェスト
+        upload_result: upload_image の戻り値
+        analysis_result: analyze_image_from_storage の戻り値
+        perceptual_hash: compute_perceptual_hash の戻り値（指定時は類似画像の検索対象にする）
+    """
+    from .models import ImageContentIndex
+
+    # 失敗結果は一時的なエラーの可能性があるためキャッシュしない
+    if settings.ANALYSIS_CACHE_TTL_SECONDS <= 0 or not analysis_result['success']:
+        return
+
+    entry, _ = ImageContentIndex.objects.update_or_create(
+        digest=digest,
+        defaults={
+            'storage_path': upload_result['storage_path'],
+            'public_url': upload_result['public_url'],
+            'classification': analysis_result['estimated_data']['class'],
+            'confidence': analysis_result['estimated_data']['confidence'],
+            'perceptual_hash': to_signed(perceptual_hash) if perceptual_hash is not None else None,
+            'expires_at': timezone.now() + timedelta(
+                seconds=settings.ANALYSIS_CACHE_TTL_SECONDS),
+        }
+    )
+
+    if perceptual_hash is not None:
+        perceptual_index.add(entry.id, perceptual_hash)
+
+
+class NearDuplicateOptions(NamedTuple):
+    """リクエストごとの類似画像検索の設定"""
+    max_distance: int  # 類似とみなす知覚ハッシュのハミング距離の上限
+    bypass: bool = False  # Trueの場合は類似画像の解析結果を使わない（知覚ハッシュの登録のみ行う）
+
+    @classmethod
+    def default(cls) -> 'NearDuplicateOptions':
+        return cls(settings.NEAR_DUPLICATE_MAX_DISTANCE)
+
+
+def compute_perceptual_hash(image_file) -> Optional[int]:
+    """
+    画像の知覚ハッシュ(64bit dHash)を計算する
+
+    EXIFの向きを適用したグレースケール画像を 9x8 に縮小し、横に隣り合う画素の明暗を1bitずつ並べる。
+    縮小・再圧縮・軽微な色調補正ではほとんど変化しないため、ハミング距離で同じ画像かどうかを判定できる。
+    JPEGはdraftモードで縮小デコードする。
+
+    Args:
+        image_file: 画像ファイル
+
+    Returns:
+        符号なし64bitのハッシュ（画像として読み込めない場合・ほぼ単色の画像の場合はNone）
+    """
+    try:
+        image_file.seek(0)
+        image = Image.open(image_file)
+        image.draft('L', (64, 64))
+        image = ImageOps.exif_transpose(image).convert('L')
+        pixels = list(image.resize((9, 8), Image.Resampling.LANCZOS, reducing_gap=2.0).getdata())
+    except Exception as e:
+        logger.warning('Perceptual hash failed', extra={'error': str(e)})
+        return None
+    finally:
+        image_file.seek(0)
+
+    if max(pixels) - min(pixels) < PERCEPTUAL_HASH_MIN_CONTRAST:
+        return None
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left, right = pixels[row * 9 + column], pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def find_similar_analysis(perceptual_hash: int, max_distance: int) -> Optional[Dict]:
+    """
+    知覚ハッシュが近い画像の有効期限内の解析結果キャッシュを取得する
+
+    候補はプロセス内の索引（api/perceptual_index.py） から検索し、近い順に最大 NEAR_DUPLICATE_MAX_CANDIDATES 件を
+    1クエリで確認する（候補がない場合はDBを参照しない）。
+
+    Args:
+        perceptual_hash: compute_perceptual_hash の戻り値
+        max_distance: 類似とみなすハミング距離の上限
+
+    Returns:
+        ヒット時は find_cached_analysis と同じ形式の結果に 'distance'（ハミング距離）を加えたもの、
+        ミス時はNone
+    """
+    from .models import ImageContentIndex
+
+    if settings.ANALYSIS_CACHE_TTL_SECONDS <= 0:
+        return None
+
+    candidates = perceptual_index.search(
+        perceptual_hash, max_distance)[:settings.NEAR_DUPLICATE_MAX_CANDIDATES]
+    entries = {}
+    if candidates:
+        # 索引には有効期限切れのエントリが残っている場合があるため、DBで有効期限を確認する
+        entries = ImageContentIndex.objects.filter(
+            id__in=[entry_id for _, entry_id in candidates], expires_at__gt=timezone.now()).in_bulk()
+
+    match = next(
+        ((distance, entries[entry_id]) for distance, entry_id in candidates if entry_id in entries), None)
+    record_near_duplicate_lookup(match is not None)
+    if match is None:
+        return None
+
+    distance, entry = match
+    logger.debug('Near-duplicate cache hit', extra={
+        'digest': entry.digest[:12], 'distance': distance, 'storage_path': entry.storage_path})
+
+    return {
+        'storage_path': entry.storage_path,
+        'public_url': entry.public_url,
+        'estimated_data': {
+            'class': entry.classification,
+            'confidence': float(entry.confidence),
+        },
+        'distance': distance,
+    }
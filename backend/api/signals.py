@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .label_cache import label_cache
+from .logs_cache import invalidate_logs_cache
+from .models import AiAnalysisLog, ObjectLabel
+from .rollups import accumulate_hourly_rollups
+
+
+@receiver(post_save, sender=ObjectLabel)
+def cache_saved_label(sender, instance, created, **kwargs):
+    """ラベルの登録・更新時にキャッシュへ反映（ロールバックされた変更は反映しない）"""
+    label_id, name = instance.id, instance.name
+
+    # 名前を変更した場合は変更前の名前を put が除外する
+    transaction.on_commit(lambda: label_cache.put(label_id, name))
+
+
+@receiver(post_delete, sender=ObjectLabel)
+def evict_deleted_label(sender, instance, **kwargs):
+    """ラベル削除時にキャッシュから除外"""
+    label_cache.discard(instance.id)
+
+
+@receiver(post_save, sender=AiAnalysisLog)
+def rollup_new_analysis_log(sender, instance, created, **kwargs):
+    """解析ログの登録時に1時間単位の集計へ加算（コミット後にプロセス内で溜めてまとめて反映する）"""
+    if created:
+        transaction.on_commit(lambda: accumulate_hourly_rollups([instance]))
+
+
+@receiver(post_save, sender=AiAnalysisLog)
+def invalidate_logs_on_save(sender, instance, created, **kwargs):
+    """解析ログの登録・更新時にログ一覧のキャッシュを破棄（コミット前の一覧がキャッシュされないようコミット後に破棄）"""
+    transaction.on_commit(invalidate_logs_cache)
+
+
+@receiver(post_delete, sender=AiAnalysisLog)
+def invalidate_logs_on_delete(sender, instance, **kwargs):
+    """解析ログの削除時にログ一覧のキャッシュを破棄"""
+    transaction.on_commit(invalidate_logs_cache)
@@ -0,0 +1,101 @@
+"""
+マージ可能なレイテンシのスケッチ
+
+DDSketch と同じ対数バケット方式で、値を (1 + α) / (1 - α) の等比で区切ったバケットの件数として保持する。
+分位点の相対誤差は α 以内に収まり、バケットごとの件数を足し合わせるだけでスケッチ同士をマージできるため、
+時間単位の集計を任意の期間にまとめ直しても分位点を求められる。
+"""
+import math
+from typing import Dict, List, Optional
+
+# 分位点の相対誤差（変更すると保存済みのスケッチとバケットの境界が合わなくなる）
+RELATIVE_ACCURACY = 0.01
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# これ未満の値(ms)は0として数える
+MIN_VALUE = 0.01
+
+
+class LatencySketch:
+    """処理時間(ms)の分布を対数バケットで保持するスケッチ"""
+
+    def __init__(self, bins: Optional[Dict[int, int]] = None, zero_count: int = 0):
+        self.bins = dict(bins or {})
+        self.zero_count = zero_count
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.bins.values())
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value < MIN_VALUE:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / _LOG_GAMMA)
+        self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other: 'LatencySketch') -> None:
+        self.zero_count += other.zero_count
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge_dict(self, data: Optional[Dict]) -> None:
+        """to_dict() の形式のスケッチをマージする（LatencySketch を生成せずに加算する）"""
+        if not data:
+            return
+        self.zero_count += data.get('zero', 0)
+        bins = self.bins
+        for index, count in data.get('bins', {}).items():
+            index = int(index)
+            bins[index] = bins.get(index, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        分位点を返す（件数が0の場合はNone）
+
+        Args:
+            q: 0〜1の分位（0.5で中央値）
+        """
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs: List[float]) -> List[Optional[float]]:
+        """複数の分位点をまとめて返す（バケットの並べ替えは1回のみ）"""
+        total = self.count
+        if total == 0:
+            return [None] * len(qs)
+
+        results = []
+        indexes = sorted(self.bins)
+        position = 0
+        seen = self.zero_count
+        for q in qs:
+            rank = q * (total - 1)
+            if rank < self.zero_count:
+                results.append(0.0)
+                continue
+            # 分位が昇順でない場合は先頭から数え直す
+            if position > 0 and rank < seen - self.bins[indexes[position - 1]]:
+                position, seen = 0, self.zero_count
+            while position < len(indexes) and seen <= rank:
+                seen += self.bins[indexes[position]]
+                position += 1
+            # バケット (γ^(i-1), γ^i] の代表値（相対誤差がα以内になる点）
+            results.append(2 * _GAMMA ** indexes[position - 1] / (_GAMMA + 1))
+        return results
+
+    def to_dict(self) -> Dict:
+        """JSONFieldに保存する形式に変換する"""
+        return {
+            'zero': self.zero_count,
+            'bins': {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> 'LatencySketch':
+        if not data:
+            return cls()
+        return cls(
+            bins={int(index): count for index, count in data.get('bins', {}).items()},
+            zero_count=data.get('zero', 0))
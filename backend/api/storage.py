@@ -0,0 +1,301 @@
+"""
+画像ストレージバックエンド
+
+IMAGE_STORAGE_BACKEND 設定で保存先を切り替える。
+- gcs: Google Cloud Storage（本番環境）
+- local: ローカルファイルシステム（負荷試験・オフライン環境）
+"""
+import mmap
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from django.conf import settings
+from django.utils._os import safe_join
+
+from .clients import cloud_clients
+
+
+class StorageBackend:
+    """画像ストレージの基底クラス"""
+
+    name = None
+
+    def check_configured(self) -> Optional[str]:
+        """設定不備がある場合はエラーメッセージを返す"""
+        return None
+
+    def save(self, image_file, filename: str, content_type: str) -> str:
+        """
+        画像ファイルを保存する
+
+        Returns:
+            保存先パス（gs://bucket/... や file:///... 形式）
+        """
+        raise NotImplementedError
+
+    def open_writer(self, filename: str, content_type: str):
+        """
+        チャンク単位で書き込むためのファイルオブジェクトを開く
+
+        close() で書き込みが確定する。
+        """
+        raise NotImplementedError
+
+    def discard_writer(self, writer) -> None:
+        """open_writer で開いたファイルへの書き込みを確定させずに破棄する"""
+        writer.discard()
+
+    def read(self, storage_path: str) -> bytes:
+        """保存済みの画像を読み込む"""
+        raise NotImplementedError
+
+    def open_reader(self, storage_path: str):
+        """保存済みの画像を少しずつ読み込むためのファイルオブジェクト（シーク可能）を開く"""
+        raise NotImplementedError
+
+    def delete(self, storage_path: str) -> None:
+        """保存済みの画像を削除する"""
+        raise NotImplementedError
+
+    def copy(self, storage_path: str, filename: str, content_type: str) -> str:
+        """
+        保存済みのファイルを保存先の中で別のファイル名に複製する（データを送り直さない）
+
+        Returns:
+            複製先の保存先パス
+        """
+        raise NotImplementedError
+
+    def storage_path(self, filename: str) -> str:
+        """ファイル名から保存先パスを生成する"""
+        raise NotImplementedError
+
+    def public_url(self, filename: str) -> str:
+        """ファイル名から表示用の公開URLを生成する"""
+        raise NotImplementedError
+
+    def filename_from_public_url(self, public_url: str) -> Optional[str]:
+        """公開URLからファイル名を取り出す（このバックエンドの公開URLでない場合はNone）"""
+        prefix = self.public_url('')
+        if not public_url.startswith(prefix) or public_url == prefix:
+            return None
+        return public_url.removeprefix(prefix)
+
+
+class GCSStorageBackend(StorageBackend):
+    """Google Cloud Storage に保存するバックエンド"""
+
+    name = 'gcs'
+
+    def __init__(self, bucket_name: str = None):
+        self.bucket_name = bucket_name or os.getenv('GCS_BUCKET_NAME')
+
+    def check_configured(self) -> Optional[str]:
+        if not self.bucket_name:
+            return 'GCS bucket name not configured'
+
+        # Google Cloud認証情報が設定されているかチェック
+        if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+            return 'Google Cloud credentials not configured'
+
+        return None
+
+    def save(self, image_file, filename: str, content_type: str) -> str:
+        # ワーカープロセスで共有しているバケットのハンドルを取得
+        blob = cloud_clients.bucket(self.bucket_name).blob(filename)
+        image_file.seek(0)
+        blob.upload_from_file(image_file, content_type=content_type)
+        return self.storage_path(filename)
+
+    def open_writer(self, filename: str, content_type: str):
+        # レジュマブルアップロードで送信単位ごとにGCSへ書き込む
+        blob = cloud_clients.bucket(self.bucket_name).blob(filename)
+        return blob.open(
+            'wb', chunk_size=settings.STREAMING_UPLOAD_CHUNK_SIZE, content_type=content_type)
+
+    def discard_writer(self, writer) -> None:
+        # 開始済みのレジュマブルアップロードを取り消す（未送信の場合はバッファを閉じるのみ）
+        writer.terminate()
+
+    def read(self, storage_path: str) -> bytes:
+        return self._blob(storage_path).download_as_bytes()
+
+    def open_reader(self, storage_path: str):
+        return self._blob(storage_path).open('rb', chunk_size=settings.STREAMING_UPLOAD_CHUNK_SIZE)
+
+    def delete(self, storage_path: str) -> None:
+        self._blob(storage_path).delete()
+
+    def copy(self, storage_path: str, filename: str, content_type: str) -> str:
+        # GCS内で複製する（大きなファイルは複数回のリクエストに分かれる）
+        destination = cloud_clients.bucket(self.bucket_name).blob(filename)
+        destination.content_type = content_type
+        source = self._blob(storage_path)
+        token, _, _ = destination.rewrite(source)
+        while token is not None:
+            token, _, _ = destination.rewrite(source, token=token)
+        return self.storage_path(filename)
+
+    def storage_path(self, filename: str) -> str:
+        return f"gs://{self.bucket_name}/{filename}"
+
+    def public_url(self, filename: str) -> str:
+        return f"https://storage.googleapis.com/{self.bucket_name}/{filename}"
+
+    def _blob(self, storage_path: str):
+        bucket_name, filename = storage_path.removeprefix('gs://').split('/', 1)
+        return cloud_clients.bucket(bucket_name).blob(filename)
+
+
+class LocalFileSystemStorageBackend(StorageBackend):
+    """
+    ローカルファイルシステムに保存するバックエンド
+
+    一時ファイルに書き込んでからリネームするため、読み込み側が
+    書きかけのファイルを参照することはない。
+    """
+
+    name = 'local'
+
+    def __init__(self, root: str = None, base_url: str = None):
+        self.root = str(root or settings.LOCAL_STORAGE_ROOT)
+        self.base_url = base_url or settings.LOCAL_STORAGE_BASE_URL
+
+    def save(self, image_file, filename: str, content_type: str) -> str:
+        image_file.seek(0)
+        with self.open_writer(filename, content_type) as writer:
+            for chunk in image_file.chunks():
+                writer.write(chunk)
+        return self.storage_path(filename)
+
+    def open_writer(self, filename: str, content_type: str):
+        path = self.path(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return AtomicFileWriter(path)
+
+    def read(self, storage_path: str) -> bytes:
+        # ページキャッシュを直接参照し、バッファへの読み込みコピーを省く
+        with open(self._path_from_storage_path(storage_path), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+
+    def open_reader(self, storage_path: str):
+        return open(self._path_from_storage_path(storage_path), 'rb')
+
+    def delete(self, storage_path: str) -> None:
+        try:
+            os.remove(self._path_from_storage_path(storage_path))
+        except FileNotFoundError:
+            pass
+
+    def copy(self, storage_path: str, filename: str, content_type: str) -> str:
+        # ハードリンクを作成する（リンクできないファイルシステムではファイルを複製する）
+        source = self._path_from_storage_path(storage_path)
+        path = self.path(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(source, path)
+        except OSError:
+            with open(source, 'rb') as f, self.open_writer(filename, content_type) as writer:
+                shutil.copyfileobj(f, writer)
+        return self.storage_path(filename)
+
+    def storage_path(self, filename: str) -> str:
+        return f"file://{self.path(filename)}"
+
+    def public_url(self, filename: str) -> str:
+        return f"{self.base_url}{filename}"
+
+    def path(self, filename: str) -> str:
+        """ファイル名から絶対パスを生成する（ルート外へのパスは拒否）"""
+        return safe_join(self.root, filename)
+
+    def _path_from_storage_path(self, storage_path: str) -> str:
+        path = storage_path.removeprefix('file://')
+        # ルート外のパスは拒否
+        return safe_join(self.root, os.path.relpath(path, self.root))
+
+
+class AtomicFileWriter:
+    """同じディレクトリの一時ファイルに書き込み、close() でリネームして確定するファイル"""
+
+    def __init__(self, path: str):
+        self.path = path
+        fd, self.temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, data) -> int:
+        return self.file.write(data)
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+        self.file.close()
+        os.chmod(self.temp_path, settings.FILE_UPLOAD_PERMISSIONS)
+        os.replace(self.temp_path, self.path)
+
+    def discard(self) -> None:
+        """書き込みを破棄する"""
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+STORAGE_BACKENDS = {
+    GCSStorageBackend.name: GCSStorageBackend,
+    LocalFileSystemStorageBackend.name: LocalFileSystemStorageBackend,
+}
+
+_storage_backend = None
+
+
+def get_storage_backend() -> StorageBackend:
+    """設定で選択されたストレージバックエンドを取得する"""
+    global _storage_backend
+
+    if _storage_backend is None or _storage_backend.name != settings.IMAGE_STORAGE_BACKEND:
+        try:
+            backend_class = STORAGE_BACKENDS[settings.IMAGE_STORAGE_BACKEND]
+        except KeyError:
+            raise ValueError(
+                f'Unknown storage backend: {settings.IMAGE_STORAGE_BACKEND}')
+        _storage_backend = backend_class()
+
+    return _storage_backend
+
+
+def get_archive_storage_backend() -> StorageBackend:
+    """
+    解析ログのアーカイブの保存先を取得する
+
+    画像の保存先は公開URLで配信されるため、アーカイブは別の非公開のバケット・ディレクトリに保存する。
+    """
+    backend_name = settings.ANALYSIS_LOG_ARCHIVE_STORAGE_BACKEND
+
+    if backend_name == GCSStorageBackend.name:
+        bucket_name = settings.ANALYSIS_LOG_ARCHIVE_GCS_BUCKET_NAME
+        if not bucket_name or bucket_name == settings.GCS_BUCKET_NAME:
+            raise ValueError(
+                'ANALYSIS_LOG_ARCHIVE_GCS_BUCKET_NAME must be set to a private bucket other than GCS_BUCKET_NAME')
+        return GCSStorageBackend(bucket_name)
+
+    if backend_name == LocalFileSystemStorageBackend.name:
+        return LocalFileSystemStorageBackend(root=settings.ANALYSIS_LOG_ARCHIVE_LOCAL_ROOT, base_url='')
+
+    raise ValueError(f'Unknown storage backend: {backend_name}')
@@ -1,3 +1,1420 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import (AsyncRequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+from django.utils import timezone
+from google.api_core import exceptions as google_exceptions
+from PIL import Image, ImageDraw
+from prometheus_client.parser import text_string_to_metric_families
+
+from . import analyzers, async_views, rollups, storage, views
+from .analyzers import LocalStandInAnalyzer, ResilientAnalyzer
+from .clients import CloudClients
+from .jobs import (claim_next_job, enqueue_analysis_job, process_next_job,
+                   requeue_stale_jobs)
+from .label_cache import (MISSING, LabelCache, get_label_name,
+                          get_or_create_label_id, label_cache)
+from .log_formatters import JsonFormatter, TextFormatter
+from .log_writer import AnalysisLogWriter
+from .models import (AiAnalysisLog, AnalysisHourlyRollup, AnalysisJob,
+                     ImageThumbnail, ObjectLabel)
+from .pagination import estimate_count
+from .partitions import (count_partition_rows, create_month_partition,
+                         drop_partition, ensure_partitions, is_partitioned,
+                         list_partitions, partition_name)
+from .perceptual_index import (MultiIndexHash, hamming_distance,
+                               perceptual_index)
+from .pipeline import analyze_image_file
+from .resilience import CircuitBreaker, ConcurrencyLimiter, RetryPolicy
+from .rollups import (flush_hourly_rollups, rebuild_hourly_rollups,
+                      truncate_to_hour)
+from .services import (compute_perceptual_hash, find_similar_analysis,
+                       preprocess_image_for_analysis, save_analysis_cache,
+                       upload_image)
+from .thumbnails import process_next_thumbnail
+from .upload_handlers import StreamingStorageUploadHandler
+
+
+class AnalysisLogsQueryCountTests(TestCase):
+    """ログ一覧APIのクエリ数がページサイズに依存しないことの回帰テスト"""
+
+    def setUp(self):
+        cache.clear()
+        self.labels = [
+            ObjectLabel.objects.create(name=f"label-{i}") for i in range(5)
+        ]
+
+    def create_logs(self, count):
+        AiAnalysisLog.objects.bulk_create([
+            AiAnalysisLog(
+                image_path=f"https://example.com/{i}.jpg",
+                success=True,
+                message='success',
+                classification=self.labels[i % len(self.labels)],
+                confidence=0.9,
+            )
+            for i in range(count)
+        ])
+
+    def test_query_count_is_constant_for_page_size(self):
+        url = reverse('get-analysis-logs')
+
+        for count in (5, 50):
+            AiAnalysisLog.objects.all().delete()
+            self.create_logs(count)
+            # bulk_create ではキャッシュが破棄されないため、キャッシュしたレスポンスを消す
+            cache.clear()
+
+            # 最新ログの確認 + COUNT(*) + ページ取得(ラベルJOIN込み) + サムネイルURLの4クエリのみ
+            with self.assertNumQueries(4):
+                response = self.client.get(url, {'page_size': 50})
+
+            self.assertEqual(response.status_code, 200)
+            logs = response.json()['data']['logs']
+            self.assertEqual(len(logs), count)
+            self.assertTrue(all(log['classification_name'].startswith('label-') for log in logs))
+
+    def test_unknown_classification_falls_back_to_class_number(self):
+        AiAnalysisLog.objects.create(
+            image_path='/image/mock/1.jpg',
+            success=True,
+            message='success',
+            classification_id=9999,
+            confidence=0.8,
+        )
+
+        response = self.client.get(reverse('get-analysis-logs'))
+
+        log = response.json()['data']['logs'][0]
+        self.assertEqual(log['classification'], 9999)
+        self.assertEqual(log['classification_name'], 'クラス 9999')
+
+
+class AnalysisLogsCursorPaginationTests(TestCase):
+    """カーソルモードで全件を重複・欠落なく辿れることのテスト"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages_cover_all_logs_in_order(self):
+        logs = AiAnalysisLog.objects.bulk_create([
+            AiAnalysisLog(image_path=f"https://example.com/{i}.jpg", success=True)
+            for i in range(7)
+        ])
+        # 同一時刻のログがあってもIDで順序が決まること
+        AiAnalysisLog.objects.filter(id__in=[log.id for log in logs[:4]]).update(
+            created_at=logs[0].created_at)
+
+        url = reverse('get-analysis-logs')
+        seen = []
+        cursor = ''
+        while True:
+            data = self.client.get(url, {'cursor': cursor, 'page_size': 3}).json()['data']
+            seen.extend(log['id'] for log in data['logs'])
+            self.assertIsNone(data['pagination']['total_count'])
+            cursor = data['pagination']['next_cursor']
+            if cursor is None:
+                break
+
+        expected = list(AiAnalysisLog.objects.order_by(
+            '-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_returns_bad_request(self):
+        response = self.client.get(reverse('get-analysis-logs'), {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AnalysisLogsFilterTests(TestCase):
+    """処理時間を登録時に保存し、範囲フィルタ・並べ替えに使えることのテスト"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_filters_by_processing_time_and_sorts_slowest_first(self):
+        now = timezone.now()
+        AiAnalysisLog.objects.bulk_create([
+            AiAnalysisLog(image_path=f"https://example.com/{ms}.jpg", success=ms != 300,
+                          request_timestamp=now - timedelta(milliseconds=ms), response_timestamp=now)
+            for ms in (100, 300, 500, 700)
+        ])
+        AiAnalysisLog.objects.create(image_path='https://example.com/legacy.jpg', success=True)
+
+        response = self.client.get(reverse('get-analysis-logs'), {
+            'min_processing_time_ms': 200, 'success': 'true', 'sort': '-processing_time_ms'})
+        self.assertEqual(
+            [log['processing_time_ms'] for log in response.json()['data']['logs']], [700, 500])
+
+        response = self.client.get(reverse('get-analysis-logs'), {'cursor': '', 'sort': 'confidence'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AnalysisLogsConditionalGetTests(TestCase):
+    """ログが増えていない間のポーリングがDBを参照せずに304・キャッシュで応答することのテスト"""
+
+    def setUp(self):
+        cache.clear()
+
+    def create_log(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return AiAnalysisLog.objects.create(image_path='https://example.com/image.jpg', success=True)
+
+    def test_unchanged_polls_are_answered_from_cache(self):
+        url = reverse('get-analysis-logs')
+        self.create_log()
+
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url).json(), response.json())
+
+        # 登録時にキャッシュが破棄され、新しいログを含む一覧を返す
+        log = self.create_log()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['data']['logs'][0]['id'], log.id)
+
+    def test_if_modified_since_alone_is_not_answered_with_304(self):
+        url = reverse('get-analysis-logs')
+        log = self.create_log()
+        last_modified = self.client.get(url)['Last-Modified']
+
+        # 既存のログの更新では Last-Modified が変わらないため、If-Modified-Since では判定しない
+        log.success = False
+        with self.captureOnCommitCallbacks(execute=True):
+            log.save()
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['data']['logs'][0]['success'])
+
+    def test_log_committed_below_latest_id_changes_etag(self):
+        url = reverse('get-analysis-logs')
+        self.create_log()
+        self.create_log()
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        # 事前確保したIDやコミット順の前後で、最新のIDより小さいIDのログが後から登録される
+        with self.captureOnCommitCallbacks(execute=True):
+            log = AiAnalysisLog.objects.create(
+                id=min(row['id'] for row in response.json()['data']['logs']) - 1,
+                image_path='https://example.com/late.jpg', success=True)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(log.id, [row['id'] for row in response.json()['data']['logs']])
+
+    def test_sync_and_async_views_share_cache_safely(self):
+        url = reverse('get-analysis-logs')
+        self.create_log()
+
+        # 非同期ビューはレンダリング済みの本文、同期ビューはデータをキャッシュする
+        async_response = async_to_sync(async_views.get_analysis_logs)(AsyncRequestFactory().get(url))
+        self.assertEqual(self.client.get(url).json(), json.loads(async_response.content))
+        async_response = async_to_sync(async_views.get_analysis_logs)(AsyncRequestFactory().get(url))
+        self.assertEqual(self.client.get(url).json(), json.loads(async_response.content))
+
+
+class AnalysisLogsExportTests(TestCase):
+    """エクスポートAPIが絞り込みを適用し、件数に関係なく一定のクエリ数で書き出すことのテスト"""
+
+    def test_csv_export_applies_filters_with_label_map(self):
+        label = ObjectLabel.objects.create(name='cat')
+        AiAnalysisLog.objects.bulk_create([
+            AiAnalysisLog(image_path=f"https://example.com/{i}.jpg", success=i % 3 != 0,
+                          classification_id=label.id if i % 2 else 9999, confidence=0.9)
+            for i in range(30)
+        ])
+
+        # ラベルの対応表 + 行の取得の2クエリのみ
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('export-analysis-logs'), {'success': 'true'})
+            body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 20)
+        self.assertTrue(all(row['success'] == 'true' for row in rows))
+        self.assertEqual(
+            {row['classification_name'] for row in rows}, {'cat', 'クラス 9999'})
+
+        response = self.client.get(reverse('export-analysis-logs'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(IMAGE_ANALYZER_BACKEND='local')
+class AnalysisCacheTests(TestCase):
+    """同じ画像（ダイジェストが一致）の再解析が解析結果キャッシュから応答することのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        perceptual_index.clear()
+        use_local_storage(self)
+        self.analyzer_calls = []
+        use_standin_analyzer(self, sleep=self.analyzer_calls.append)
+
+        self.saved = []
+        backend = storage.get_storage_backend()
+        save = backend.save
+
+        def record_save(image_file, filename, content_type):
+            self.saved.append(filename)
+            return save(image_file, filename, content_type)
+        backend.save = record_save
+
+    def test_same_image_skips_analysis_and_upload(self):
+        data = image_upload().read()
+
+        first = analyze_image_file(SimpleUploadedFile('a.jpg', data, 'image/jpeg'), timezone.now())
+        second = analyze_image_file(SimpleUploadedFile('b.jpg', data, 'image/jpeg'), timezone.now())
+
+        self.assertEqual(len(self.analyzer_calls), 1)
+        self.assertEqual(len(self.saved), 1)
+        self.assertFalse(first['analysis_log'].cache_hit)
+        self.assertTrue(second['analysis_log'].cache_hit)
+        self.assertEqual(second['analysis_log'].image_path, first['analysis_log'].image_path)
+        self.assertEqual(second['estimated_data'], first['estimated_data'])
+
+
+class NearDuplicateTests(TestCase):
+    """縮小・再圧縮した画像が知覚ハッシュの索引から以前の解析結果を引けることのテスト"""
+
+    def setUp(self):
+        perceptual_index.clear()
+
+    def make_image(self, seed, size=(800, 600), quality=90):
+        rng = random.Random(seed)
+        image = Image.new('RGB', (800, 600), 'white')
+        draw = ImageDraw.Draw(image)
+        for _ in range(30):
+            x, y = rng.randrange(700), rng.randrange(500)
+            draw.rectangle([x, y, x + rng.randrange(20, 200), y + rng.randrange(20, 200)],
+                           fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        image.resize(size).save(buffer, 'JPEG', quality=quality)
+        return SimpleUploadedFile('image.jpg', buffer.getvalue(), 'image/jpeg')
+
+    def test_resized_copy_reuses_cached_analysis(self):
+        original_hash = compute_perceptual_hash(self.make_image(1))
+        save_analysis_cache(
+            'a' * 64,
+            {'storage_path': 'images/1.jpg', 'public_url': 'https://example.com/1.jpg'},
+            {'success': True, 'estimated_data': {'class': 3, 'confidence': 0.9}},
+            original_hash)
+
+        resized = find_similar_analysis(compute_perceptual_hash(self.make_image(1, (320, 240), 50)), 6)
+        self.assertEqual(resized['public_url'], 'https://example.com/1.jpg')
+        self.assertEqual(resized['estimated_data'], {'class': 3, 'confidence': 0.9})
+        self.assertIsNone(find_similar_analysis(compute_perceptual_hash(self.make_image(2)), 6))
+
+        # 単色の画像は異なる色でも同じハッシュになるため対象外
+        flat = io.BytesIO()
+        Image.new('RGB', (64, 64), 'blue').save(flat, 'PNG')
+        self.assertIsNone(compute_perceptual_hash(flat))
+
+    def test_multi_index_search_matches_linear_scan(self):
+        rng = random.Random(0)
+        values = [rng.getrandbits(64) for _ in range(2000)]
+        index = MultiIndexHash()
+        for item, value in enumerate(values):
+            index.add(value, item)
+
+        for query in values[:50]:
+            query ^= 1 << rng.randrange(64)
+            expected = sorted(
+                (hamming_distance(query, value), item) for item, value in enumerate(values)
+                if hamming_distance(query, value) <= 11)
+            self.assertEqual(sorted(index.search(query, 11)), expected)
+
+
+def use_standin_analyzer(test_case, name='local', **options):
+    """待機なしの代替解析バックエンドに差し替える（テスト終了時に元に戻す）"""
+    options = {'latency': 'fixed', 'latency_ms': 0, 'error_rate': 0, 'fault_rate': 0, 'seed': 0, **options}
+    standin = LocalStandInAnalyzer(**options)
+    test_case.addCleanup(analyzers._analyzer_backends.pop, name, None)
+    analyzers.set_analyzer_backend(name, ResilientAnalyzer(standin))
+    return standin
+
+
+def use_local_storage(test_case):
+    """一時ディレクトリをルートにしたローカルの保存先に差し替える（テスト終了時に削除する）"""
+    media_root = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, media_root)
+    settings_override = override_settings(
+        IMAGE_STORAGE_BACKEND='local', LOCAL_STORAGE_ROOT=media_root,
+        LOCAL_STORAGE_BASE_URL='https://example.com/media/')
+    settings_override.enable()
+    test_case.addCleanup(settings_override.disable)
+    storage._storage_backend = None
+    test_case.addCleanup(setattr, storage, '_storage_backend', None)
+    return media_root
+
+
+def image_upload(name='image.jpg', size=(64, 48), color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+class ThumbnailTests(TestCase):
+    """既存のログの画像のサムネイルをワーカーが生成し、ログ一覧に表示されることのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        use_local_storage(self)
+
+    def test_backfilled_thumbnails_are_listed(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1200), 'red').save(buffer, 'JPEG')
+        upload_result = upload_image(SimpleUploadedFile('image.jpg', buffer.getvalue(), 'image/jpeg'))
+        AiAnalysisLog.objects.bulk_create([
+            AiAnalysisLog(image_path=upload_result['public_url'], success=True),
+            AiAnalysisLog(image_path=upload_result['public_url'], success=True, cache_hit=True),
+            AiAnalysisLog(image_path='/image/mock/1.jpg', success=True),
+        ])
+
+        call_command('backfill_thumbnails', stdout=io.StringIO())
+        self.assertEqual(ImageThumbnail.objects.count(), 1)
+        self.assertTrue(process_next_thumbnail())
+        self.assertFalse(process_next_thumbnail())
+
+        logs = self.client.get(reverse('get-analysis-logs')).json()['data']['logs']
+        thumbnails = {log['image_path']: log['thumbnails'] for log in logs}
+        self.assertIsNone(thumbnails['/image/mock/1.jpg'])
+        urls = thumbnails[upload_result['public_url']]
+        self.assertEqual(set(urls), {'128', '512'})
+
+        filename = urls['128'].removeprefix('https://example.com/media/')
+        with Image.open(storage.get_storage_backend().path(filename)) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (128, 96)))
+
+    @override_settings(THUMBNAILS=True)
+    def test_mock_analysis_does_not_enqueue_thumbnails(self):
+        """モックAPIの image_path は保存した画像ではないため、サムネイルの生成タスクを登録しない"""
+        use_standin_analyzer(self)
+
+        response = self.client.post(
+            reverse('analyze-image-mock'), {'image_path': '/image/mock/1.jpg'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+
+        request = AsyncRequestFactory().post(
+            '/api/analyze-mock/', {'image_path': '/image/mock/2.jpg'}, content_type='application/json')
+        response = async_to_sync(async_views.analyze_image_mock)(request)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(AiAnalysisLog.objects.count(), 2)
+        self.assertFalse(ImageThumbnail.objects.exists())
+
+
+class AnalysisStatsTests(TestCase):
+    """ログ登録ごとの集計と集計APIのテスト"""
+
+    def setUp(self):
+        # 他のテストで溜まった加算を持ち越さないよう、プロセス内の加算をテストごとに作り直す
+        settings_override = override_settings(ANALYSIS_ROLLUP_FLUSH_INTERVAL_MS=60_000)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        rollups._accumulator = None
+        self.addCleanup(setattr, rollups, '_accumulator', None)
+
+    def create_log(self, success, processing_ms, classification_id=None):
+        now = timezone.now()
+        return AiAnalysisLog.objects.create(
+            image_path='https://example.com/image.jpg',
+            success=success,
+            message='success' if success else 'Error:E50012',
+            classification_id=classification_id,
+            request_timestamp=now - timedelta(milliseconds=processing_ms),
+            response_timestamp=now,
+        )
+
+    def test_incremental_rollups_match_rebuild_and_serve_stats(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(1, 101):
+                self.create_log(True, i * 10, classification_id=1 if i % 4 else 2)
+            for _ in range(25):
+                self.create_log(False, 50)
+        flush_hourly_rollups()
+
+        incremental = {
+            rollup.classification: (rollup.total_count, rollup.processing_time_sketch)
+            for rollup in AnalysisHourlyRollup.objects.all()
+        }
+        hour = truncate_to_hour(timezone.now())
+        rebuild_hourly_rollups(hour, hour + timedelta(hours=1))
+        rebuilt = {
+            rollup.classification: (rollup.total_count, rollup.processing_time_sketch)
+            for rollup in AnalysisHourlyRollup.objects.all()
+        }
+        self.assertEqual(incremental, rebuilt)
+
+        summary = self.client.get(reverse('get-analysis-stats')).json()['data']['summary']
+        self.assertEqual(summary['total_count'], 125)
+        self.assertEqual(summary['success_rate'], 0.8)
+        self.assertEqual(
+            [(item['class'], item['count']) for item in summary['classes']], [(1, 75), (2, 25)])
+        # 失敗25件(50ms)を含む125件の95パーセンタイルは930ms（対数バケットの相対誤差1%以内）
+        self.assertAlmostEqual(summary['processing_time_ms']['p95'], 930, delta=930 * 0.01)
+
+    def test_log_inserts_do_not_lock_rollup_rows(self):
+        # 登録ごとの集計行の行ロック・更新はせず、溜めた加算を時間帯・分類ごとにまとめて反映する
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(20):
+                with self.assertNumQueries(1):
+                    self.create_log(True, 100, classification_id=1 if i % 2 else 2)
+        self.assertFalse(AnalysisHourlyRollup.objects.exists())
+
+        # 集計APIは参照前にこのプロセスの加算を反映する
+        summary = self.client.get(reverse('get-analysis-stats')).json()['data']['summary']
+        self.assertEqual(summary['total_count'], 20)
+        self.assertEqual(
+            sorted(AnalysisHourlyRollup.objects.values_list('classification', 'total_count')), [(1, 10), (2, 10)])
+
+    def test_background_thread_flushes_while_idle(self):
+        # 登録がなくても間隔ごとに反映する（別スレッドでDBに書き込まないよう反映処理を差し替える）
+        flushed = threading.Event()
+        accumulator = rollups.RollupAccumulator(flush_interval=0.01)
+        accumulator.flush = lambda blocking=True: flushed.set()
+        accumulator.start()
+        self.addCleanup(accumulator.close)
+
+        self.assertTrue(flushed.wait(5))
+
+    def test_invalid_range_returns_bad_request(self):
+        response = self.client.get(reverse('get-analysis-stats'), {
+            'start': '2025-01-01T00:00:00Z', 'end': '2025-03-01T00:00:00Z'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchiveAnalysisLogsTests(TestCase):
+    """保持期間を過ぎたログが月単位で書き出され、DBから削除されることのテスト"""
+
+    def setUp(self):
+        self.media_root = use_local_storage(self)
+        self.archive_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_root)
+        settings_override = override_settings(
+            ANALYSIS_LOG_ARCHIVE_STORAGE_BACKEND='local', ANALYSIS_LOG_ARCHIVE_LOCAL_ROOT=self.archive_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_old_months_are_archived_and_deleted(self):
+        old_at = timezone.now() - timedelta(days=120)
+        old = AiAnalysisLog.objects.create(image_path='https://example.com/old.jpg', success=True)
+        recent = AiAnalysisLog.objects.create(image_path='https://example.com/recent.jpg', success=True)
+        AiAnalysisLog.objects.filter(id=old.id).update(created_at=old_at)
+
+        call_command('archive_analysis_logs', older_than_days=30, stdout=io.StringIO())
+
+        self.assertEqual(list(AiAnalysisLog.objects.values_list('id', flat=True)), [recent.id])
+        month = old_at.astimezone(dt_timezone.utc)
+        archive_path = os.path.join(self.archive_root, 'ai_analysis_log', f"{month:%Y-%m}.ndjson.gz")
+        with gzip.open(archive_path, 'rt', encoding='utf-8') as archive:
+            rows = [json.loads(line) for line in archive]
+        self.assertEqual([(row['id'], row['image_path']) for row in rows], [(old.id, 'https://example.com/old.jpg')])
+        # 画像の公開用の保存先には書き出さない
+        self.assertEqual(os.listdir(self.media_root), [])
+
+    def test_archive_to_public_image_bucket_is_rejected(self):
+        with override_settings(ANALYSIS_LOG_ARCHIVE_STORAGE_BACKEND='gcs',
+                               ANALYSIS_LOG_ARCHIVE_GCS_BUCKET_NAME='images', GCS_BUCKET_NAME='images'):
+            with self.assertRaises(CommandError):
+                call_command('archive_analysis_logs', older_than_days=30, stdout=io.StringIO())
+
+    def test_dry_run_keeps_logs(self):
+        log = AiAnalysisLog.objects.create(image_path='https://example.com/old.jpg', success=True)
+        AiAnalysisLog.objects.filter(id=log.id).update(created_at=timezone.now() - timedelta(days=120))
+
+        call_command('archive_analysis_logs', older_than_days=30, dry_run=True, stdout=io.StringIO())
+
+        self.assertTrue(AiAnalysisLog.objects.filter(id=log.id).exists())
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'パーティション分割はPostgreSQLのみ')
+class AnalysisLogPartitionTests(TestCase):
+    """月単位のパーティションの作成・削除と件数の概算のテスト"""
+
+    def test_month_partition_is_created_and_dropped(self):
+        month = datetime(2100, 1, 1, tzinfo=dt_timezone.utc)
+        log = AiAnalysisLog.objects.create(image_path='https://example.com/future.jpg', success=True)
+        self.assertTrue(is_partitioned())
+
+        # defaultパーティションがないため、パーティションのない月の行は登録できない
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AiAnalysisLog.objects.filter(id=log.id).update(created_at=month + timedelta(days=14))
+
+        name = create_month_partition(month)
+        AiAnalysisLog.objects.filter(id=log.id).update(created_at=month + timedelta(days=14))
+
+        self.assertEqual(name, partition_name(month))
+        self.assertIn(name, [partition[0] for partition in list_partitions()])
+        self.assertEqual(count_partition_rows(name), 1)
+        self.assertEqual(create_month_partition(month), name)
+
+        drop_partition(name)
+
+        self.assertNotIn(name, [partition[0] for partition in list_partitions()])
+        self.assertFalse(AiAnalysisLog.objects.filter(id=log.id).exists())
+
+    def test_ensure_partitions_creates_missing_months(self):
+        now = datetime(2100, 3, 10, tzinfo=dt_timezone.utc)
+
+        created = ensure_partitions(1, now)
+
+        self.assertEqual(created, ['ai_analysis_log_p2100_03', 'ai_analysis_log_p2100_04'])
+        self.assertEqual(ensure_partitions(1, now), [])
+
+    def test_estimate_count_sums_partitions(self):
+        AiAnalysisLog.objects.bulk_create(
+            [AiAnalysisLog(image_path=f"https://example.com/{i}.jpg", success=True) for i in range(5)])
+        with connection.cursor() as cursor:
+            # 親テーブルではなく各パーティションのみ統計を更新する（自動ANALYZEと同じ状態）
+            for name in [partition[0] for partition in list_partitions()]:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(name)}")
+
+        self.assertEqual(estimate_count(AiAnalysisLog.objects.all()), 5)
+
+
+@override_settings(IMAGE_ANALYZER_BACKEND='local')
+class BatchAnalysisTests(TestCase):
+    """一括解析APIのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        perceptual_index.clear()
+        use_local_storage(self)
+        use_standin_analyzer(self)
+
+    def test_invalid_image_fails_only_its_item(self):
+        images = [
+            image_upload('red.jpg', color='red'),
+            SimpleUploadedFile('broken.jpg', b'not an image', 'image/jpeg'),
+            image_upload('blue.jpg', color='blue'),
+        ]
+
+        response = self.client.post(reverse('analyze-image-batch'), {'images': images})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], '2/3 images analyzed successfully')
+        results = body['results']
+        self.assertEqual([result['filename'] for result in results], ['red.jpg', 'broken.jpg', 'blue.jpg'])
+        self.assertEqual([result['success'] for result in results], [True, False, True])
+        self.assertTrue(results[1]['message'].startswith('Failed to upload image: Invalid image file'))
+        self.assertIsNone(results[1]['id'])
+        self.assertEqual(
+            sorted(AiAnalysisLog.objects.values_list('id', flat=True)), [results[0]['id'], results[2]['id']])
+
+    @override_settings(BATCH_ANALYZE_MAX_FILES=2)
+    def test_too_many_images_are_rejected(self):
+        images = [image_upload(f"{i}.jpg") for i in range(3)]
+
+        response = self.client.post(reverse('analyze-image-batch'), {'images': images})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'Too many images: 3 (max: 2)')
+        self.assertFalse(AiAnalysisLog.objects.exists())
+
+    def test_images_are_required(self):
+        response = self.client.post(reverse('analyze-image-batch'), {})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'images files are required')
+
+
+@override_settings(IMAGE_ANALYZER_BACKEND='local', STREAMING_UPLOADS=True)
+class StreamingUploadTests(TestCase):
+    """ストリーミングアップロードで保存した画像の検証のテスト"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = use_local_storage(self)
+        use_standin_analyzer(self)
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.media_root) for name in names]
+
+    def test_valid_image_is_stored_and_analyzed(self):
+        response = self.client.post(reverse('analyze-image'), {'image': image_upload()})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_corrupt_image_is_rejected_and_deleted(self):
+        buffer = io.BytesIO()
+        Image.effect_noise((64, 64), 64).save(buffer, 'PNG')
+        data = bytearray(buffer.getvalue())
+        # 先頭のヘッダーは正しいまま、画像データの途中を壊す
+        data[len(data) // 2] ^= 0xFF
+
+        response = self.client.post(
+            reverse('analyze-image'), {'image': SimpleUploadedFile('image.png', bytes(data), 'image/png')})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['message'].startswith('Invalid image file'))
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(AiAnalysisLog.objects.exists())
+
+    def test_interrupted_upload_is_discarded(self):
+        handler = StreamingStorageUploadHandler(field_name='image')
+        # 対象のフィールドは後続のハンドラーに渡さない
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file('image', 'image.jpg', 'image/jpeg', None)
+        data = image_upload().read()
+        handler.receive_data_chunk(data, 0)
+        self.assertEqual(len(self.stored_files()), 1)  # 書き込み途中の一時ファイル
+
+        handler.upload_interrupted()
+
+        self.assertEqual(self.stored_files(), [])
+
+
+@override_settings(IMAGE_ANALYZER_BACKEND='local')
+class AnalysisJobTests(TestCase):
+    """非同期解析ジョブの登録・取り出し・再投入と状態取得のテスト"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = use_local_storage(self)
+        use_standin_analyzer(self)
+
+    def test_accepted_job_is_processed_and_polled(self):
+        response = self.client.post(reverse('analyze-image-async'), {'image': image_upload()})
+
+        self.assertEqual(response.status_code, 202)
+        job = AnalysisJob.objects.get(id=response.json()['job_id'])
+        status_url = response.json()['status_url']
+        self.assertEqual(status_url, reverse('get-analysis-job', args=[job.id]))
+        # 画像はWebとワーカーで共有する保存先に一時保存される
+        spool_file = job.spool_path.removeprefix('file://')
+        self.assertTrue(spool_file.startswith(os.path.join(self.media_root, 'job_spool', '')))
+        self.assertTrue(os.path.exists(spool_file))
+        self.assertEqual(self.client.get(status_url).json()['data']['status'], 'queued')
+        with open(spool_file, 'rb') as f:
+            uploaded = f.read()
+
+        # ワーカーは一時保存した画像を保存先の中で複製し、アップロードし直さない
+        def save(*args, **kwargs):
+            raise AssertionError('spooled image must not be uploaded again')
+        storage.get_storage_backend().save = save
+
+        self.assertTrue(process_next_job())
+
+        data = self.client.get(status_url).json()['data']
+        self.assertEqual(data['status'], 'completed')
+        self.assertEqual(data['attempts'], 1)
+        self.assertTrue(data['result']['success'])
+        self.assertFalse(os.path.exists(spool_file))
+        image_path = AiAnalysisLog.objects.get().image_path.removeprefix('https://example.com/media/')
+        with open(os.path.join(self.media_root, image_path), 'rb') as f:
+            self.assertEqual(f.read(), uploaded)
+        self.assertFalse(process_next_job())
+
+    def test_unknown_job_is_not_found(self):
+        response = self.client.get(reverse('get-analysis-job', args=['00000000-0000-0000-0000-000000000000']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        job = enqueue_analysis_job(image_upload(), timezone.now())
+
+        claimed = claim_next_job()
+
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.status, AnalysisJob.Status.RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(claim_next_job())
+
+    @override_settings(ANALYSIS_JOB_STALE_SECONDS=60, ANALYSIS_JOB_MAX_ATTEMPTS=2)
+    def test_stale_job_is_requeued_then_failed(self):
+        job = enqueue_analysis_job(image_upload(), timezone.now())
+        spool_file = job.spool_path.removeprefix('file://')
+        stalled_at = timezone.now() - timedelta(minutes=5)
+
+        claim_next_job()
+        AnalysisJob.objects.filter(id=job.id).update(started_at=stalled_at)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.Status.QUEUED)
+
+        # 試行回数の上限に達したジョブは失敗扱いにし、一時保存した画像を削除する
+        self.assertEqual(claim_next_job().attempts, 2)
+        AnalysisJob.objects.filter(id=job.id).update(started_at=stalled_at)
+        self.assertEqual(requeue_stale_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.Status.FAILED)
+        self.assertEqual(job.message, 'Analysis job timed out')
+        self.assertFalse(os.path.exists(spool_file))
+
+
+class AnalysisLogWriterTests(TestCase):
+    """bufferedモードの書き込みのテスト（IDの予約はシーケンスの代わりにカウンターを使う）"""
+
+    def test_ids_are_returned_before_rows_are_flushed(self):
+        ids = itertools.count(1000)
+        writer = AnalysisLogWriter(
+            batch_size=10, flush_interval=60, reserve_ids=lambda count: [next(ids) for _ in range(count)])
+        self.addCleanup(writer.close)
+
+        logs = [writer.write(image_path=f"https://example.com/{i}.jpg", success=True) for i in range(3)]
+
+        self.assertEqual([log.id for log in logs], [1000, 1001, 1002])
+        self.assertFalse(AiAnalysisLog.objects.exists())
+
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(
+            list(AiAnalysisLog.objects.order_by('id').values_list('id', flat=True)), [1000, 1001, 1002])
+        # bulk_create でも集計に反映されること
+        self.assertEqual(sum(AnalysisHourlyRollup.objects.values_list('total_count', flat=True)), 3)
+
+    def test_failing_row_is_dropped_after_retries(self):
+        # 予約したIDと同じIDの行が既にあり、まとめての書き込みが常に失敗する
+        AiAnalysisLog.objects.create(id=1000, image_path='https://example.com/existing.jpg', success=True)
+        ids = itertools.count(1000)
+        writer = AnalysisLogWriter(
+            batch_size=10, flush_interval=60, reserve_ids=lambda count: [next(ids) for _ in range(count)],
+            max_attempts=2)
+        self.addCleanup(writer.close)
+
+        for i in range(3):
+            writer.write(image_path=f"https://example.com/{i}.jpg", success=True)
+
+        # 1回目はバッファに戻し、2回目は1行ずつ書き込んで失敗した行のみ破棄する
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(
+            list(AiAnalysisLog.objects.order_by('id').values_list('id', 'image_path')),
+            [(1000, 'https://example.com/existing.jpg'),
+             (1001, 'https://example.com/1.jpg'),
+             (1002, 'https://example.com/2.jpg')])
+
+
+class FakeClock:
+    """sleep で進む時計（再試行の待機・サーキットブレーカーの遮断時間を実際に待たずに確認する）"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ResilientAnalyzerTests(SimpleTestCase):
+    """代替解析バックエンドの障害注入による障害対策のテスト"""
+
+    def build(self, clock, hedge_delay=0, **standin_options):
+        standin = LocalStandInAnalyzer(
+            latency='fixed', latency_ms=100, error_rate=0, seed=0, sleep=clock.sleep, **standin_options)
+        breaker = CircuitBreaker('local', failure_rate=0.5, window=4, min_calls=4, open_seconds=30, clock=clock)
+        return standin, ResilientAnalyzer(
+            standin, RetryPolicy(3, base_delay=0.2, max_delay=2), breaker, ConcurrencyLimiter('local', 1),
+            call_timeout=1, total_timeout=20, concurrency_wait=0, hedge_delay=hedge_delay,
+            sleep=clock.sleep, clock=clock)
+
+    def test_retries_retryable_faults_with_backoff(self):
+        clock = FakeClock()
+        standin, analyzer = self.build(clock, fault='deadline', fault_rate=1)
+
+        result = analyzer.analyze('image.jpg')
+
+        self.assertFalse(result['success'])
+        self.assertTrue(result['message'].startswith('Analysis failed: 504'))
+        # 3回とも期限(1秒)まで待ち、間に上限内のバックオフを2回挟む
+        self.assertEqual(clock.sleeps[0::2], [1, 1, 1])
+        self.assertLessEqual(clock.sleeps[1], 0.2)
+        self.assertLessEqual(clock.sleeps[3], 0.4)
+        self.assertEqual(analyzer.limiter.active, 0)
+
+        standin.fault_rate = 0
+        self.assertTrue(analyzer.analyze('image.jpg')['success'])
+
+    def test_circuit_breaker_fails_fast_and_recovers(self):
+        clock = FakeClock()
+        standin, analyzer = self.build(clock, fault='unavailable', fault_rate=1)
+
+        analyzer.analyze('image.jpg')
+        analyzer.analyze('image.jpg')
+        self.assertEqual(analyzer.breaker.state, CircuitBreaker.OPEN)
+
+        # 遮断中は代替実装を呼び出さずに失敗する
+        sleeps = len(clock.sleeps)
+        result = analyzer.analyze('image.jpg')
+        self.assertEqual(result['message'], 'Analysis unavailable: local circuit breaker is open')
+        self.assertEqual(len(clock.sleeps), sleeps)
+
+        # 遮断時間の経過後、試行が成功すれば復帰する
+        clock.now += 30
+        standin.fault_rate = 0
+        self.assertTrue(analyzer.analyze('image.jpg')['success'])
+        self.assertEqual(analyzer.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_hedged_request_answers_slow_call(self):
+        # 最初の呼び出しはテストが解放するまで応答しない（経過時間に依存せずヘッジが応答したことを確認する）
+        release = threading.Event()
+        self.addCleanup(release.set)
+        calls = []
+        calls_lock = threading.Lock()
+
+        def sleep(seconds):
+            with calls_lock:
+                calls.append(seconds)
+                first = len(calls) == 1
+            if first:
+                release.wait(5)
+
+        standin = LocalStandInAnalyzer(latency='fixed', latency_ms=0, error_rate=0, fault_rate=0, sleep=sleep)
+        analyzer = ResilientAnalyzer(standin, limiter=ConcurrencyLimiter('local', 2), hedge_delay=0.001)
+
+        self.assertTrue(analyzer.analyze('image.jpg')['success'])
+        self.assertFalse(release.is_set())
+        self.assertEqual(len(calls), 2)
+
+    def test_hedged_request_needs_free_slot(self):
+        # 同時実行数の上限に空きがなければヘッジリクエストは送らない
+        limiter = ConcurrencyLimiter('local', 1)
+        hedge_checked = threading.Event()
+        try_acquire = limiter.try_acquire
+
+        def checked_try_acquire():
+            acquired = try_acquire()
+            hedge_checked.set()
+            return acquired
+
+        limiter.try_acquire = checked_try_acquire
+        calls = []
+
+        def sleep(seconds):
+            calls.append(seconds)
+            hedge_checked.wait(5)
+
+        standin = LocalStandInAnalyzer(latency='fixed', latency_ms=0, error_rate=0, fault_rate=0, sleep=sleep)
+        analyzer = ResilientAnalyzer(standin, limiter=limiter, hedge_delay=0.001)
+
+        self.assertTrue(analyzer.analyze('image.jpg')['success'])
+        self.assertTrue(hedge_checked.is_set())
+        self.assertEqual(len(calls), 1)
+
+
+class StubStorageClient:
+    """バケットのハンドルの取得を記録するGCSクライアントの代わり"""
+
+    def __init__(self):
+        self.bucket_names = []
+
+    def bucket(self, bucket_name):
+        self.bucket_names.append(bucket_name)
+        return (self, bucket_name)
+
+
+class CloudClientsTests(SimpleTestCase):
+    """Google Cloudクライアントがプロセス内で1度だけ生成され、使い回されることのテスト"""
+
+    def test_clients_are_created_once_and_reused(self):
+        created = []
+
+        def factory(client_class):
+            def create():
+                created.append(client_class())
+                return created[-1]
+            return create
+
+        clients = CloudClients(
+            storage_factory=factory(StubStorageClient), vision_factory=factory(object),
+            vision_async_factory=factory(object))
+
+        self.assertIs(clients.bucket('images'), clients.bucket('images'))
+        self.assertIs(clients.vision_client(), clients.vision_client())
+
+        async def get_async_clients():
+            return clients.vision_async_client(), clients.vision_async_client()
+
+        first, second = async_to_sync(get_async_clients)()
+        self.assertIs(first, second)
+        # GCS・Vision・非同期Visionのクライアントを1つずつ生成し、バケットのハンドルも使い回す
+        self.assertEqual(len(created), 3)
+        self.assertEqual(created[0].bucket_names, ['images'])
+
+    def test_injected_clients_are_used_without_creating(self):
+        def create():
+            raise AssertionError('client must not be created')
+
+        clients = CloudClients(storage_factory=create, vision_factory=create, vision_async_factory=create)
+        storage_client, vision_client = StubStorageClient(), object()
+        clients.inject(storage_client=storage_client, vision_client=vision_client)
+
+        self.assertTrue(clients.warm_up('images'))
+        self.assertEqual(clients.bucket('images'), (storage_client, 'images'))
+        self.assertIs(clients.vision_client(), vision_client)
+        self.assertEqual(storage_client.bucket_names, ['images'])
+
+        # fork後も差し替えたクライアントを維持する
+        clients._after_fork()
+        self.assertIs(clients.storage_client(), storage_client)
+        self.assertIs(clients.vision_client(), vision_client)
+
+
+class LabelCacheTests(TestCase):
+    """ラベル名⇔IDのプロセス内キャッシュのテスト"""
+
+    def setUp(self):
+        label_cache.clear()
+        label_cache.warmed = True
+        self.addCleanup(label_cache.clear)
+
+    def test_repeated_label_lookup_uses_cache(self):
+        label = ObjectLabel.objects.create(name='cat')
+
+        self.assertEqual(views.get_classification_name(label.id), 'cat')
+        with self.assertNumQueries(0):
+            self.assertEqual(views.get_classification_name(label.id), 'cat')
+
+    def test_saved_label_updates_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            label = ObjectLabel.objects.create(name='cat')
+        with self.captureOnCommitCallbacks(execute=True):
+            label.name = 'dog'
+            label.save()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_label_name(label.id), 'dog')
+            self.assertEqual(get_or_create_label_id('dog'), (label.id, False))
+        self.assertIsNone(label_cache.get_id('cat'))
+
+    def test_deleted_label_is_evicted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            label_id, _ = get_or_create_label_id('cat')
+        self.assertEqual(label_cache.get_name(label_id), 'cat')
+
+        ObjectLabel.objects.filter(id=label_id).get().delete()
+
+        self.assertIsNone(label_cache.get_id('cat'))
+        self.assertIsNone(get_label_name(label_id))
+
+    def test_unknown_label_lookup_is_cached(self):
+        self.assertIsNone(get_label_name(9999))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_label_name(9999))
+
+        # 登録されたラベルは記録した未登録のIDより優先する
+        with self.captureOnCommitCallbacks(execute=True):
+            ObjectLabel.objects.create(id=9999, name='cat')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_label_name(9999), 'cat')
+
+    def test_missing_label_is_looked_up_again_after_ttl(self):
+        clock = FakeClock()
+        cache = LabelCache(10, miss_ttl=60, clock=clock)
+
+        cache.put_missing(1)
+        self.assertIs(cache.get_name(1), MISSING)
+        clock.now += 60
+        self.assertIsNone(cache.get_name(1))
+
+    def test_put_replaces_previous_mapping(self):
+        cache = LabelCache(10)
+        cache.put(1, 'cat')
+
+        # 同じ名前を別のIDで登録し直した場合、変更前のIDから名前を引けない
+        cache.put(2, 'cat')
+        self.assertIsNone(cache.get_name(1))
+        self.assertEqual(cache.get_id('cat'), 2)
+
+        # 同じIDの名前を変更した場合、変更前の名前からIDを引けない
+        cache.put(2, 'dog')
+        self.assertIsNone(cache.get_id('cat'))
+        self.assertEqual(cache.get_name(2), 'dog')
+        self.assertEqual(len(cache), 1)
+
+    def test_concurrent_registration_returns_existing_label(self):
+        # 未登録の確認と登録の間に、他のワーカーが同じラベルを登録した状態を再現する
+        registered = []
+
+        def register_after_lookup(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if not registered and sql.startswith('SELECT') and 'object_labels' in sql:
+                registered.append(ObjectLabel.objects.bulk_create([ObjectLabel(name='cat')]))
+            return result
+
+        with connection.execute_wrapper(register_after_lookup):
+            label_id, created = get_or_create_label_id('cat')
+
+        self.assertFalse(created)
+        self.assertEqual(label_id, ObjectLabel.objects.get(name='cat').id)
+        self.assertEqual(label_cache.get_id('cat'), label_id)
+
+
+class LocalStorageTests(SimpleTestCase):
+    """ローカルファイルシステムの保存先への保存・読み込み・配信のテスト"""
+
+    def setUp(self):
+        self.media_root = use_local_storage(self)
+        self.storage = storage.get_storage_backend()
+
+    def test_saved_image_is_read_served_and_deleted(self):
+        upload = image_upload()
+        data = upload.read()
+
+        storage_path = self.storage.save(upload, 'images/a.jpg', 'image/jpeg')
+
+        self.assertEqual(storage_path, f"file://{os.path.join(self.media_root, 'images', 'a.jpg')}")
+        # 一時ファイルは確定時にリネームされ、残らない
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'images')), ['a.jpg'])
+        self.assertEqual(self.storage.read(storage_path), data)
+
+        public_url = self.storage.public_url('images/a.jpg')
+        self.assertEqual(public_url, 'https://example.com/media/images/a.jpg')
+        self.assertEqual(self.storage.filename_from_public_url(public_url), 'images/a.jpg')
+
+        response = self.client.get(reverse('serve-stored-image', args=['images/a.jpg']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), data)
+
+        self.storage.delete(storage_path)
+        response = self.client.get(reverse('serve-stored-image', args=['images/a.jpg']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_only_images_and_thumbnails_are_served(self):
+        for filename in ['job_spool/a.upload', 'ai_analysis_log/2026-01.ndjson.gz', 'images/b.jpg']:
+            self.storage.save(image_upload(), filename, 'application/octet-stream')
+
+        for filename in ['job_spool/a.upload', 'ai_analysis_log/2026-01.ndjson.gz', 'images/../job_spool/a.upload']:
+            response = self.client.get(reverse('serve-stored-image', args=[filename]))
+            self.assertEqual(response.status_code, 404, filename)
+        response = self.client.get(reverse('serve-stored-image', args=['images/b.jpg']))
+        self.assertEqual(response.status_code, 200)
+
+    def test_discarded_writer_leaves_no_file(self):
+        writer = self.storage.open_writer('images/partial.jpg', 'image/jpeg')
+        writer.write(b'partial')
+
+        self.storage.discard_writer(writer)
+
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'images')), [])
+
+    def test_paths_outside_root_are_rejected(self):
+        with self.assertRaises(SuspiciousFileOperation):
+            self.storage.path('../outside.jpg')
+        with self.assertRaises(SuspiciousFileOperation):
+            self.storage.read('file:///etc/passwd')
+
+
+class LocalStandInAnalyzerTests(SimpleTestCase):
+    """ローカルの代替解析バックエンドのレイテンシ・エラー率・シードのテスト"""
+
+    def make_analyzer(self, **options):
+        sleeps = []
+        options = {'latency': 'fixed', 'latency_ms': 0, 'error_rate': 0, 'fault_rate': 0, 'seed': 0, **options}
+        return LocalStandInAnalyzer(sleep=sleeps.append, **options), sleeps
+
+    def test_same_seed_returns_same_results(self):
+        first, _ = self.make_analyzer(seed=7, error_rate=0.3, classes=4)
+        second, _ = self.make_analyzer(seed=7, error_rate=0.3, classes=4)
+
+        results = [first.analyze('gs://bucket/image.jpg') for _ in range(50)]
+
+        self.assertEqual(results, [second.analyze('gs://bucket/image.jpg') for _ in range(50)])
+        self.assertTrue(any(not result['success'] for result in results))
+        self.assertTrue({result['estimated_data']['class'] for result in results if result['success']} <= {1, 2, 3, 4})
+
+    def test_error_rate(self):
+        analyzer, _ = self.make_analyzer(error_rate=1)
+
+        self.assertEqual(
+            analyzer.analyze('gs://bucket/image.jpg'),
+            {'success': False, 'message': 'Error:E50012', 'estimated_data': {}})
+
+    def test_latency_distributions(self):
+        analyzer, sleeps = self.make_analyzer(latency_ms=250)
+        analyzer.analyze('gs://bucket/image.jpg')
+        self.assertEqual(sleeps, [0.25])
+
+        analyzer, sleeps = self.make_analyzer(latency='uniform', latency_ms=200, spread_ms=50)
+        for _ in range(100):
+            analyzer.analyze('gs://bucket/image.jpg')
+        self.assertTrue(all(0.15 <= latency <= 0.25 for latency in sleeps))
+
+        # 対数正規分布の中央値は latency_ms になる
+        analyzer, sleeps = self.make_analyzer(latency='longtail', latency_ms=100, sigma=1.0)
+        for _ in range(1001):
+            analyzer.analyze('gs://bucket/image.jpg')
+        self.assertAlmostEqual(sorted(sleeps)[500], 0.1, delta=0.02)
+        self.assertGreater(max(sleeps), 0.5)
+
+        with self.assertRaises(ValueError):
+            LocalStandInAnalyzer(latency='bimodal')
+
+    def test_latency_beyond_timeout_raises_deadline(self):
+        analyzer, sleeps = self.make_analyzer(latency_ms=500)
+
+        with self.assertRaises(google_exceptions.DeadlineExceeded):
+            analyzer.analyze('gs://bucket/image.jpg', timeout=0.1)
+        self.assertEqual(sleeps, [0.1])
+
+
+@override_settings(IMAGE_ANALYZER_BACKEND='local')
+class AsyncViewsTests(TestCase):
+    """非同期（ASGI）版の解析・ログ一覧ビューのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        perceptual_index.clear()
+        use_local_storage(self)
+        use_standin_analyzer(self)
+
+    def analyze(self, upload):
+        request = AsyncRequestFactory().post('/api/analyze/', {'image': upload})
+        return async_to_sync(async_views.analyze_image)(request)
+
+    def test_analyze_saves_log_and_reuses_cache(self):
+        response = self.analyze(image_upload())
+
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertTrue(body['success'])
+        self.assertFalse(body['cache_hit'])
+        self.assertEqual(body['id'], AiAnalysisLog.objects.get().id)
+        self.assertIn('Server-Timing', response)
+
+        # 同じ画像は解析結果キャッシュから返す
+        body = json.loads(self.analyze(image_upload()).content)
+        self.assertTrue(body['cache_hit'])
+        self.assertEqual(AiAnalysisLog.objects.count(), 2)
+
+    def test_invalid_image_is_rejected(self):
+        response = self.analyze(SimpleUploadedFile('broken.jpg', b'not an image', 'image/jpeg'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(AiAnalysisLog.objects.exists())
+
+    def test_logs_match_sync_view(self):
+        for i in range(3):
+            AiAnalysisLog.objects.create(image_path=f"https://example.com/{i}.jpg", success=True)
+        params = {'page': 2, 'page_size': 2}
+
+        request = AsyncRequestFactory().get('/api/logs/', params)
+        response = async_to_sync(async_views.get_analysis_logs)(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content), self.client.get(reverse('get-analysis-logs'), params).json())
+
+
+@override_settings(IMAGE_ANALYZER_BACKEND='local', PARALLEL_UPLOAD_ANALYSIS=True)
+class ParallelPipelineTests(TestCase):
+    """アップロードと解析を並行して実行するモードのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        perceptual_index.clear()
+        use_local_storage(self)
+        self.analyzer_calls = []
+        use_standin_analyzer(self, sleep=self.analyzer_calls.append)
+
+    def test_log_records_overlap(self):
+        response = self.client.post(reverse('analyze-image'), {'image': image_upload()})
+
+        self.assertEqual(response.status_code, 200)
+        log = AiAnalysisLog.objects.get(id=response.json()['id'])
+        self.assertTrue(log.success)
+        self.assertTrue(log.image_path.startswith('https://example.com/media/'))
+        self.assertGreaterEqual(log.overlap_saved_ms, 0)
+        self.assertEqual(len(self.analyzer_calls), 1)
+
+    def test_failed_analysis_is_logged(self):
+        use_standin_analyzer(self, error_rate=1)
+
+        response = self.client.post(reverse('analyze-image'), {'image': image_upload()})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['success'])
+        log = AiAnalysisLog.objects.get()
+        self.assertFalse(log.success)
+        self.assertIsNotNone(log.overlap_saved_ms)
+
+    def test_failed_upload_discards_analysis(self):
+        response = self.client.post(
+            reverse('analyze-image'), {'image': SimpleUploadedFile('broken.jpg', b'not an image', 'image/jpeg')})
+
+        # 解析は並行して実行されるが、保存先がないためログは残さない
+        self.assertEqual(len(self.analyzer_calls), 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['message'].startswith('Failed to upload image: Invalid image file'))
+        self.assertFalse(AiAnalysisLog.objects.exists())
+
+
+class PreprocessTests(TestCase):
+    """解析前の縮小・再エンコードのテスト"""
+
+    def jpeg(self, size, orientation=None):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        Image.linear_gradient('L').resize(size).convert('RGB').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('image.jpg', buffer.getvalue(), 'image/jpeg')
+
+    def test_large_image_is_downscaled(self):
+        upload = self.jpeg((3000, 2000))
+
+        result = preprocess_image_for_analysis(upload, max_edge=1024, output_format='WEBP', quality=80)
+
+        self.assertTrue(result['reencoded'])
+        self.assertEqual((result['original_width'], result['original_height']), (3000, 2000))
+        self.assertEqual(max(result['width'], result['height']), 1024)
+        self.assertLess(len(result['content']), result['original_bytes'])
+        with Image.open(io.BytesIO(result['content'])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (result['width'], result['height'])))
+        # 元画像はストレージへ保存するため読み込み位置を戻す
+        self.assertEqual(upload.tell(), 0)
+
+    def test_exif_orientation_is_applied(self):
+        result = preprocess_image_for_analysis(self.jpeg((40, 20), orientation=6), max_edge=1024)
+
+        self.assertTrue(result['reencoded'])
+        self.assertEqual((result['width'], result['height']), (20, 40))
+
+    def test_small_image_is_sent_as_is(self):
+        upload = self.jpeg((40, 20))
+
+        result = preprocess_image_for_analysis(upload, max_edge=1024)
+
+        self.assertFalse(result['reencoded'])
+        self.assertEqual(result['content'], upload.read())
+        self.assertIsNone(preprocess_image_for_analysis(SimpleUploadedFile('broken.jpg', b'not an image')))
+
+    @override_settings(IMAGE_ANALYZER_BACKEND='local', ANALYSIS_PREPROCESS=True)
+    def test_analysis_reports_preprocess_stage(self):
+        cache.clear()
+        perceptual_index.clear()
+        use_local_storage(self)
+        use_standin_analyzer(self)
+
+        response = self.client.post(reverse('analyze-image'), {'image': self.jpeg((2000, 1500))})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('preprocess;dur=', response['Server-Timing'])
+
+
+@override_settings(IMAGE_ANALYZER_BACKEND='local')
+class StageTimingTests(TestCase):
+    """処理段階ごとの所要時間が Server-Timing ヘッダー・解析ログ・ログ一覧に出力されることのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        perceptual_index.clear()
+        use_local_storage(self)
+        use_standin_analyzer(self)
+
+    def test_stage_timings_are_reported_and_stored(self):
+        response = self.client.post(reverse('analyze-image'), {'image': image_upload()})
+
+        self.assertEqual(response.status_code, 200)
+        header = dict(item.split(';dur=') for item in response['Server-Timing'].split(', '))
+        self.assertTrue({'cache_lookup', 'upload', 'analyze', 'log_write', 'total'} <= set(header))
+
+        # ログの書き込み時間はログ自体には含まれない
+        log = AiAnalysisLog.objects.get(id=response.json()['id'])
+        self.assertTrue({'cache_lookup', 'upload', 'analyze'} <= set(log.stage_timings))
+        self.assertNotIn('log_write', log.stage_timings)
+        self.assertTrue(all(duration >= 0 for duration in log.stage_timings.values()))
+
+        logs = self.client.get(reverse('get-analysis-logs')).json()['data']['logs']
+        self.assertEqual(logs[0]['stage_timings'], log.stage_timings)
+
+
+def metric_value(body, name, labels):
+    """Prometheusのテキスト形式から系列の値を取り出す（系列がない場合は0）"""
+    for family in text_string_to_metric_families(body):
+        for sample in family.samples:
+            if sample.name == name and sample.labels == labels:
+                return sample.value
+    return 0
+
+
+@override_settings(IMAGE_ANALYZER_BACKEND='local')
+class MetricsTests(TestCase):
+    """/metrics のリクエスト数・解析結果・処理段階のメトリクスのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        perceptual_index.clear()
+        use_local_storage(self)
+        use_standin_analyzer(self)
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_analysis_is_counted(self):
+        series = [
+            ('image_analyzer_http_requests_total', {'endpoint': 'api/analyze/', 'method': 'POST', 'status': '200'}),
+            ('image_analyzer_analysis_results_total', {'analyzer': 'local', 'success': 'true', 'message': 'success'}),
+            ('image_analyzer_pipeline_stage_duration_seconds_count', {'stage': 'upload'}),
+        ]
+        body = self.scrape()
+        before = [metric_value(body, name, labels) for name, labels in series]
+
+        self.client.post(reverse('analyze-image'), {'image': image_upload()})
+
+        body = self.scrape()
+        self.assertEqual([metric_value(body, name, labels) for name, labels in series],
+                         [value + 1 for value in before])
+
+
+class StructuredLoggingTests(SimpleTestCase):
+    """extra で渡した項目を出力するログのフォーマッターのテスト"""
+
+    def make_record(self):
+        record = logging.LogRecord('api.views', logging.INFO, __file__, 1, 'Analysis logged', (), None)
+        record.analysis_log_id = 42
+        record.cache_hit = False
+        return record
+
+    def test_json_formatter(self):
+        data = json.loads(JsonFormatter().format(self.make_record()))
+
+        self.assertEqual(data['level'], 'INFO')
+        self.assertEqual(data['logger'], 'api.views')
+        self.assertEqual(data['message'], 'Analysis logged')
+        self.assertEqual((data['analysis_log_id'], data['cache_hit']), (42, False))
+
+    def test_text_formatter(self):
+        text = TextFormatter('%(levelname)s %(message)s').format(self.make_record())
+
+        self.assertEqual(text, 'INFO Analysis logged analysis_log_id=42 cache_hit=False')
@@ -0,0 +1,215 @@
+"""
+ログ一覧用のサムネイル生成
+
+画像を保存したリクエストではサムネイルの生成タスク(ImageThumbnail)を登録するのみで、
+run_analysis_worker のワーカーが解析ジョブの合間に取り出して THUMBNAIL_SIZES の各サイズを生成し、
+ストレージバックエンドへ保存する（取り出しは解析ジョブと同じ SELECT ... FOR UPDATE SKIP LOCKED）。
+
+キャッシュヒットしたログは以前の画像を参照するため、タスクは元画像の public_url ごとに1件とする。
+"""
+import io
+import logging
+import os
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .logs_cache import invalidate_logs_cache
+from .models import ImageThumbnail
+from .storage import get_storage_backend
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_CONTENT_TYPES = {
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+}
+
+
+def enqueue_thumbnails(upload_results: Iterable[Dict]) -> None:
+    """
+    保存した画像のサムネイル生成タスクを1クエリで登録する（登録済みの画像は何もしない）
+
+    Args:
+        upload_results: upload_image の戻り値（保存に成功したもののみ登録する）
+    """
+    if not settings.THUMBNAILS:
+        return
+    thumbnails = [
+        ImageThumbnail(source_url=upload_result['public_url'], storage_path=upload_result['storage_path'])
+        for upload_result in upload_results
+        if upload_result.get('success') and upload_result.get('storage_path')
+    ]
+    if thumbnails:
+        ImageThumbnail.objects.bulk_create(thumbnails, ignore_conflicts=True)
+
+
+def load_thumbnail_urls(logs: Iterable) -> Dict[str, Dict[str, str]]:
+    """
+    ログの画像のサムネイルURLを1クエリでまとめて取得する（シリアライザーの context に渡す）
+
+    Returns:
+        {image_path: {'128': url, '512': url}}（生成済みのもののみ）
+    """
+    image_paths = {log.image_path for log in logs}
+    if not settings.THUMBNAILS or not image_paths:
+        return {}
+    return dict(ImageThumbnail.objects.filter(
+        source_url__in=image_paths, status=ImageThumbnail.Status.COMPLETED,
+    ).values_list('source_url', 'urls'))
+
+
+def thumbnail_filename(storage_path: str, size: int) -> str:
+    """元画像の保存先パスからサイズごとのサムネイルのファイル名を生成する"""
+    stem = os.path.splitext(os.path.basename(storage_path))[0]
+    extension = settings.THUMBNAIL_FORMAT.lower()
+    return f"{settings.THUMBNAIL_PREFIX}{size}/{stem}.{extension}"
+
+
+def generate_thumbnails(storage_path: str) -> Dict[str, str]:
+    """
+    保存済みの画像から THUMBNAIL_SIZES の各サイズのサムネイルを生成して保存する
+
+    デコードは1回のみで、JPEGはdraftモードで最大サイズ以上となる範囲で縮小デコードし、
+    大きいサイズから順に縮小する。
+
+    Returns:
+        {サイズ: 公開URL}
+    """
+    storage = get_storage_backend()
+    sizes = sorted(settings.THUMBNAIL_SIZES, reverse=True)
+
+    image = Image.open(io.BytesIO(storage.read(storage_path)))
+    image.draft('RGB', (sizes[0], sizes[0]))
+    image = ImageOps.exif_transpose(image)
+    # WEBPは透過を扱えるため、透過画像はRGBAのまま保存する（JPEGは白背景に合成）
+    image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+    if image.mode == 'RGBA' and settings.THUMBNAIL_FORMAT == 'JPEG':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+
+    urls = {}
+    for size in sizes:
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format=settings.THUMBNAIL_FORMAT, quality=settings.THUMBNAIL_QUALITY)
+
+        filename = thumbnail_filename(storage_path, size)
+        with storage.open_writer(filename, THUMBNAIL_CONTENT_TYPES[settings.THUMBNAIL_FORMAT]) as writer:
+            writer.write(buffer.getvalue())
+        urls[str(size)] = storage.public_url(filename)
+    return urls
+
+
+def claim_next_thumbnail() -> Optional[ImageThumbnail]:
+    """待機中のタスクを1件取り出して処理中にする（他ワーカーがロック中の行はスキップ）"""
+    with transaction.atomic():
+        thumbnail = (ImageThumbnail.objects
+                     .select_for_update(skip_locked=True)
+                     .filter(status=ImageThumbnail.Status.QUEUED)
+                     .order_by('created_at')
+                     .first())
+        if thumbnail is None:
+            return None
+
+        # 行ロック非対応のDB(SQLite)でも二重に取り出さないよう状態を条件に更新
+        claimed = ImageThumbnail.objects.filter(
+            id=thumbnail.id, status=ImageThumbnail.Status.QUEUED
+        ).update(
+            status=ImageThumbnail.Status.RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if not claimed:
+            return None
+
+    thumbnail.refresh_from_db()
+    return thumbnail
+
+
+def process_thumbnail(thumbnail: ImageThumbnail) -> None:
+    """取り出したタスクのサムネイルを生成し、結果を記録する"""
+    try:
+        thumbnail.urls = generate_thumbnails(thumbnail.storage_path)
+    except Exception as e:
+        logger.warning('Thumbnail generation failed', extra={
+            'source_url': thumbnail.source_url, 'attempts': thumbnail.attempts, 'error': str(e)})
+
+        # 上限回数までは再投入（元画像が読み込めない場合も一時的なエラーの可能性がある）
+        if thumbnail.attempts < settings.THUMBNAIL_MAX_ATTEMPTS:
+            thumbnail.status = ImageThumbnail.Status.QUEUED
+        else:
+            thumbnail.status = ImageThumbnail.Status.FAILED
+            thumbnail.finished_at = timezone.now()
+        thumbnail.message = str(e)[:255]
+        thumbnail.save(update_fields=['status', 'message', 'finished_at'])
+        return
+
+    thumbnail.status = ImageThumbnail.Status.COMPLETED
+    thumbnail.message = None
+    thumbnail.finished_at = timezone.now()
+    thumbnail.save(update_fields=['status', 'urls', 'message', 'finished_at'])
+
+    # ログ一覧のキャッシュしたレスポンスにサムネイルURLを反映する
+    invalidate_logs_cache()
+
+    logger.info('Thumbnails generated', extra={'source_url': thumbnail.source_url, 'sizes': list(thumbnail.urls)})
+
+
+def process_next_thumbnail() -> bool:
+    """
+    待機中のタスクを1件処理する
+
+    Returns:
+        タスクを処理した場合はTrue
+    """
+    if not settings.THUMBNAILS:
+        return False
+
+    thumbnail = claim_next_thumbnail()
+    if thumbnail is None:
+        return False
+    process_thumbnail(thumbnail)
+    return True
+
+
+def requeue_stale_thumbnails() -> int:
+    """ワーカー停止などで処理中のまま残ったタスクを待機中に戻す"""
+    threshold = timezone.now() - timedelta(seconds=settings.ANALYSIS_JOB_STALE_SECONDS)
+    stale = ImageThumbnail.objects.filter(status=ImageThumbnail.Status.RUNNING, started_at__lt=threshold)
+
+    stale.filter(attempts__gte=settings.THUMBNAIL_MAX_ATTEMPTS).update(
+        status=ImageThumbnail.Status.FAILED,
+        message='Thumbnail generation timed out',
+        finished_at=timezone.now(),
+    )
+    return stale.update(status=ImageThumbnail.Status.QUEUED)
+
+
+def enqueue_missing_thumbnails(image_paths: List[str]) -> int:
+    """
+    既存のログの画像のうち、タスク未登録のものを登録する（backfill_thumbnails コマンド用）
+
+    ストレージバックエンドの公開URLでない画像（モックAPIのパスや別のバケットなど）は対象外。
+
+    Returns:
+        登録したタスク数
+    """
+    storage = get_storage_backend()
+    thumbnails = []
+    for image_path in image_paths:
+        filename = storage.filename_from_public_url(image_path)
+        if filename is not None:
+            thumbnails.append(ImageThumbnail(source_url=image_path, storage_path=storage.storage_path(filename)))
+
+    existing = set(ImageThumbnail.objects.filter(
+        source_url__in=[thumbnail.source_url for thumbnail in thumbnails]).values_list('source_url', flat=True))
+    new_thumbnails = [thumbnail for thumbnail in thumbnails if thumbnail.source_url not in existing]
+    ImageThumbnail.objects.bulk_create(new_thumbnails, ignore_conflicts=True)
+    return len(new_thumbnails)
@@ -0,0 +1,121 @@
+"""
+解析パイプラインの処理段階ごとの計測
+
+リクエスト（またはジョブ）ごとに StageTimer を有効化し、各処理を stage() で囲むと
+単調時計(perf_counter)で所要時間を記録する。入れ子の段階は親の時間から差し引くため、
+各段階の時間は重複しない。
+
+計測中のタイマーはコンテキスト変数で保持するため、関数の引数で受け渡す必要はなく、
+sync_to_async や asyncio のタスクにも引き継がれる（ThreadPoolExecutor に渡す場合は
+contextvars.copy_context().run で実行する）。
+"""
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from .metrics import record_stage_timings
+
+_current_timer = ContextVar('stage_timer', default=None)
+_stage_stack = ContextVar('stage_stack', default=())
+
+
+class StageTimer:
+    """処理段階ごとの所要時間を集計する"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._durations = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._durations[name] = self._durations.get(name, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        """段階名 → 所要時間(ms) の辞書を返す"""
+        with self._lock:
+            return {name: round(seconds * 1000, 1) for name, seconds in self._durations.items()}
+
+    def server_timing(self) -> str:
+        """Server-Timing ヘッダーの値を生成する（末尾に全体の所要時間 total を付ける）"""
+        timings = self.as_dict()
+        timings['total'] = round((time.perf_counter() - self.started) * 1000, 1)
+        return ', '.join(f'{name};dur={duration}' for name, duration in timings.items())
+
+
+@contextmanager
+def activate(timer: StageTimer):
+    """このコンテキストで計測に使うタイマーを設定する"""
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """囲んだ処理の所要時間を name の段階として記録する（タイマー未設定の場合は何もしない）"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+
+    # 入れ子の段階の所要時間を集計する枠
+    frame = [0.0]
+    token = _stage_stack.set(_stage_stack.get() + (frame,))
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _stage_stack.reset(token)
+
+        parent_stack = _stage_stack.get()
+        if parent_stack:
+            parent_stack[-1][0] += elapsed
+        timer.add(name, max(elapsed - frame[0], 0.0))
+
+
+def current_timings() -> Optional[Dict[str, float]]:
+    """計測中のタイマーの段階別所要時間(ms)を返す（タイマー未設定の場合はNone）"""
+    timer = _current_timer.get()
+    if timer is None:
+        return None
+    return timer.as_dict()
+
+
+def server_timing(view):
+    """
+    ビューの処理段階を計測し、Server-Timing レスポンスヘッダーを付けるデコレーター
+
+    計測結果は処理段階ごとのメトリクスにも記録する。
+
+    同期・非同期ビューのどちらにも使える。
+    """
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            timer = StageTimer()
+            with activate(timer):
+                response = await view(request, *args, **kwargs)
+            record_stage_timings(timer.as_dict())
+            response['Server-Timing'] = timer.server_timing()
+            return response
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        timer = StageTimer()
+        with activate(timer):
+            response = view(request, *args, **kwargs)
+        record_stage_timings(timer.as_dict())
+        response['Server-Timing'] = timer.server_timing()
+        return response
+
+    return wrapper
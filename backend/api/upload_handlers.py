@@ -0,0 +1,204 @@
+"""
+ストリーミングアップロードハンドラー
+
+リクエストボディのチャンクをメモリに溜めず、そのままストレージバックエンドへ
+書き込む（GCSの場合はレジュマブルアップロード）。受信しながらSHA-256ダイジェストを計算し、
+先頭バイトから画像形式とサイズを判定する。書き込みの確定後に保存先から読み込んで画像全体を検証し、
+無効な場合は削除する。
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.uploadhandler import (FileUploadHandler,
+                                             StopFutureHandlers)
+from PIL import Image
+
+from .services import SUPPORTED_IMAGE_FORMATS, generate_image_filename
+from .storage import get_storage_backend
+
+logger = logging.getLogger(__name__)
+
+
+class StreamedImageUpload:
+    """ストリーミングでアップロード済みの画像（request.FILES の値）"""
+
+    def __init__(self, name, content_type):
+        self.name = name
+        self.content_type = content_type
+        self.size = 0
+        self.digest = None
+        self.format = None
+        self.width = None
+        self.height = None
+        self.error = None
+        self.upload_result = None  # upload_image と同じ形式
+
+
+class StreamingStorageUploadHandler(FileUploadHandler):
+    """
+    指定フィールドの画像をストレージへ直接ストリーミングするアップロードハンドラー
+
+    1リクエストあたりのメモリ使用量は、形式判定用の先頭バイト
+    (STREAMING_UPLOAD_SNIFF_BYTES)とストレージへの送信バッファ(STREAMING_UPLOAD_CHUNK_SIZE)までに抑えられる。
+    """
+
+    def __init__(self, request=None, field_name='image'):
+        super().__init__(request)
+        self.target_field_name = field_name
+        self.active = False
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(
+            field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+        # 対象外のフィールドは後続のハンドラーに任せる
+        self.active = field_name == self.target_field_name
+        if not self.active:
+            return
+
+        self.upload = StreamedImageUpload(file_name, content_type)
+        self.sha256 = hashlib.sha256()
+        self.header = bytearray()
+        self.writer = None
+        # 後続のハンドラー（一時ファイル・メモリ）には同じファイルを受け取らせない
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+
+        self.sha256.update(raw_data)
+        self.upload.size += len(raw_data)
+
+        if self.upload.error:
+            return None
+
+        try:
+            if self.writer is None:
+                # 形式が判定できるまで先頭バイトを保持
+                self.header.extend(raw_data)
+                if not self._sniff_header():
+                    return None
+                self._open_writer()
+                self.writer.write(bytes(self.header))
+                self.header = bytearray()
+            else:
+                self.writer.write(raw_data)
+        except Exception as e:
+            # 残りのデータは読み捨て、ビューでエラーを返す
+            self.upload.error = f'Failed to upload image: {str(e)}'
+            self._abort()
+
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+
+        self.active = False
+        self.upload.digest = self.sha256.hexdigest()
+
+        try:
+            if self.writer is None and not self.upload.error:
+                # 先頭バイトだけで終端に達した（小さい画像）
+                if self._sniff_header(final=True):
+                    self._open_writer()
+                    self.writer.write(bytes(self.header))
+
+            if self.upload.error:
+                self._abort()
+                return self.upload
+
+            self.writer.close()
+            self.writer = None
+        except Exception as e:
+            self.upload.error = f'Failed to upload image: {str(e)}'
+            self._abort()
+            return self.upload
+
+        if not self._verify_stored_image():
+            return self.upload
+
+        logger.info('Image streamed', extra={
+            'storage_backend': self.storage.name, 'storage_path': self.upload.upload_result['storage_path']})
+        return self.upload
+
+    def upload_interrupted(self):
+        """受信が途中で終わった・失敗した場合に書き込み途中のデータを破棄する（完了済みの場合は何もしない）"""
+        if self.active:
+            self.active = False
+            self._abort()
+
+    def _sniff_header(self, final=False) -> bool:
+        """先頭バイトから画像形式とサイズを判定する（判定できた場合はTrue）"""
+        try:
+            with Image.open(io.BytesIO(self.header)) as image:
+                image_format = image.format
+                self.upload.width, self.upload.height = image.size
+        except Exception as e:
+            # データ不足の可能性があるため上限までは次のチャンクを待つ
+            if final or len(self.header) >= settings.STREAMING_UPLOAD_SNIFF_BYTES:
+                self.upload.error = f'Invalid image file: {str(e)}'
+                self.header = bytearray()
+            return False
+
+        if image_format not in SUPPORTED_IMAGE_FORMATS:
+            self.upload.error = f'Unsupported image format: {image_format}'
+            self.header = bytearray()
+            return False
+
+        self.upload.format = image_format
+        return True
+
+    def _open_writer(self):
+        self.storage = get_storage_backend()
+
+        error_message = self.storage.check_configured()
+        if error_message:
+            raise ValueError(error_message)
+
+        filename, file_extension = generate_image_filename(self.upload.format)
+        self.writer = self.storage.open_writer(
+            filename, content_type=f'image/{file_extension}')
+
+        self.upload.upload_result = {
+            'success': True,
+            'message': 'Image uploaded successfully',
+            'storage_path': self.storage.storage_path(filename),
+            'public_url': self.storage.public_url(filename),
+            'filename': filename
+        }
+
+    def _verify_stored_image(self) -> bool:
+        """
+        確定した画像全体が有効かチェックし、無効な場合は削除する（有効な場合はTrue）
+
+        先頭バイトの判定では途中の破損や切り詰めを検出できないため、保存先から少しずつ読み込んで検証する。
+        """
+        storage_path = self.upload.upload_result['storage_path']
+        try:
+            with self.storage.open_reader(storage_path) as f, Image.open(f) as image:
+                image.verify()
+            return True
+        except Exception as e:
+            self.upload.error = f'Invalid image file: {str(e)}'
+            self.upload.upload_result = None
+
+        try:
+            self.storage.delete(storage_path)
+        except Exception:
+            logger.warning('Failed to delete invalid image', exc_info=True, extra={'storage_path': storage_path})
+        return False
+
+    def _abort(self):
+        # 書き込み途中のデータは確定させずに破棄する
+        if self.writer is not None:
+            try:
+                self.storage.discard_writer(self.writer)
+            except Exception:
+                logger.warning('Failed to discard partial upload', exc_info=True, extra={
+                    'storage_path': self.upload.upload_result['storage_path']})
+        self.writer = None
+        self.header = bytearray()
@@ -1,10 +1,20 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
+
+# ASGIサーバーで起動する場合は解析・ログ一覧・エクスポートに非同期ビューを使う
+analysis_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path('hello/', views.hello_world, name='hello-world'),
-    path('analyze/', views.analyze_image, name='analyze-image'),
-    path('analyze-mock/', views.analyze_image_mock, name='analyze-image-mock'),
-    path('logs/', views.get_analysis_logs, name='get-analysis-logs'),
+    path('analyze/', analysis_views.analyze_image, name='analyze-image'),
+    path('analyze/batch/', views.analyze_image_batch, name='analyze-image-batch'),
+    path('analyze/async/', views.analyze_image_async, name='analyze-image-async'),
+    path('analyze-mock/', analysis_views.analyze_image_mock, name='analyze-image-mock'),
+    path('logs/', analysis_views.get_analysis_logs, name='get-analysis-logs'),
+    path('logs/export/', analysis_views.export_analysis_logs, name='export-analysis-logs'),
+    path('stats/', views.get_analysis_stats, name='get-analysis-stats'),
+    path('jobs/<uuid:job_id>/', views.get_analysis_job, name='get-analysis-job'),
+    path('media/<path:filename>', views.serve_stored_image, name='serve-stored-image'),
 ]
@@ -1,28 +1,97 @@
-import random
-import time
+import logging
+import os
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
 from typing import Any, Dict
 
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import (FileResponse, Http404, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET
 from rest_framework import status
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
 
-from .models import AiAnalysisLog, ObjectLabel
+from .analyzers import get_analyzer_backend
+from .exports import (EXPORT_CONTENT_TYPES, export_filename, export_queryset,
+                      iter_export)
+from .jobs import enqueue_analysis_job
+from .label_cache import get_label_name
+from .logs_cache import cache_logs_response, invalidate_logs_cache
+from .metrics import record_analysis_result, render_metrics
+from .models import AiAnalysisLog, AnalysisHourlyRollup, AnalysisJob
+from .pagination import estimate_count, paginate_by_cursor
+from .pipeline import (analyze_image_file, analyze_streamed_image,
+                       analyze_uploaded_image, lookup_near_duplicate)
+from .rollups import (ROLLUP_SUMMARY_FIELDS, RollupSummary,
+                      flush_hourly_rollups, update_hourly_rollups)
 from .serializers import AiAnalysisLogListSerializer
-from .services import analyze_image_from_gcs_path, upload_image_to_gcs
+from .services import (IMAGE_PREFIX, NearDuplicateOptions,
+                       compute_image_digest, find_cached_analyses,
+                       save_analysis_cache, upload_images)
+from .storage import LocalFileSystemStorageBackend, get_storage_backend
+from .thumbnails import enqueue_thumbnails, load_thumbnail_urls
+from .timing import server_timing, stage
+from .upload_handlers import StreamedImageUpload, StreamingStorageUploadHandler
+
+logger = logging.getLogger(__name__)
+
+# 集計APIの時系列の単位と、1リクエストで返す期間数の上限（1時間単位で31日分）
+STATS_INTERVALS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+STATS_MAX_BUCKETS = 24 * 31
+
+# ログ一覧の範囲フィルタ（クエリパラメータ名, 条件, 値の変換）
+LOG_RANGE_FILTERS = (
+    ('min_confidence', 'confidence__gte', Decimal),
+    ('max_confidence', 'confidence__lte', Decimal),
+    ('min_processing_time_ms', 'processing_time_ms__gte', int),
+    ('max_processing_time_ms', 'processing_time_ms__lte', int),
+)
+
+# ログ一覧の並べ替えに使える項目（先頭に - を付けると降順）
+LOG_SORT_FIELDS = ('created_at', 'processing_time_ms', 'confidence')
+DEFAULT_LOG_SORT = '-created_at'
 
 
 def get_classification_name(classification_id):
     """分類IDから分類名を取得するヘルパー関数"""
     if not classification_id:
         return None
-    try:
-        label = ObjectLabel.objects.get(id=classification_id)
-        return label.name
-    except ObjectLabel.DoesNotExist:
+    name = get_label_name(classification_id)
+    if name is None:
         return f"クラス {classification_id}"
+    return name
+
+
+def build_analysis_response(analysis_log):
+    """解析ログから解析APIのレスポンスを生成するヘルパー関数"""
+    if not analysis_log.success:
+        return {
+            'id': analysis_log.id,
+            'success': False,
+            'message': analysis_log.message,
+            'estimated_data': {}
+        }
+
+    return {
+        'id': analysis_log.id,
+        'success': True,
+        'message': 'success',
+        'cache_hit': analysis_log.cache_hit,
+        'estimated_data': {
+            'class': analysis_log.classification_id,
+            'class_name': get_classification_name(analysis_log.classification_id),
+            'confidence': float(analysis_log.confidence)
+        }
+    }
 
 
 @api_view(['GET'])
@@ -39,93 +108,313 @@ def hello_world(request):
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
+@server_timing
 def analyze_image(request):
     """
     本番環境用: 画像ファイルをアップロードしてVision APIで解析
+
+    縮小・再圧縮された同じ画像の解析結果があれば、Vision APIを呼び出さずにその結果を返す。
+    near_duplicate_threshold（ハミング距離の上限）・near_duplicate_bypass=true で変更できる。
     """
     request_timestamp = timezone.now()
 
+    # ストリーミングモードでは画像をメモリに溜めずストレージへ直接アップロードする
+    streaming_handler = None
+    if settings.STREAMING_UPLOADS:
+        streaming_handler = StreamingStorageUploadHandler(request._request)
+        request._request.upload_handlers = [
+            streaming_handler,
+            *request._request.upload_handlers
+        ]
+
+    # リクエストボディの受信・解析（ストリーミングモードではアップロードを含む）
+    with stage('receive'):
+        try:
+            files = request.FILES
+        finally:
+            # 切断などで受信が途中で終わった場合は書き込み途中のデータを破棄する
+            if streaming_handler is not None:
+                streaming_handler.upload_interrupted()
+
     # 画像ファイルが必須
-    if 'image' not in request.FILES:
+    if 'image' not in files:
         return Response({
             'success': False,
             'message': 'image file is required'
         }, status=status.HTTP_400_BAD_REQUEST)
 
-    image_file = request.FILES['image']
-    print(
-        f"📁 Received image file: {image_file.name} ({image_file.size} bytes)")
+    try:
+        near_duplicate = parse_near_duplicate_options(request.POST)
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    image_file = files['image']
+    logger.debug('Received image file', extra={'image_name': image_file.name, 'bytes': image_file.size})
 
     try:
-        # 画像ファイルをGCSにアップロード
-        upload_result = upload_image_to_gcs(image_file)
+        if isinstance(image_file, StreamedImageUpload):
+            outcome = analyze_streamed_image(image_file, request_timestamp)
+        else:
+            outcome = analyze_image_file(image_file, request_timestamp, near_duplicate=near_duplicate)
 
-        if not upload_result['success']:
+        if outcome['analysis_log'] is None:
             return Response({
                 'success': False,
-                'message': f'Failed to upload image: {upload_result["message"]}'
+                'message': outcome['message']
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        gcs_path = upload_result['gcs_path']
-        print(f"☁️ Image uploaded to GCS: {gcs_path}")
+        return Response(build_analysis_response(outcome['analysis_log']))
+
+    except Exception as e:
+        logger.exception('Analysis error')
+        return Response({
+            'success': False,
+            'message': f'Analysis failed: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+def analyze_image_batch(request):
+    """
+    本番環境用: 複数の画像ファイルをまとめてアップロードしてVision APIで解析
+
+    images フィールドに複数ファイルを指定する（類似画像の扱いは analyze_image と同じ）。
+    結果はアップロード順に返し、一部の画像が失敗しても他の画像の結果は返却する。
+    """
+    request_timestamp = timezone.now()
+
+    image_files = request.FILES.getlist('images')
+
+    if not image_files:
+        return Response({
+            'success': False,
+            'message': 'images files are required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(image_files) > settings.BATCH_ANALYZE_MAX_FILES:
+        return Response({
+            'success': False,
+            'message': f'Too many images: {len(image_files)} (max: {settings.BATCH_ANALYZE_MAX_FILES})'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        near_duplicate = parse_near_duplicate_options(request.POST)
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    logger.debug('Received image files', extra={'files': len(image_files)})
 
-        # GCSパスからVision API解析を実行
-        analysis_result = analyze_image_from_gcs_path(gcs_path)
-        image_path = upload_result['public_url']  # 表示用のpublic_urlを保存
+    try:
+        # 解析結果キャッシュを一括確認
+        digests = [compute_image_digest(image_file) for image_file in image_files]
+        cached_results = find_cached_analyses(digests)
+
+        # 同一画像のキャッシュがない画像は、類似画像の解析結果を確認
+        perceptual_hashes = {}
+        for digest, image_file in zip(digests, image_files):
+            if digest not in cached_results and digest not in perceptual_hashes:
+                perceptual_hashes[digest], similar_result = lookup_near_duplicate(image_file, near_duplicate)
+                if similar_result:
+                    cached_results[digest] = similar_result
+
+        # キャッシュミスの画像のみ、同一内容の重複を除いてアップロード
+        pending_files = {}
+        for digest, image_file in zip(digests, image_files):
+            if digest not in cached_results:
+                pending_files.setdefault(digest, image_file)
+
+        upload_results = dict(zip(
+            pending_files, upload_images(list(pending_files.values()))))
+        enqueue_thumbnails(upload_results.values())
+
+        # アップロードに成功した画像をバッチで解析
+        uploaded_digests = [
+            digest for digest, upload_result in upload_results.items() if upload_result['success']]
+        analyzer = get_analyzer_backend()
+        analysis_results = dict(zip(
+            uploaded_digests,
+            analyzer.analyze_batch(
+                [upload_results[digest]['storage_path'] for digest in uploaded_digests])))
+
+        for digest in uploaded_digests:
+            record_analysis_result(analyzer.name, analysis_results[digest])
+            save_analysis_cache(
+                digest, upload_results[digest], analysis_results[digest], perceptual_hashes.get(digest))
 
         response_timestamp = timezone.now()
-        processing_time_ms = int(
-            (response_timestamp - request_timestamp).total_seconds() * 1000)
-
-        print(f"✅ Analysis result: {analysis_result}")
-
-        # DB保存処理
-        analysis_log = AiAnalysisLog.objects.create(
-            image_path=image_path,
-            success=analysis_result['success'],
-            message=analysis_result['message'],
-            classification=analysis_result['estimated_data'].get(
-                'class') if analysis_result['success'] else None,
-            confidence=analysis_result['estimated_data'].get(
-                'confidence') if analysis_result['success'] else None,
-            request_timestamp=request_timestamp,
-            response_timestamp=response_timestamp
-        )
-
-        print(f"💾 Saved to DB with ID: {analysis_log.id}")
-
-        if analysis_result['success']:
-            return Response({
-                'id': analysis_log.id,
-                'success': True,
-                'message': 'success',
-                'estimated_data': {
+
+        # 画像ごとの結果を組み立て、ログは1回のbulk_createで登録
+        items = []
+        for digest, image_file in zip(digests, image_files):
+            cache_hit = digest in cached_results
+
+            if cache_hit:
+                analysis_result = {
+                    'success': True,
+                    'message': 'success',
+                    'estimated_data': cached_results[digest]['estimated_data']
+                }
+                image_path = cached_results[digest]['public_url']
+            elif upload_results[digest]['success']:
+                analysis_result = analysis_results[digest]
+                image_path = upload_results[digest]['public_url']
+            else:
+                # アップロード失敗（不正な画像など）はログを残さない（単体APIと同じ扱い）
+                items.append({
+                    'filename': image_file.name,
+                    'log': None,
+                    'cache_hit': False,
+                    'analysis_result': {
+                        'success': False,
+                        'message': f'Failed to upload image: {upload_results[digest]["message"]}',
+                        'estimated_data': {}
+                    }
+                })
+                continue
+
+            items.append({
+                'filename': image_file.name,
+                'cache_hit': cache_hit,
+                'analysis_result': analysis_result,
+                'log': AiAnalysisLog(
+                    image_path=image_path,
+                    success=analysis_result['success'],
+                    message=analysis_result['message'],
+                    classification_id=analysis_result['estimated_data'].get(
+                        'class') if analysis_result['success'] else None,
+                    confidence=analysis_result['estimated_data'].get(
+                        'confidence') if analysis_result['success'] else None,
+                    request_timestamp=request_timestamp,
+                    response_timestamp=response_timestamp,
+                    cache_hit=cache_hit
+                )
+            })
+
+        logs = AiAnalysisLog.objects.bulk_create(
+            [item['log'] for item in items if item['log'] is not None])
+        # bulk_create では post_save シグナルが送られないため集計は個別に反映
+        update_hourly_rollups(logs)
+        transaction.on_commit(invalidate_logs_cache)
+
+        logger.info('Batch analysis logged', extra={'logs': len(logs)})
+
+        results = []
+        for index, item in enumerate(items):
+            analysis_result = item['analysis_result']
+            estimated_data = {}
+            if analysis_result['success']:
+                estimated_data = {
                     'class': analysis_result['estimated_data']['class'],
-                    'class_name': get_classification_name(analysis_result['estimated_data'].get('class')),
+                    'class_name': get_classification_name(analysis_result['estimated_data']['class']),
                     'confidence': analysis_result['estimated_data']['confidence']
                 }
-            })
-        else:
-            return Response({
-                'id': analysis_log.id,
-                'success': False,
+
+            results.append({
+                'index': index,
+                'filename': item['filename'],
+                'id': item['log'].id if item['log'] is not None else None,
+                'success': analysis_result['success'],
                 'message': analysis_result['message'],
-                'estimated_data': {}
+                'cache_hit': item['cache_hit'],
+                'estimated_data': estimated_data
             })
 
+        succeeded = sum(1 for result in results if result['success'])
+
+        return Response({
+            'success': succeeded == len(results),
+            'message': f'{succeeded}/{len(results)} images analyzed successfully',
+            'results': results
+        })
+
     except Exception as e:
-        print(f"💥 Analysis Error: {str(e)}")
+        logger.exception('Batch analysis error')
         return Response({
             'success': False,
-            'message': f'Analysis failed: {str(e)}'
+            'message': f'Batch analysis failed: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+def analyze_image_async(request):
+    """
+    本番環境用: 画像ファイルを受け付けて解析ジョブを登録し、すぐに202を返す
+
+    解析結果は GET /api/jobs/<job_id>/ で取得する。
+    """
+    request_timestamp = timezone.now()
+
+    # 画像ファイルが必須
+    if 'image' not in request.FILES:
+        return Response({
+            'success': False,
+            'message': 'image file is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        job = enqueue_analysis_job(request.FILES['image'], request_timestamp)
+
+        return Response({
+            'success': True,
+            'message': 'accepted',
+            'job_id': str(job.id),
+            'status': job.status,
+            'status_url': reverse('get-analysis-job', args=[job.id])
+        }, status=status.HTTP_202_ACCEPTED)
+
+    except Exception as e:
+        logger.exception('Enqueue error')
+        return Response({
+            'success': False,
+            'message': f'Failed to enqueue analysis: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def get_analysis_job(request, job_id):
+    """
+    非同期解析ジョブの状態取得API
+    """
+    job = AnalysisJob.objects.select_related('analysis_log').filter(id=job_id).first()
+
+    if job is None:
+        return Response({
+            'success': False,
+            'message': f'Job {job_id} does not exist'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'success': True,
+        'data': {
+            'job_id': str(job.id),
+            'status': job.status,
+            'message': job.message,
+            'attempts': job.attempts,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+            # 完了時のみ解析APIと同じ形式の結果を返す
+            'result': build_analysis_response(job.analysis_log) if job.analysis_log else None
+        }
+    })
+
+
 @api_view(['POST'])
 @parser_classes([JSONParser])
+@server_timing
 def analyze_image_mock(request):
     """
     ローカル開発用: image_pathでモック解析
+
+    ANALYZER_STANDIN_* 設定のレイテンシ・エラー率で、実際の解析と同じ保存処理を行う
     """
     request_timestamp = timezone.now()
 
@@ -138,49 +427,15 @@ def analyze_image_mock(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        # ローカルモック解析のみ
-        print(" Using local mock")
-        analysis_result = call_mock_ai_analysis_api_local(image_path)
+        # 本番と同じパイプラインを、ローカルの代替解析バックエンドで実行
+        outcome = analyze_uploaded_image(
+            {'storage_path': image_path, 'public_url': image_path},
+            None, request_timestamp, analyzer=get_analyzer_backend('local'))
 
-        response_timestamp = timezone.now()
-
-        print(f"✅ Analysis result: {analysis_result}")
-
-        # DB保存処理
-        analysis_log = AiAnalysisLog.objects.create(
-            image_path=image_path or 'base64_data',
-            success=analysis_result['success'],
-            message=analysis_result['message'],
-            classification=analysis_result['estimated_data'].get(
-                'class') if analysis_result['success'] else None,
-            confidence=analysis_result['estimated_data'].get(
-                'confidence') if analysis_result['success'] else None,
-            request_timestamp=request_timestamp,
-            response_timestamp=response_timestamp
-        )
-
-        print(f"💾 Saved to DB with ID: {analysis_log.id}")
-
-        if analysis_result['success']:
-            return Response({
-                'id': analysis_log.id,
-                'success': True,
-                'message': 'success',
-                'estimated_data': {
-                    'class': analysis_result['estimated_data']['class'],
-                    'confidence': analysis_result['estimated_data']['confidence']
-                }
-            })
-        else:
-            return Response({
-                'id': analysis_log.id,
-                'success': False,
-                'message': analysis_result['message'],
-                'estimated_data': {}
-            })
+        return Response(build_analysis_response(outcome['analysis_log']))
 
     except Exception as e:
-        print(f"💥 Analysis Error: {str(e)}")
+        logger.exception('Analysis error')
         return Response({
             'success': False,
             'message': f'Analysis failed: {str(e)}'
@@ -188,6 +443,7 @@ def analyze_image_mock(request):
 
 
 @api_view(['GET'])
+@cache_logs_response
 def get_analysis_logs(request):
     """
     AI分析ログの一覧取得API
@@ -196,26 +452,31 @@ def get_analysis_logs(request):
     - page: ページ番号 (デフォルト: 1)
     - page_size: 1ページあたりの件数 (デフォルト: 20, 最大: 50)
     - classification: 分類クラスフィルタ
+    - success: 解析結果の成否フィルタ (true/false)
+    - start, end: 登録日時の範囲フィルタ (ISO 8601, start以上・end未満)
+    - min_confidence, max_confidence: 確信度の範囲フィルタ
+    - min_processing_time_ms, max_processing_time_ms: 処理時間(ms)の範囲フィルタ
+    - sort: 並べ替え (created_at/processing_time_ms/confidence, 先頭に - で降順。デフォルト: -created_at)
+    - cursor: 指定するとカーソルモード（先頭ページは空文字、以降は前ページの next_cursor）
+    - total_count: カーソルモードでの総件数 (none: 省略(デフォルト), estimate: 概算, exact: COUNT(*))
+
+    ETag / Last-Modified を返し、ログが増えていなければ If-None-Match 等に304を返す（api.logs_cache を参照）
     """
     try:
         # クエリパラメータの取得
         page = int(request.GET.get('page', 1))
         page_size = min(int(request.GET.get('page_size', 20)), 50)  # 最大50件
-        classification_filter = request.GET.get('classification')
+        cursor = request.GET.get('cursor')
 
-        # ベースクエリセット
-        queryset = AiAnalysisLog.objects.all()
+        queryset = filter_analysis_logs(request.GET)
 
-        # 分類クラスフィルタリング
-        if classification_filter:
-            try:
-                classification_value = int(classification_filter)
-                queryset = queryset.filter(classification=classification_value)
-            except ValueError:
-                pass
+        # カーソルモード（OFFSET・COUNT(*)なしのキーセットページネーション）
+        if cursor is not None:
+            validate_cursor_sort(request.GET)
+            return get_analysis_logs_by_cursor(
+                queryset, cursor, page_size, request.GET.get('total_count', 'none'))
 
-        # 最新順でソート
-        queryset = queryset.order_by('-created_at')
+        queryset = order_analysis_logs(queryset, request.GET)
 
         # ページネーション
         paginator = Paginator(queryset, page_size)
@@ -229,7 +490,8 @@ def get_analysis_logs(request):
         page_obj = paginator.get_page(page)
 
         # シリアライズ
-        serializer = AiAnalysisLogListSerializer(page_obj, many=True)
+        serializer = AiAnalysisLogListSerializer(
+            page_obj, many=True, context={'thumbnail_urls': load_thumbnail_urls(page_obj)})
 
         return Response({
             'success': True,
@@ -253,33 +515,321 @@ def get_analysis_logs(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
     except Exception as e:
-        print(f"💥 Get logs error: {str(e)}")
+        logger.exception('Get logs error')
         return Response({
             'success': False,
             'message': f'Failed to get logs: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-def call_mock_ai_analysis_api_local(image_content):
+@api_view(['GET'])
+def get_analysis_stats(request):
     """
-    ローカル開発用のモック処理
+    AI分析の集計API（1時間単位の集計行から算出するため、ログの件数に関係なく一定時間で応答する）
+
+    Query Parameters:
+    - start: 集計開始日時 (ISO 8601, デフォルト: endの24時間前)。interval単位に切り捨てる
+    - end: 集計終了日時 (ISO 8601, デフォルト: 現在)。interval単位に切り上げる
+    - interval: 時系列の単位 (hour(デフォルト)/day)
     """
-    processing_time = random.uniform(0.3, 1.2)
-    time.sleep(processing_time)
+    try:
+        interval = request.GET.get('interval', 'hour')
+        if interval not in STATS_INTERVALS:
+            raise ValueError(f'interval must be hour or day: {interval}')
+        step = STATS_INTERVALS[interval]
+
+        start, end = parse_stats_range(request.GET, interval)
+        bucket_count = (end - start) // step
+        if bucket_count > STATS_MAX_BUCKETS:
+            raise ValueError(f'Too many {interval} buckets: {bucket_count} (max: {STATS_MAX_BUCKETS})')
+
+        # このプロセスで溜めている加算を反映してから参照する（他のプロセスの分は反映間隔の分だけ遅れる）
+        flush_hourly_rollups()
+
+        # 集計行を時系列の単位ごとにまとめ、全体の集計は単位ごとの集計をマージして求める
+        buckets = [RollupSummary() for _ in range(bucket_count)]
+        rollups = (AnalysisHourlyRollup.objects
+                   .filter(hour__gte=start, hour__lt=end)
+                   .values_list('hour', *ROLLUP_SUMMARY_FIELDS))
+        for hour, *values in rollups:
+            buckets[(hour - start) // step].add(*values)
+
+        summary = RollupSummary()
+        for bucket in buckets:
+            summary.merge(bucket)
 
-    # 90%の確率で成功、10%で失敗
-    if random.random() > 0.1:
-        return {
+        return Response({
             'success': True,
-            'message': 'success',
-            'estimated_data': {
-                'class': random.randint(1, 5),
-                'confidence': round(random.uniform(0.7, 0.95), 4)
+            'data': {
+                'start': start,
+                'end': end,
+                'interval': interval,
+                'summary': build_stats(summary),
+                'series': [
+                    {'start': start + step * index, **build_stats(bucket)}
+                    for index, bucket in enumerate(buckets)
+                ]
             }
-        }
-    else:
-        return {
+        })
+
+    except ValueError as e:
+        return Response({
             'success': False,
-            'message': 'Error:E50012',
-            'estimated_data': {}
+            'message': f'Invalid parameter: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        logger.exception('Get stats error')
+        return Response({
+            'success': False,
+            'message': f'Failed to get stats: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_GET
+def export_analysis_logs(request):
+    """
+    AI分析ログの一括エクスポートAPI（CSV / NDJSONを新しい順にストリーミングで返す）
+
+    Query Parameters:
+    - format: 出力形式 (csv(デフォルト)/ndjson)
+    - classification, success, start, end, min_/max_confidence, min_/max_processing_time_ms, sort:
+      ログ一覧APIと同じ絞り込み・並べ替え
+    """
+    try:
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_CONTENT_TYPES:
+            raise ValueError(f'format must be csv or ndjson: {export_format}')
+        queryset = export_queryset(order_analysis_logs(filter_analysis_logs(request.GET), request.GET))
+
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Invalid parameter: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(
+        iter_export(queryset, export_format), content_type=EXPORT_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{export_filename(export_format, timezone.now())}"')
+    return response
+
+
+@require_GET
+def serve_stored_image(request, filename):
+    """
+    ローカルストレージに保存した画像の配信（IMAGE_STORAGE_BACKEND=local の場合のみ）
+
+    画像とサムネイルのみ配信し、同じ保存先にある解析待ちの一時ファイル等は配信しない。
+    """
+    storage = get_storage_backend()
+
+    if not isinstance(storage, LocalFileSystemStorageBackend):
+        raise Http404('Local storage is not enabled')
+
+    try:
+        path = storage.path(filename)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+
+    # 「images/../」等で他のディレクトリを指定されないよう、正規化したパスで判定する
+    relative_path = os.path.relpath(path, storage.root).replace(os.sep, '/')
+    if not relative_path.startswith((IMAGE_PREFIX, settings.THUMBNAIL_PREFIX)):
+        raise Http404(f'{filename} does not exist')
+
+    if not os.path.isfile(path):
+        raise Http404(f'{filename} does not exist')
+
+    # FileResponseはWSGIサーバーのfile_wrapper(sendfile)で配信される
+    return FileResponse(open(path, 'rb'))
+
+
+@require_GET
+def metrics(request):
+    """
+    Prometheus形式のメトリクス（gunicornの全ワーカーの合計）
+    """
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
+
+
+def get_analysis_logs_by_cursor(queryset, cursor, page_size, total_count_mode):
+    """カーソルモードでのログ一覧レスポンスを生成する"""
+    validate_total_count_mode(total_count_mode)
+
+    logs, next_cursor = paginate_by_cursor(queryset, cursor, page_size)
+
+    if total_count_mode == 'exact':
+        total_count = queryset.count()
+    elif total_count_mode == 'estimate':
+        total_count = estimate_count(queryset)
+    else:
+        total_count = None
+
+    serializer = AiAnalysisLogListSerializer(
+        logs, many=True, context={'thumbnail_urls': load_thumbnail_urls(logs)})
+
+    return Response({
+        'success': True,
+        'data': {
+            'logs': serializer.data,
+            'pagination': build_cursor_pagination(page_size, next_cursor, total_count, total_count_mode)
         }
+    })
+
+
+def parse_near_duplicate_options(params):
+    """解析APIの near_duplicate_threshold・near_duplicate_bypass から類似画像検索の設定を生成する"""
+    options = NearDuplicateOptions.default()
+
+    threshold = params.get('near_duplicate_threshold')
+    if threshold:
+        limit = settings.NEAR_DUPLICATE_MAX_DISTANCE_LIMIT
+        try:
+            max_distance = int(threshold)
+        except ValueError:
+            max_distance = -1
+        if not 0 <= max_distance <= limit:
+            raise ValueError(f'near_duplicate_threshold must be an integer between 0 and {limit}: {threshold}')
+        options = options._replace(max_distance=max_distance)
+
+    bypass = params.get('near_duplicate_bypass')
+    if bypass:
+        if bypass.lower() not in ('true', 'false'):
+            raise ValueError(f'near_duplicate_bypass must be true or false: {bypass}')
+        options = options._replace(bypass=bypass.lower() == 'true')
+
+    return options
+
+
+def validate_total_count_mode(total_count_mode):
+    """カーソルモードの total_count パラメータを検証する"""
+    if total_count_mode not in ('none', 'estimate', 'exact'):
+        raise ValueError(f'total_count must be none, estimate or exact: {total_count_mode}')
+
+
+def filter_analysis_logs(params):
+    """クエリパラメータで絞り込んだログ一覧のクエリセットを生成する"""
+    # ベースクエリセット（分類ラベルはJOINで一括取得）
+    queryset = AiAnalysisLog.objects.select_related('classification')
+
+    # 分類クラスフィルタリング
+    classification_filter = params.get('classification')
+    if classification_filter:
+        try:
+            classification_value = int(classification_filter)
+            queryset = queryset.filter(classification=classification_value)
+        except ValueError:
+            pass
+
+    # 解析結果の成否フィルタ
+    success_filter = params.get('success')
+    if success_filter:
+        if success_filter.lower() not in ('true', 'false'):
+            raise ValueError(f'success must be true or false: {success_filter}')
+        queryset = queryset.filter(success=success_filter.lower() == 'true')
+
+    # 登録日時の範囲フィルタ（start以上、end未満）
+    start = _parse_datetime_param(params, 'start')
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    end = _parse_datetime_param(params, 'end')
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+
+    # 確信度・処理時間(ms)の範囲フィルタ（min以上、max以下）
+    for name, lookup, parse in LOG_RANGE_FILTERS:
+        value = _parse_number_param(params, name, parse)
+        if value is not None:
+            queryset = queryset.filter(**{lookup: value})
+
+    return queryset
+
+
+def order_analysis_logs(queryset, params):
+    """
+    sort パラメータの順にログを並べ替える（同じ値の場合はID順）
+
+    処理時間・確信度で並べ替える場合は、値のないログを含めない（部分インデックスで並べ替えるため）。
+    """
+    sort = params.get('sort') or DEFAULT_LOG_SORT
+    field = sort.removeprefix('-')
+    if field not in LOG_SORT_FIELDS:
+        raise ValueError(f'sort must be one of {", ".join(LOG_SORT_FIELDS)} (prefix - for descending): {sort}')
+
+    if field != 'created_at':
+        queryset = queryset.filter(**{f'{field}__isnull': False})
+    direction = '-' if sort.startswith('-') else ''
+    return queryset.order_by(sort, f'{direction}id')
+
+
+def validate_cursor_sort(params):
+    """カーソルモードは新しい順のみ対応（カーソルが created_at・IDのため）"""
+    sort = params.get('sort') or DEFAULT_LOG_SORT
+    if sort != DEFAULT_LOG_SORT:
+        raise ValueError(f'sort is not supported in cursor mode: {sort}')
+
+
+def build_cursor_pagination(page_size, next_cursor, total_count, total_count_mode):
+    """カーソルモードのページネーション情報を生成する"""
+    return {
+        'mode': 'cursor',
+        'page_size': page_size,
+        'next_cursor': next_cursor,
+        'has_next': next_cursor is not None,
+        'total_count': total_count,
+        'total_count_estimated': total_count_mode == 'estimate' and total_count is not None,
+    }
+
+
+def parse_stats_range(params, interval):
+    """集計APIの start・end を interval 単位に揃えた日時に変換する"""
+    end = _parse_datetime_param(params, 'end') or timezone.now()
+    start = _parse_datetime_param(params, 'start') or end - timedelta(hours=24)
+
+    start = _truncate_to_interval(start, interval)
+    truncated_end = _truncate_to_interval(end, interval)
+    end = truncated_end if truncated_end == end else truncated_end + STATS_INTERVALS[interval]
+
+    if start >= end:
+        raise ValueError('start must be earlier than end')
+    return start, end
+
+
+def _parse_datetime_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'{name} must be an ISO 8601 datetime: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_number_param(params, name, parse):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return parse(value)
+    except (ValueError, InvalidOperation):
+        raise ValueError(f'{name} must be a number: {value}')
+
+
+def _truncate_to_interval(value, interval):
+    value = value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if interval == 'day':
+        value = value.replace(hour=0)
+    return value
+
+
+def build_stats(summary):
+    """RollupSummary から集計APIの1期間分の値を生成する"""
+    stats = summary.as_dict()
+    stats['classes'] = [
+        {'class': class_id, 'class_name': get_classification_name(class_id), 'count': count}
+        for class_id, count in sorted(stats['classes'].items(), key=lambda item: -item[1])
+    ]
+    return stats
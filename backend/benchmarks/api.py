@@ -0,0 +1,373 @@
+"""
+APIエンドポイントの負荷・レイテンシベンチマーク
+
+ローカルサーバーを起動し（または --base-url の既存サーバーに対して）、
+各シナリオを指定の同時実行数で実行してスループットと p50/p95/p99 レイテンシを計測する。
+サーバーはローカルストレージとローカルの代替解析バックエンドで起動するため、Google Cloudには接続しない。
+
+シナリオ:
+- mock: POST /api/analyze-mock/
+- analyze: POST /api/analyze/（毎回異なる画像を送信し、解析結果キャッシュを回避）
+- logs: GET /api/logs/（ページ番号モード）
+- logs-cursor: GET /api/logs/?cursor=（カーソルモード）
+
+使い方（backendディレクトリで実行）:
+    python -m benchmarks.api --seed-rows 10000 --concurrency 16
+    python -m benchmarks.api --server uvicorn --scenarios mock,analyze --requests 2000
+    python -m benchmarks.api --save-baseline                   # 結果を基準値として保存
+    python -m benchmarks.api --baseline benchmarks/baseline.json  # 基準値と比較（劣化時は終了コード1）
+
+DATABASE_URL などの設定は起動したサーバーにそのまま引き継がれる。
+"""
+import argparse
+import io
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+from PIL import Image
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+SCENARIOS = ('mock', 'analyze', 'logs', 'logs-cursor')
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """線形補間でパーセンタイルを計算する（sorted_values は昇順）"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies_ms: list, errors: int, elapsed_seconds: float) -> dict:
+    """レイテンシの一覧から集計結果を生成する"""
+    values = sorted(latencies_ms)
+    total = len(values) + errors
+    return {
+        'requests': total,
+        'errors': errors,
+        'elapsed_seconds': round(elapsed_seconds, 3),
+        'throughput_rps': round(total / elapsed_seconds, 2) if elapsed_seconds else None,
+        'latency_ms': {
+            'mean': round(statistics.fmean(values), 2) if values else None,
+            'p50': round(percentile(values, 0.50), 2) if values else None,
+            'p95': round(percentile(values, 0.95), 2) if values else None,
+            'p99': round(percentile(values, 0.99), 2) if values else None,
+            'max': round(values[-1], 2) if values else None,
+        }
+    }
+
+
+class ImageFactory:
+    """解析結果キャッシュにヒットしないよう、毎回内容の異なる小さなJPEGを生成する"""
+
+    def __init__(self, size=(320, 240)):
+        self.base = Image.effect_noise(size, 32).convert('RGB')
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> bytes:
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        image = self.base.copy()
+        # 先頭の画素に連番を埋め込んでダイジェストを変える
+        image.putpixel((0, 0), (counter % 256, (counter // 256) % 256, (counter // 65536) % 256))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=85)
+        return buffer.getvalue()
+
+
+def build_request(scenario: str, base_url: str, images: ImageFactory, rng: random.Random, total_pages: int):
+    """シナリオの1リクエスト分の (method, url, kwargs) を生成する"""
+    if scenario == 'mock':
+        return 'POST', f'{base_url}/api/analyze-mock/', {
+            'json': {'image_path': f'benchmark/{rng.randrange(1_000_000)}.jpg'}}
+    if scenario == 'analyze':
+        return 'POST', f'{base_url}/api/analyze/', {
+            'files': {'image': ('benchmark.jpg', images.next(), 'image/jpeg')}}
+    if scenario == 'logs':
+        # 先頭付近のページを中心に、ときどき深いページも取得する
+        page = 1 if rng.random() < 0.8 else rng.randint(1, max(total_pages, 1))
+        return 'GET', f'{base_url}/api/logs/?page={page}&page_size=20', {}
+    if scenario == 'logs-cursor':
+        return 'GET', f'{base_url}/api/logs/?cursor=&page_size=20', {}
+    raise ValueError(f'Unknown scenario: {scenario}')
+
+
+def run_scenario(scenario: str, base_url: str, concurrency: int, total_requests: int,
+                 warmup: int, timeout: float) -> dict:
+    """シナリオを指定の同時実行数で実行し、集計結果を返す"""
+    images = ImageFactory()
+    total_pages = 1
+    if scenario == 'logs':
+        response = requests.get(f'{base_url}/api/logs/?page_size=20', timeout=timeout)
+        total_pages = response.json()['data']['pagination']['total_pages']
+
+    remaining = [total_requests]
+    remaining_lock = threading.Lock()
+    latencies_ms = []
+    errors = [0]
+    results_lock = threading.Lock()
+
+    def worker(worker_id: int):
+        rng = random.Random(worker_id)
+        session = requests.Session()
+
+        # 接続確立・サーバー側の初回処理を計測から除外
+        for _ in range(warmup):
+            method, url, kwargs = build_request(scenario, base_url, images, rng, total_pages)
+            session.request(method, url, timeout=timeout, **kwargs)
+
+        while True:
+            with remaining_lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+
+            method, url, kwargs = build_request(scenario, base_url, images, rng, total_pages)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+                ok = response.status_code < 500
+            except requests.RequestException:
+                ok = False
+            latency_ms = (time.perf_counter() - started) * 1000
+
+            with results_lock:
+                if ok:
+                    latencies_ms.append(latency_ms)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies_ms, errors[0], elapsed)
+    result['concurrency'] = concurrency
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    基準値と比較し、シナリオごとの差分を返す
+
+    スループットが tolerance 以上低下、または p95 が tolerance 以上増加した場合は劣化とみなす。
+    """
+    comparisons = []
+    for scenario, result in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(scenario)
+        if not base:
+            continue
+
+        throughput_change = _relative_change(result['throughput_rps'], base['throughput_rps'])
+        p95_change = _relative_change(result['latency_ms']['p95'], base['latency_ms']['p95'])
+        throughput_regressed = throughput_change is not None and throughput_change < -tolerance
+        p95_regressed = p95_change is not None and p95_change > tolerance
+
+        comparisons.append({
+            'scenario': scenario,
+            'throughput_rps': result['throughput_rps'],
+            'baseline_throughput_rps': base['throughput_rps'],
+            'throughput_change': throughput_change,
+            'p95_ms': result['latency_ms']['p95'],
+            'baseline_p95_ms': base['latency_ms']['p95'],
+            'p95_change': p95_change,
+            'regressed': throughput_regressed or p95_regressed,
+        })
+    return comparisons
+
+
+def _relative_change(value, base):
+    if value is None or not base:
+        return None
+    return round((value - base) / base, 4)
+
+
+def _format_change(change) -> str:
+    return 'n/a' if change is None else f'{change:+.1%}'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, storage_root: str):
+    """
+    ローカルストレージ・代替解析バックエンドでサーバーを起動する
+
+    Returns:
+        (サーバーのプロセス, ベースURL)
+    """
+    port = free_port()
+    env = {
+        **os.environ,
+        'IMAGE_STORAGE_BACKEND': 'local',
+        'LOCAL_STORAGE_ROOT': storage_root,
+        'IMAGE_ANALYZER_BACKEND': 'local',
+        'ANALYZER_STANDIN_LATENCY': args.standin_latency,
+        'ANALYZER_STANDIN_LATENCY_MS': str(args.standin_latency_ms),
+        'ANALYZER_STANDIN_ERROR_RATE': str(args.standin_error_rate),
+        'ANALYZER_STANDIN_SEED': '0',
+        # 未設定だと認証情報チェックで失敗するため、ダミーのパスを設定（接続はしない）
+        'GOOGLE_APPLICATION_CREDENTIALS': os.getenv('GOOGLE_APPLICATION_CREDENTIALS', '/dev/null'),
+    }
+
+    if args.server == 'uvicorn':
+        env['ASYNC_VIEWS'] = 'True'
+        command = [
+            sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(args.workers), '--worker-class', 'uvicorn_worker.UvicornWorker',
+            'image_analyzer.asgi:application']
+    else:
+        command = [
+            sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(args.workers), '--threads', str(args.threads),
+            'image_analyzer.wsgi:application']
+
+    process = subprocess.Popen(
+        command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+
+    # 起動完了を待つ
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/api/hello/', timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode}')
+        time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError('Server did not start within 30 seconds')
+
+
+def migrate() -> None:
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput'], cwd=BACKEND_DIR, check=True)
+
+
+def seed_logs(rows: int) -> None:
+    subprocess.run(
+        [sys.executable, 'manage.py', 'seed_analysis_logs', '--rows', str(rows), '--truncate', '--seed', '0'],
+        cwd=BACKEND_DIR, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='計測対象の起動済みサーバー（省略時はローカルサーバーを起動）')
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default='gunicorn',
+                        help='起動するサーバー (gunicorn: WSGI, uvicorn: ASGI + 非同期ビュー)')
+    parser.add_argument('--workers', type=int, default=2, help='サーバーのワーカープロセス数')
+    parser.add_argument('--threads', type=int, default=1, help='gunicornのワーカーあたりのスレッド数')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'実行するシナリオ ({",".join(SCENARIOS)})')
+    parser.add_argument('--concurrency', type=int, default=8, help='同時実行数')
+    parser.add_argument('--requests', type=int, default=500, help='シナリオごとのリクエスト数')
+    parser.add_argument('--warmup', type=int, default=2, help='計測前に各クライアントが送るリクエスト数')
+    parser.add_argument('--timeout', type=float, default=60, help='リクエストのタイムアウト(秒)')
+    parser.add_argument('--seed-rows', type=int, help='計測前にログテーブルをこの件数で作り直す（例: 10000, 1000000）')
+    parser.add_argument('--standin-latency', default='fixed', help='代替解析バックエンドのレイテンシ分布')
+    parser.add_argument('--standin-latency-ms', type=float, default=50, help='代替解析バックエンドのレイテンシ(ms)')
+    parser.add_argument('--standin-error-rate', type=float, default=0.0, help='代替解析バックエンドのエラー率')
+    parser.add_argument('--output', help='結果のJSONファイル（省略時は benchmarks/results/ に保存）')
+    parser.add_argument('--baseline', help='比較する基準値のJSONファイル')
+    parser.add_argument('--save-baseline', action='store_true', help=f'結果を基準値として {DEFAULT_BASELINE.name} に保存する')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='劣化とみなす変化率 (デフォルト: 0.1)')
+    args = parser.parse_args()
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f'Unknown scenario: {scenario}')
+
+    if args.base_url is None:
+        migrate()
+    if args.seed_rows:
+        seed_logs(args.seed_rows)
+
+    results = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'config': {
+            'server': 'external' if args.base_url else args.server,
+            'workers': args.workers,
+            'threads': args.threads,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'seed_rows': args.seed_rows,
+            'standin_latency': args.standin_latency,
+            'standin_latency_ms': args.standin_latency_ms,
+            'standin_error_rate': args.standin_error_rate,
+        },
+        'scenarios': {},
+    }
+
+    with tempfile.TemporaryDirectory() as storage_root:
+        process = None
+        base_url = args.base_url
+        if base_url is None:
+            process, base_url = start_server(args, storage_root)
+
+        try:
+            for scenario in scenarios:
+                result = run_scenario(
+                    scenario, base_url, args.concurrency, args.requests, args.warmup, args.timeout)
+                results['scenarios'][scenario] = result
+                latency = result['latency_ms']
+                print(
+                    f"{scenario:12s} {result['throughput_rps']:>9} req/s  "
+                    f"p50 {latency['p50']}ms  p95 {latency['p95']}ms  p99 {latency['p99']}ms  "
+                    f"errors {result['errors']}")
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results saved to {output}")
+
+    if args.save_baseline:
+        DEFAULT_BASELINE.write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved to {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        comparisons = compare(results, baseline, args.tolerance)
+        regressed = False
+        for comparison in comparisons:
+            regressed = regressed or comparison['regressed']
+            print(
+                f"{comparison['scenario']:12s} throughput {_format_change(comparison['throughput_change'])}  "
+                f"p95 {_format_change(comparison['p95_change'])}  {'REGRESSED' if comparison['regressed'] else 'ok'}")
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
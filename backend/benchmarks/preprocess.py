@@ -0,0 +1,183 @@
+"""
+解析前処理のベンチマーク
+
+画像コーパスに対して preprocess_image_for_analysis を実行し、解析に送信する
+データ量と前処理のCPU時間を計測する（JPEGのdraftモードあり・なしを比較）。
+--analyze を指定すると、設定された解析バックエンドで元画像と前処理済み画像の解析時間も比較する。
+
+使い方（backendディレクトリで実行）:
+    python -m benchmarks.preprocess                      # 合成したサンプル画像で計測
+    python -m benchmarks.preprocess --corpus ~/photos    # 任意の画像ディレクトリで計測
+    python -m benchmarks.preprocess --analyze --json     # 解析時間も計測してJSONで出力
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'image_analyzer.settings')
+django.setup()
+
+from PIL import Image, JpegImagePlugin  # noqa: E402
+
+from api.analyzers import get_analyzer_backend  # noqa: E402
+from api.services import preprocess_image_for_analysis  # noqa: E402
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+# 合成コーパス: (ファイル名, サイズ, 形式, EXIFの向き)
+SYNTHETIC_CORPUS = [
+    ('phone_portrait.jpg', (6000, 4000), 'JPEG', 6),
+    ('phone_landscape.jpg', (4032, 3024), 'JPEG', 1),
+    ('camera_large.jpg', (7952, 5304), 'JPEG', 1),
+    ('screenshot.png', (2560, 1440), 'PNG', None),
+    ('transparent.png', (2048, 1536), 'PNG', None),
+    ('web.webp', (3000, 2000), 'WEBP', None),
+    ('small.jpg', (800, 600), 'JPEG', 1),
+]
+
+
+def build_synthetic_corpus(directory: Path) -> list:
+    """写真に近い圧縮率になるよう、グラデーションとノイズを重ねた画像を生成する"""
+    paths = []
+    for name, size, image_format, orientation in SYNTHETIC_CORPUS:
+        gradient = Image.linear_gradient('L').resize(size).convert('RGB')
+        noise = Image.effect_noise(size, 24).convert('RGB')
+        image = Image.blend(gradient, noise, 0.35)
+
+        if name == 'transparent.png':
+            image.putalpha(Image.linear_gradient('L').resize(size))
+
+        path = directory / name
+        save_options = {}
+        if image_format == 'JPEG':
+            save_options['quality'] = 92
+            if orientation:
+                exif = Image.Exif()
+                exif[0x0112] = orientation
+                save_options['exif'] = exif
+        image.save(path, format=image_format, **save_options)
+        paths.append(path)
+    return paths
+
+
+@contextmanager
+def jpeg_draft_disabled():
+    """比較用にJPEGのdraftモードを無効化する"""
+    original_draft = JpegImagePlugin.JpegImageFile.draft
+    JpegImagePlugin.JpegImageFile.draft = lambda self, mode, size: None
+    try:
+        yield
+    finally:
+        JpegImagePlugin.JpegImageFile.draft = original_draft
+
+
+def time_preprocess(content: bytes, repeat: int):
+    """前処理を repeat 回実行し、(結果, 所要時間の中央値ms) を返す"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = preprocess_image_for_analysis(io.BytesIO(content))
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(timings)
+
+
+def time_analyze(analyzer, content: bytes, repeat: int) -> float:
+    """解析バックエンドに画像データを送信し、所要時間の中央値(ms)を返す"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        analyzer.analyze_content(content)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def run(paths: list, repeat: int, analyze: bool) -> dict:
+    analyzer = get_analyzer_backend() if analyze else None
+    rows = []
+
+    for path in paths:
+        content = path.read_bytes()
+        result, preprocess_ms = time_preprocess(content, repeat)
+        if result is None:
+            print(f"skip: {path.name} (not an image)")
+            continue
+        with jpeg_draft_disabled():
+            _, preprocess_no_draft_ms = time_preprocess(content, repeat)
+
+        row = {
+            'file': path.name,
+            'original_size': f"{result['original_width']}x{result['original_height']}",
+            'sent_size': f"{result['width']}x{result['height']}",
+            'original_bytes': result['original_bytes'],
+            'sent_bytes': len(result['content']),
+            'preprocess_ms': round(preprocess_ms, 1),
+            'preprocess_no_draft_ms': round(preprocess_no_draft_ms, 1),
+        }
+        if analyzer is not None:
+            row['analyze_original_ms'] = round(time_analyze(analyzer, content, repeat), 1)
+            row['analyze_preprocessed_ms'] = round(time_analyze(analyzer, result['content'], repeat), 1)
+        rows.append(row)
+
+    original_bytes = sum(row['original_bytes'] for row in rows)
+    sent_bytes = sum(row['sent_bytes'] for row in rows)
+    summary = {
+        'images': len(rows),
+        'original_bytes': original_bytes,
+        'sent_bytes': sent_bytes,
+        'bytes_reduction': round(1 - sent_bytes / original_bytes, 4) if original_bytes else None,
+        'preprocess_ms_total': round(sum(row['preprocess_ms'] for row in rows), 1),
+        'preprocess_no_draft_ms_total': round(sum(row['preprocess_no_draft_ms'] for row in rows), 1),
+    }
+    if analyzer is not None:
+        summary['analyze_original_ms_total'] = round(sum(row['analyze_original_ms'] for row in rows), 1)
+        summary['analyze_preprocessed_ms_total'] = round(
+            sum(row['analyze_preprocessed_ms'] for row in rows), 1)
+
+    return {'rows': rows, 'summary': summary}
+
+
+def print_table(report: dict) -> None:
+    columns = list(report['rows'][0].keys()) if report['rows'] else []
+    print('\t'.join(columns))
+    for row in report['rows']:
+        print('\t'.join(str(row[column]) for column in columns))
+    print()
+    for key, value in report['summary'].items():
+        print(f"{key}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='画像ディレクトリ（省略時は合成したサンプル画像）')
+    parser.add_argument('--repeat', type=int, default=3, help='1画像あたりの計測回数（中央値を採用）')
+    parser.add_argument('--analyze', action='store_true', help='解析バックエンドでの解析時間も計測する')
+    parser.add_argument('--json', action='store_true', help='結果をJSONで出力する')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.corpus:
+            paths = sorted(
+                path for path in Path(args.corpus).expanduser().iterdir()
+                if path.suffix.lower() in IMAGE_SUFFIXES)
+        else:
+            paths = build_synthetic_corpus(Path(temp_dir))
+
+        report = run(paths, args.repeat, args.analyze)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+gunicorn設定（backendディレクトリで起動すると自動で読み込まれる）
+"""
+import os
+import shutil
+import tempfile
+
+# Prometheusのメトリクスをワーカー間で合算するための共有ディレクトリ
+# （prometheus_client の読み込み前に設定する必要があるため、設定ファイルの読み込み時に決める）
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'image_analyzer_prometheus'))
+
+
+def on_starting(server):
+    """前回起動時のメトリクスが合算されないよう、共有ディレクトリを空にする"""
+    multiproc_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """終了したワーカーの処理中リクエスト数（livesum）を集計対象から外す"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    """
+    ワーカー起動時に先の月のパーティション、プロセス内キャッシュとクライアント、集計の反映スレッドを準備する
+
+    post_forkの時点ではDjango設定（Railwayの認証情報ファイル作成を含む）が
+    未読み込みのため、アプリケーション読み込み後のこのフックで行う。
+    """
+    from api.clients import cloud_clients
+    from api.label_cache import warm_label_cache
+    from api.partitions import ensure_upcoming_partitions
+    from api.rollups import start_hourly_rollup_flusher
+
+    # リクエストのない間も集計への加算を反映する
+    start_hourly_rollup_flusher()
+
+    try:
+        # defaultパーティションがないため、先の月のパーティションがないと解析ログを登録できない
+        for name in ensure_upcoming_partitions():
+            worker.log.info(f"Created partition {name}")
+    except Exception as e:
+        # 他のワーカーが同時に作成した場合など（archive_analysis_logs コマンドでも作成する）
+        worker.log.warning(f"Partition creation failed: {e}")
+
+    try:
+        warm_label_cache()
+    except Exception as e:
+        # DB未準備でも起動は継続（初回アクセス時に再読み込み）
+        worker.log.warning(f"Label cache warm-up failed: {e}")
+
+    try:
+        if cloud_clients.warm_up():
+            worker.log.info("Google Cloud clients warmed up")
+    except Exception as e:
+        # 初回リクエスト時に再度生成を試みる
+        worker.log.warning(f"Google Cloud client warm-up failed: {e}")
+
+
+def worker_exit(server, worker):
+    """ワーカーの終了時に、バッファに溜まっている解析ログと集計への加算を書き込む"""
+    from api.log_writer import close_analysis_log_writer
+    from api.rollups import close_hourly_rollups
+
+    close_analysis_log_writer()
+    close_hourly_rollups()
@@ -66,6 +66,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.metrics_middleware',  # 全体の処理時間を計測するため先頭に置く
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -99,13 +100,17 @@ WSGI_APPLICATION = "image_analyzer.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# 非同期ビュー設定（ASGIサーバー(uvicorn)で起動する場合に有効化）
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+
 # Railway環境またはDATABASE_URLが設定されている場合
 if 'DATABASE_URL' in os.environ:
     import dj_database_url
     DATABASES = {
         'default': dj_database_url.parse(
             os.environ.get('DATABASE_URL'),
-            conn_max_age=600,
+            # ASGIではリクエストごとにDBアクセス用のスレッドが変わるため永続接続を使わない
+            conn_max_age=0 if ASYNC_VIEWS else 600,
             conn_health_checks=True,
         )
     }
@@ -169,9 +174,40 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # Railway対応
 if 'RAILWAY_ENVIRONMENT' in os.environ:
     # Railway環境では静的ファイルをWhitenoiseで配信
-    MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+    MIDDLEWARE.insert(2, 'whitenoise.middleware.WhiteNoiseMiddleware')
     STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# ログ設定（LOG_LEVEL: DEBUG/INFO/WARNING/ERROR, LOG_FORMAT: json/text）
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text' if DEBUG else 'json')  # 本番環境では集計しやすいJSON
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'api.log_formatters.JsonFormatter',
+        },
+        'text': {
+            '()': 'api.log_formatters.TextFormatter',
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': LOG_FORMAT,
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -202,7 +238,14 @@ if not DEBUG and not GOOGLE_APPLICATION_CREDENTIALS:
     raise ValueError(
         "GOOGLE_APPLICATION_CREDENTIALS must be set in production")
 
-if not DEBUG and not GCS_BUCKET_NAME:
+# 画像ストレージ設定 (gcs: Google Cloud Storage, local: ローカルファイルシステム)
+IMAGE_STORAGE_BACKEND = os.getenv('IMAGE_STORAGE_BACKEND', 'gcs')
+LOCAL_STORAGE_ROOT = os.getenv(
+    'LOCAL_STORAGE_ROOT', os.path.join(BASE_DIR, 'media'))
+LOCAL_STORAGE_BASE_URL = os.getenv(
+    'LOCAL_STORAGE_BASE_URL', 'http://localhost:8000/api/media/')  # ローカル保存時の公開URLのプレフィックス
+
+if not DEBUG and IMAGE_STORAGE_BACKEND == 'gcs' and not GCS_BUCKET_NAME:
     raise ValueError("GCS_BUCKET_NAME must be set in production")
 
 # CORS設定
@@ -245,3 +288,124 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
     ],
 }
+
+# 解析結果キャッシュ設定（同一画像のSHA-256で再利用、0で無効）
+ANALYSIS_CACHE_TTL_SECONDS = int(
+    os.getenv('ANALYSIS_CACHE_TTL_SECONDS', str(7 * 24 * 60 * 60)))  # 7日
+
+# 類似画像の解析結果の再利用（縮小・再圧縮された同じ画像を知覚ハッシュで判定し、Vision APIを呼び出さない）
+NEAR_DUPLICATE_DETECTION = os.getenv('NEAR_DUPLICATE_DETECTION', 'True').lower() == 'true'
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', '6'))  # 類似とみなすハミング距離の上限（64bit中）
+NEAR_DUPLICATE_MAX_DISTANCE_LIMIT = 11  # リクエストの near_duplicate_threshold で指定できる上限（12以上は索引で引く範囲が急増する）
+NEAR_DUPLICATE_MAX_CANDIDATES = 10  # 1回の検索でDBに確認する候補数の上限
+NEAR_DUPLICATE_INDEX_REFRESH_SECONDS = int(os.getenv('NEAR_DUPLICATE_INDEX_REFRESH_SECONDS', '10'))  # 他プロセスの登録を索引に読み込む間隔
+NEAR_DUPLICATE_INDEX_REBUILD_SECONDS = int(os.getenv('NEAR_DUPLICATE_INDEX_REBUILD_SECONDS', '3600'))  # 有効期限切れを除いて索引を作り直す間隔
+
+# ラベルキャッシュ設定（ワーカープロセスごとに保持するラベル数の上限）
+LABEL_CACHE_MAX_SIZE = int(os.getenv('LABEL_CACHE_MAX_SIZE', '1000'))
+LABEL_CACHE_MISS_TTL_SECONDS = int(os.getenv('LABEL_CACHE_MISS_TTL_SECONDS', '60'))  # 未登録のIDを問い合わせずに済ませる秒数
+
+# 一括解析設定
+BATCH_ANALYZE_MAX_FILES = int(os.getenv('BATCH_ANALYZE_MAX_FILES', '50'))  # 1リクエストあたりの最大ファイル数
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv('BATCH_UPLOAD_CONCURRENCY', '8'))  # ストレージへの並行アップロード数
+VISION_BATCH_MAX_IMAGES = 16  # Vision API batch_annotate_images の1リクエストあたりの上限
+
+# 非同期解析ジョブ設定
+# 画像の一時保存先（IMAGE_STORAGE_BACKEND の保存先でのパスのプレフィックス。Webとワーカーで共有する）
+ANALYSIS_JOB_SPOOL_PREFIX = os.getenv('ANALYSIS_JOB_SPOOL_PREFIX', 'job_spool/')
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_JOB_MAX_ATTEMPTS', '3'))
+ANALYSIS_JOB_STALE_SECONDS = int(os.getenv('ANALYSIS_JOB_STALE_SECONDS', '300'))  # 処理中のまま放置されたジョブを再投入するまでの秒数
+
+# ログ一覧用サムネイル設定（run_analysis_worker のワーカーが生成し、ストレージバックエンドへ保存）
+# ワーカーを起動しない環境では False にする（Procfile・railway.json ではWebと共にワーカーを起動する）
+THUMBNAILS = os.getenv('THUMBNAILS', 'True').lower() == 'true'
+THUMBNAIL_SIZES = [int(size) for size in os.getenv('THUMBNAIL_SIZES', '128,512').split(',')]  # 長辺のピクセル数
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'WEBP')  # WEBP/JPEG
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', '80'))
+THUMBNAIL_PREFIX = os.getenv('THUMBNAIL_PREFIX', 'thumbnails/')  # 保存先のパスのプレフィックス（サイズごとのディレクトリに保存）
+THUMBNAIL_MAX_ATTEMPTS = 3
+
+# ストリーミングアップロード設定（/api/analyze/ の画像をメモリに溜めずストレージへ直接送る）
+STREAMING_UPLOADS = os.getenv('STREAMING_UPLOADS', 'False').lower() == 'true'
+STREAMING_UPLOAD_CHUNK_SIZE = 4 * 256 * 1024  # ストレージへの送信単位（GCSの場合は256KiBの倍数）
+STREAMING_UPLOAD_SNIFF_BYTES = 1024 * 1024  # 画像形式の判定に使う先頭バイトの上限
+
+# 画像解析バックエンド設定 (vision: Google Cloud Vision API, local: ローカルの代替実装)
+IMAGE_ANALYZER_BACKEND = os.getenv('IMAGE_ANALYZER_BACKEND', 'vision')
+
+# ローカル代替実装の設定（/api/analyze-mock/ は常にこちらを使用）
+ANALYZER_STANDIN_LATENCY = os.getenv('ANALYZER_STANDIN_LATENCY', 'uniform')  # fixed/uniform/normal/longtail
+ANALYZER_STANDIN_LATENCY_MS = float(os.getenv('ANALYZER_STANDIN_LATENCY_MS', '750'))  # 平均（longtailは中央値）
+ANALYZER_STANDIN_LATENCY_SPREAD_MS = float(os.getenv('ANALYZER_STANDIN_LATENCY_SPREAD_MS', '450'))  # uniformの幅・normalの標準偏差
+ANALYZER_STANDIN_LATENCY_SIGMA = float(os.getenv('ANALYZER_STANDIN_LATENCY_SIGMA', '0.6'))  # longtailの対数標準偏差
+ANALYZER_STANDIN_ERROR_RATE = float(os.getenv('ANALYZER_STANDIN_ERROR_RATE', '0.1'))
+ANALYZER_STANDIN_CLASSES = int(os.getenv('ANALYZER_STANDIN_CLASSES', '5'))
+ANALYZER_STANDIN_SEED = int(os.getenv('ANALYZER_STANDIN_SEED')) if os.getenv('ANALYZER_STANDIN_SEED') else None
+# 障害注入（unavailable: 503エラー, deadline: 応答せず期限切れ）と発生させる呼び出しの割合
+ANALYZER_STANDIN_FAULT = os.getenv('ANALYZER_STANDIN_FAULT', 'unavailable')
+ANALYZER_STANDIN_FAULT_RATE = float(os.getenv('ANALYZER_STANDIN_FAULT_RATE', '0'))
+
+# 解析バックエンド呼び出しの障害対策（api/analyzers.py の ResilientAnalyzer）
+# 1回の呼び出しの期限と、再試行の待機を含む全体の期限（gunicornの --timeout より短くする）
+ANALYZER_CALL_TIMEOUT_SECONDS = float(os.getenv('ANALYZER_CALL_TIMEOUT_SECONDS', '8'))
+ANALYZER_TOTAL_TIMEOUT_SECONDS = float(os.getenv('ANALYZER_TOTAL_TIMEOUT_SECONDS', '20'))
+# 再試行可能なエラー（503・期限切れなど）の試行回数と指数バックオフの待機時間（full jitter）
+ANALYZER_MAX_ATTEMPTS = int(os.getenv('ANALYZER_MAX_ATTEMPTS', '3'))
+ANALYZER_RETRY_BASE_DELAY_MS = float(os.getenv('ANALYZER_RETRY_BASE_DELAY_MS', '200'))
+ANALYZER_RETRY_MAX_DELAY_MS = float(os.getenv('ANALYZER_RETRY_MAX_DELAY_MS', '2000'))
+# ワーカープロセスごとの同時実行数の上限（0: 上限なし）と空きを待つ時間
+ANALYZER_MAX_CONCURRENCY = int(os.getenv('ANALYZER_MAX_CONCURRENCY', '16'))
+ANALYZER_CONCURRENCY_WAIT_SECONDS = float(os.getenv('ANALYZER_CONCURRENCY_WAIT_SECONDS', '5'))
+# サーキットブレーカー: 直近 WINDOW 回（MIN_CALLS 回以上）の失敗率が FAILURE_RATE 以上で OPEN_SECONDS の間遮断する
+ANALYZER_CIRCUIT_BREAKER = os.getenv('ANALYZER_CIRCUIT_BREAKER', 'True').lower() == 'true'
+ANALYZER_CIRCUIT_FAILURE_RATE = float(os.getenv('ANALYZER_CIRCUIT_FAILURE_RATE', '0.5'))
+ANALYZER_CIRCUIT_WINDOW = int(os.getenv('ANALYZER_CIRCUIT_WINDOW', '20'))
+ANALYZER_CIRCUIT_MIN_CALLS = int(os.getenv('ANALYZER_CIRCUIT_MIN_CALLS', '10'))
+ANALYZER_CIRCUIT_OPEN_SECONDS = float(os.getenv('ANALYZER_CIRCUIT_OPEN_SECONDS', '30'))
+# ヘッジリクエスト: 応答がこの時間を超えたら同じ呼び出しをもう1件送る（0: 無効）
+ANALYZER_HEDGE_DELAY_MS = float(os.getenv('ANALYZER_HEDGE_DELAY_MS', '0'))
+
+# 並行モード: ストレージへのアップロードと解析（画像データを直接送信）を同時に実行する
+# （ストリーミングアップロードではリクエスト受信中にアップロードが完了するため対象外）
+PARALLEL_UPLOAD_ANALYSIS = os.getenv('PARALLEL_UPLOAD_ANALYSIS', 'False').lower() == 'true'
+
+# 解析前処理（EXIFの向き適用・縮小・再エンコードした画像を解析に送信し、ストレージには元画像を保存）
+ANALYSIS_PREPROCESS = os.getenv('ANALYSIS_PREPROCESS', 'True').lower() == 'true'
+ANALYSIS_PREPROCESS_MAX_EDGE = int(os.getenv('ANALYSIS_PREPROCESS_MAX_EDGE', '1024'))  # 長辺の最大ピクセル数
+ANALYSIS_PREPROCESS_FORMAT = os.getenv('ANALYSIS_PREPROCESS_FORMAT', 'JPEG')  # JPEG/WEBP
+ANALYSIS_PREPROCESS_QUALITY = int(os.getenv('ANALYSIS_PREPROCESS_QUALITY', '85'))
+
+# 解析ログの集計設定（incremental: ログ登録ごとに加算, compaction: compact_analysis_rollups コマンドで定期的に再集計）
+ANALYSIS_ROLLUP_MODE = os.getenv('ANALYSIS_ROLLUP_MODE', 'incremental')
+# incrementalモードで1件ずつ登録したログの加算をまとめて反映する間隔（compact_analysis_rollups の --grace-minutes より十分短くする）
+ANALYSIS_ROLLUP_FLUSH_INTERVAL_MS = int(os.getenv('ANALYSIS_ROLLUP_FLUSH_INTERVAL_MS', '1000'))
+
+# 解析ログの書き込み設定（sync: リクエストごとにINSERT, buffered: IDを予約して即座に返し、まとめてbulk_create。PostgreSQLのみ）
+ANALYSIS_LOG_WRITE_MODE = os.getenv('ANALYSIS_LOG_WRITE_MODE', 'sync')
+ANALYSIS_LOG_BUFFER_SIZE = int(os.getenv('ANALYSIS_LOG_BUFFER_SIZE', '100'))  # この件数が溜まったら書き込む
+ANALYSIS_LOG_FLUSH_INTERVAL_MS = int(os.getenv('ANALYSIS_LOG_FLUSH_INTERVAL_MS', '500'))  # 書き込み間隔の上限
+ANALYSIS_LOG_FLUSH_MAX_ATTEMPTS = 3  # まとめての書き込みが続けて失敗した場合、この回数目で1行ずつ書き込む（失敗した行は破棄）
+
+# キャッシュ設定（デフォルトはプロセスごとのローカルメモリ。複数プロセスで共有する場合は
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://... 等を指定）
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# ログ一覧APIのレスポンスキャッシュ・条件付きGET（ETag / Last-Modified）
+ANALYSIS_LOGS_CACHE = os.getenv('ANALYSIS_LOGS_CACHE', 'True').lower() == 'true'
+ANALYSIS_LOGS_CACHE_TTL_SECONDS = int(os.getenv('ANALYSIS_LOGS_CACHE_TTL_SECONDS', '300'))  # レスポンスの保持期間
+ANALYSIS_LOGS_CACHE_VERSION_TTL_SECONDS = int(os.getenv('ANALYSIS_LOGS_CACHE_VERSION_TTL_SECONDS', '2'))  # 最新ログの確認間隔（他プロセスの登録が反映されるまでの最大秒数）
+
+# 解析ログの保持・アーカイブ設定（archive_analysis_logs コマンドで保持期間を過ぎた月を保存先へ書き出して削除）
+ANALYSIS_LOG_RETENTION_DAYS = int(os.getenv('ANALYSIS_LOG_RETENTION_DAYS', '180'))
+ANALYSIS_LOG_ARCHIVE_PREFIX = os.getenv('ANALYSIS_LOG_ARCHIVE_PREFIX', 'ai_analysis_log/')  # 保存先のパスのプレフィックス
+# アーカイブの保存先（画像の公開用の保存先とは分ける。gcs: 非公開のバケット, local: 配信しないディレクトリ）
+ANALYSIS_LOG_ARCHIVE_STORAGE_BACKEND = os.getenv('ANALYSIS_LOG_ARCHIVE_STORAGE_BACKEND', IMAGE_STORAGE_BACKEND)
+ANALYSIS_LOG_ARCHIVE_GCS_BUCKET_NAME = os.getenv('ANALYSIS_LOG_ARCHIVE_GCS_BUCKET_NAME')
+ANALYSIS_LOG_ARCHIVE_LOCAL_ROOT = os.getenv(
+    'ANALYSIS_LOG_ARCHIVE_LOCAL_ROOT', os.path.join(BASE_DIR, 'archives'))
+ANALYSIS_LOG_PARTITION_MONTHS_AHEAD = int(os.getenv('ANALYSIS_LOG_PARTITION_MONTHS_AHEAD', '3'))  # 事前に作成するパーティションの月数（PostgreSQLのみ。範囲外の月の登録は失敗する）
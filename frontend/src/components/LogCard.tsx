@@ -18,8 +18,9 @@ export function LogCard({ log, onClassificationClick, disabled = false }: LogCar
             }`}>
             {/* 画像プレビュー部分 */}
             <div className="w-full mb-4">
+                {/* サムネイル生成前は元画像を表示 */}
                 <ImagePreview
-                    imagePath={log.image_path}
+                    imagePath={log.thumbnails?.['512'] ?? log.image_path}
                     alt="解析画像"
                     size="md"
                 />
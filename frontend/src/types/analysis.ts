@@ -1,6 +1,7 @@
 export type AnalysisLog = {
     id: number;
     image_path: string;
+    thumbnails?: Record<string, string> | null;
     success: boolean;
     classification: number | null;
     classification_name?: string | null;